@@ -0,0 +1,108 @@
+""" import time benchmark of meta_analysis
+
+Every import is timed in a fresh python process, so nothing is cached in
+sys.modules. Heavy dependencies loaded by the import are reported too,
+pure numeric modules should not load any of them.
+
+Usage:
+    python benchmark/bench_import.py --repeat 5 --output import.json
+
+Function:
+    time_import(statement, repeat): import time and heavy modules of statement
+    run(args): time every statement, return report
+    main(argv): command line entry
+
+Author: Kang Xiaopeng
+Data: 2026/10/17
+E-mail: kangxiaopeng2018@ia.ac.cn
+
+This file is part of meta_analysis.
+
+meta_analysis is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+meta_analysis is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with meta_analysis.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ('pandas', 'nibabel', 'matplotlib', 'matplotlib.pyplot',
+                 'scipy', 'scipy.stats')
+
+STATEMENTS = {
+    'numpy': 'import numpy',
+    'meta_analysis.engine': 'from meta_analysis import engine',
+    'meta_analysis.main': 'from meta_analysis import main',
+    'meta_analysis.plot': 'from meta_analysis import plot',
+    # what every import of main cost when dependencies were imported eagerly
+    'eager_dependencies': 'from meta_analysis import main; import pandas, nibabel, '
+                          'scipy.stats, matplotlib.pyplot',
+}
+
+_SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'time': elapsed,
+                  'modules': [m for m in {heavy!r} if m in sys.modules]}}))
+'''
+
+def time_import(statement, repeat=5):
+    """ time statement in fresh processes
+    Return:
+        report: dict, {'times', 'min', 'median', 'modules'}, modules are heavy
+                modules loaded by statement
+    """
+    script = _SCRIPT.format(statement=statement, heavy=HEAVY_MODULES)
+    env = dict(os.environ, MPLBACKEND='Agg')
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [ROOT, env.get('PYTHONPATH')]))
+    times = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', script], env=env, check=True,
+                                capture_output=True, text=True).stdout
+        record = json.loads(output.strip().splitlines()[-1])
+        times.append(record['time'])
+    return {'times': times, 'min': min(times), 'median': statistics.median(times),
+            'modules': record['modules']}
+
+def run(args):
+    results = {}
+    for name in args.only or STATEMENTS:
+        results[name] = time_import(STATEMENTS[name], args.repeat)
+        print('{:<24}min {:7.3f}s  median {:7.3f}s  loads {}'.format(
+              name, results[name]['min'], results[name]['median'],
+              ', '.join(results[name]['modules']) or '-'))
+    return {'python': sys.version.split()[0], 'repeat': args.repeat, 'results': results}
+
+def get_parser():
+    parser = argparse.ArgumentParser(description='Benchmark import time of meta_analysis')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--only', nargs='+', choices=list(STATEMENTS))
+    parser.add_argument('--output', default=None, help='JSON filepath of report')
+    return parser
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+    report = run(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+if __name__ == '__main__':
+    main()
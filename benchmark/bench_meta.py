@@ -0,0 +1,162 @@
+""" benchmarks of meta_analysis on a synthetic cohort
+
+Every benchmark is timed over some repeats, then run once more under
+tracemalloc to record peak memory allocated by python and numpy. Results
+are printed and saved as JSON, so runs of different releases could be
+compared.
+
+Usage:
+    python benchmark/bench_meta.py --centers 4 --subjects 20 --shape 40 48 40 \
+        --density .35 --extension .nii.gz --repeat 3 --output bench.json
+
+Function:
+    measure(func, repeat): time and peak memory of func()
+    get_benchmarks(cohort, work_dir): benchmark functions on a cohort
+    run(args): generate cohort, run benchmarks, return report
+    main(argv): command line entry
+
+Author: Kang Xiaopeng
+Data: 2026/10/17
+E-mail: kangxiaopeng2018@ia.ac.cn
+
+This file is part of meta_analysis.
+
+meta_analysis is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+meta_analysis is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with meta_analysis.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# plots are saved, never shown
+os.environ.setdefault('MPLBACKEND', 'Agg')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import nibabel as nib
+import numpy as np
+
+from meta_analysis import main as meta_main
+from meta_analysis import mask
+import synthetic
+
+BENCHMARK_NAMES = ('gen_msn_dict', 'voxelwise_meta_analysis',
+                   'region_volume_meta_analysis', 'csv_meta_analysis', 'plot_forest')
+
+def measure(func, repeat=3):
+    """ time and peak memory of func()
+    Args:
+        func: function without args
+        repeat: int, count of timed runs
+    Return:
+        report: dict, {'times', 'min', 'median', 'peak_memory'}, seconds and bytes
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    # tracing slows python code, so memory is measured in a separate run
+    tracemalloc.start()
+    try:
+        func()
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'times': times, 'min': min(times), 'median': statistics.median(times),
+            'peak_memory': peak_memory}
+
+def get_benchmarks(cohort, work_dir):
+    """ benchmark functions on a cohort generated by synthetic.gen_cohort()
+    Return:
+        benchmarks: dict, {name: function without args}
+    """
+    center_dict = cohort['center_dict']
+    label1, label2 = synthetic.LABELS
+    _mask = mask.Mask(np.asarray(nib.load(cohort['mask']).dataobj))
+    atlas = mask.Mask(np.asarray(nib.load(cohort['atlas']).dataobj))
+    plot_model = meta_main.csv_meta_analysis(cohort['csv'])
+    plot_path = os.path.join(work_dir, 'forest.png')
+
+    def plot_forest():
+        import matplotlib.pyplot as plt
+        plot_model.plot_forest(save_path=plot_path, show=False)
+        plt.close('all')
+
+    return {
+        'gen_msn_dict': lambda: meta_main.gen_msn_dict(center_dict, _mask=_mask),
+        'voxelwise_meta_analysis': lambda: meta_main.voxelwise_meta_analysis(
+                                        label1, label2, center_dict=center_dict, _mask=_mask),
+        'region_volume_meta_analysis': lambda: meta_main.region_volume_meta_analysis(
+                                        center_dict, label1, label2, atlas),
+        'csv_meta_analysis': lambda: meta_main.csv_meta_analysis(cohort['csv']),
+        'plot_forest': plot_forest,
+    }
+
+def run(args):
+    """ generate cohort, run benchmarks
+    Return:
+        report: dict, config, environment and results of every benchmark
+    """
+    config = {'centers': args.centers, 'subjects': args.subjects,
+              'shape': list(args.shape), 'density': args.density,
+              'regions': args.regions, 'extension': args.extension,
+              'repeat': args.repeat, 'seed': args.seed}
+    environment = {'python': platform.python_version(), 'platform': platform.platform(),
+                   'numpy': np.__version__, 'nibabel': nib.__version__}
+    with tempfile.TemporaryDirectory(prefix='meta_bench_', dir=args.work_dir) as work_dir:
+        start = time.perf_counter()
+        cohort = synthetic.gen_cohort(work_dir, args.centers, args.subjects,
+                                      tuple(args.shape), args.density, args.regions,
+                                      args.extension, seed=args.seed)
+        config['generate_time'] = time.perf_counter() - start
+        benchmarks = get_benchmarks(cohort, work_dir)
+        results = {}
+        for name in args.only or BENCHMARK_NAMES:
+            results[name] = measure(benchmarks[name], args.repeat)
+            print('{:<30}min {:8.3f}s  median {:8.3f}s  peak {:8.1f}MB'.format(
+                  name, results[name]['min'], results[name]['median'],
+                  results[name]['peak_memory'] / 2**20))
+    return {'config': config, 'environment': environment, 'results': results}
+
+def get_parser():
+    parser = argparse.ArgumentParser(description='Benchmark meta_analysis on a synthetic cohort')
+    parser.add_argument('--centers', type=int, default=4)
+    parser.add_argument('--subjects', type=int, default=20, help='subjects of every group')
+    parser.add_argument('--shape', type=int, nargs=3, default=(40, 48, 40))
+    parser.add_argument('--density', type=float, default=.35, help='fraction of volume in mask')
+    parser.add_argument('--regions', type=int, default=50, help='regions of atlas')
+    parser.add_argument('--extension', default='.nii', choices=('.nii', '.nii.gz'))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--only', nargs='+', choices=BENCHMARK_NAMES)
+    parser.add_argument('--work-dir', default=None, help='where to write the cohort')
+    parser.add_argument('--output', default=None, help='JSON filepath of report')
+    return parser
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+    report = run(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+if __name__ == '__main__':
+    main()
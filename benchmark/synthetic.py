@@ -0,0 +1,111 @@
+""" synthetic multi-center cohort, used by benchmarks
+
+Every center has two groups of subjects' nii, group 1 has a small effect
+inside mask, centers have their own offset. Same seed always generates
+same files.
+
+Function:
+    gen_mask(shape, density, rng): random binary mask of given density
+    gen_atlas(mask_data, n_regions, rng): random region labels inside mask
+    gen_cohort(output_dir, ...): write cohort's nii, mask, atlas and csv
+
+Author: Kang Xiaopeng
+Data: 2026/10/17
+E-mail: kangxiaopeng2018@ia.ac.cn
+
+This file is part of meta_analysis.
+
+meta_analysis is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+meta_analysis is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with meta_analysis.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import os
+
+import nibabel as nib
+import numpy as np
+import pandas as pd
+
+LABELS = (1, 3)
+
+def gen_mask(shape, density, rng):
+    """ random binary mask, voxels nearer to center are kept first,
+        so mask is one blob covering 'density' of volume
+    """
+    grids = np.meshgrid(*[np.linspace(-1, 1, n) for n in shape], indexing='ij')
+    distance = np.sqrt(sum(np.square(grid) for grid in grids))
+    distance += rng.uniform(0, .05, shape)
+    threshold = np.quantile(distance, density)
+    return (distance <= threshold).astype(np.int8)
+
+def gen_atlas(mask_data, n_regions, rng):
+    """ random region labels 1..n_regions inside mask, 0 outside
+    """
+    atlas = np.zeros(mask_data.shape, dtype=np.int16)
+    atlas[mask_data != 0] = rng.integers(1, n_regions + 1, np.count_nonzero(mask_data))
+    return atlas
+
+def gen_cohort(output_dir, n_centers=4, n_subjects=20, shape=(40, 48, 40),
+               density=.35, n_regions=50, extension='.nii', effect=.3, seed=0):
+    """ write a synthetic cohort
+    Args:
+        output_dir: str, directory to write files
+        n_centers: int, count of centers
+        n_subjects: int, count of subjects of every group
+        shape: tuple, shape of volume
+        density: float, fraction of volume inside mask
+        n_regions: int, count of regions in atlas
+        extension: '.nii' or '.nii.gz'
+        effect: float, group 1's effect inside mask
+        seed: random seed
+    Return:
+        cohort: dict, {'center_dict': {center:{label:[filepathes]}},
+                       'mask': mask filepath, 'atlas': atlas filepath,
+                       'csv': filepath of centers' mean, std, count of mean volume}
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    affine = np.diag([2., 2., 2., 1.])
+    mask_data = gen_mask(shape, density, rng)
+    atlas = gen_atlas(mask_data, n_regions, rng)
+    mask_path = os.path.join(output_dir, 'mask' + extension)
+    atlas_path = os.path.join(output_dir, 'atlas' + extension)
+    nib.save(nib.Nifti1Image(mask_data, affine), mask_path)
+    nib.save(nib.Nifti1Image(atlas, affine), atlas_path)
+
+    center_dict = {}
+    rows = []
+    for center in range(n_centers):
+        center_name = 'center{}'.format(center)
+        center_dir = os.path.join(output_dir, center_name)
+        os.makedirs(center_dir, exist_ok=True)
+        offset = rng.normal(0, .2)
+        center_dict[center_name] = {}
+        row = [center_name]
+        for label in LABELS:
+            pathes = []
+            volumes = []
+            for subject in range(n_subjects):
+                array = rng.normal(1 + offset, 1, shape).astype(np.float32)
+                if label == LABELS[0]:
+                    array[mask_data != 0] += effect
+                path = os.path.join(center_dir, '{}_{}{}'.format(label, subject, extension))
+                nib.save(nib.Nifti1Image(array, affine), path)
+                pathes.append(path)
+                volumes.append(array[mask_data != 0].mean())
+            center_dict[center_name][label] = pathes
+            row += [np.mean(volumes), np.std(volumes), n_subjects]
+        rows.append(row)
+    csv_path = os.path.join(output_dir, 'centers.csv')
+    pd.DataFrame(rows, columns=['center_name', 'm1', 's1', 'n1', 'm2', 's2', 'n2']
+                 ).to_csv(csv_path, index=False)
+    return {'center_dict': center_dict, 'mask': mask_path,
+            'atlas': atlas_path, 'csv': csv_path}
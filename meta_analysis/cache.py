@@ -0,0 +1,139 @@
+""" cache module, persistent on-disk cache of groups' mean, std, count
+
+Every entry is a .npz file named by a key caculated from content of
+group's files (path, size, mtime or hash), dtype and mask, so repeat
+analyses on same cohort skip loading nii. Entries are evicted in least
+recently used order once total size exceeds max_size.
+
+Class:
+    SummaryCache(object): content addressed cache of mean, std, count
+
+Author: Kang Xiaopeng
+Data: 2026/10/17
+E-mail: kangxiaopeng2018@ia.ac.cn
+
+This file is part of meta_analysis.
+
+meta_analysis is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+meta_analysis is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with meta_analysis.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import hashlib
+import os
+import time
+
+import numpy as np
+
+class SummaryCache(object):
+    """ content addressed cache of groups' mean, std, count
+
+    Attributes:
+        cache_dir: str, directory holds .npz entries
+        max_size: int, bytes, evict least recently used entries beyond it.
+                  None means unlimited.
+        use_hash: bool, key covers files' content hash instead of size and mtime,
+                  slower but survives touch and copy.
+
+    Function:
+        get_key(pathes, dtype, mask_index): caculate key of a group
+        get(key): return (mean, std, count) or None
+        set(key, mean, std, count): store entry, then evict
+        evict(): remove least recently used entries beyond max_size
+        clear(): remove all entries
+    """
+    suffix = '.npz'
+
+    def __init__(self, cache_dir, max_size=None, use_hash=False):
+        super().__init__()
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.use_hash = use_hash
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _get_path(self, key):
+        return os.path.join(self.cache_dir, key + self.suffix)
+
+    def get_key(self, pathes, dtype, mask_index=None):
+        sha = hashlib.sha256()
+        sha.update(np.dtype(dtype).str.encode())
+        if mask_index is not None:
+            for index in mask_index:
+                index = np.ascontiguousarray(index)
+                sha.update(str(index.shape).encode())
+                sha.update(index.tobytes())
+        for path in pathes:
+            path = os.path.abspath(path)
+            sha.update(path.encode())
+            if self.use_hash:
+                with open(path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(1 << 20), b''):
+                        sha.update(chunk)
+            else:
+                stat = os.stat(path)
+                sha.update('{}:{}'.format(stat.st_size, stat.st_mtime_ns).encode())
+        return sha.hexdigest()
+
+    def _touch(self, path):
+        # mark as recently used, kernel's own timestamps may be too coarse
+        # to order entries used in quick succession
+        now = time.time_ns()
+        os.utime(path, ns=(now, now))
+
+    def get(self, key):
+        path = self._get_path(key)
+        try:
+            with np.load(path) as npz:
+                result = npz['mean'], npz['std'], int(npz['count'])
+        except (OSError, KeyError, ValueError):
+            return None
+        self._touch(path)
+        return result
+
+    def set(self, key, mean, std, count):
+        path = self._get_path(key)
+        # write then rename, readers never see partial entry
+        tmp_path = '{}.{}.tmp{}'.format(path[:-len(self.suffix)], os.getpid(), self.suffix)
+        np.savez(tmp_path, mean=mean, std=std, count=count)
+        os.replace(tmp_path, path)
+        self._touch(path)
+        self.evict()
+
+    def _list_entries(self):
+        entries = []
+        for filename in os.listdir(self.cache_dir):
+            if not filename.endswith(self.suffix) or '.tmp' in filename:
+                continue
+            path = os.path.join(self.cache_dir, filename)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+        return sorted(entries)
+
+    def evict(self):
+        if self.max_size is None:
+            return
+        entries = self._list_entries()
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total_size -= size
+
+    def clear(self):
+        for _, _, path in self._list_entries():
+            os.remove(path)
@@ -0,0 +1,161 @@
+""" checkpoint module, finished blocks of a voxelwise run kept on disk
+
+Results of every block are written into a memory mapped .npy, then the
+count of finished blocks is recorded in state.json, so a run killed at any
+moment resumes from the last recorded block. A fingerprint of the job
+(inputs, mask, parameters) guards against resuming with other settings.
+
+Files in checkpoint directory:
+    state.json: fingerprint, names, shape, dtype, count of blocks, finished blocks
+    indexes.npy: flatten indexes of caculated voxels
+    results.npy: (len(names), voxels) results, see parallel.SharedArray
+
+Function:
+    get_fingerprint(params): hash of JSON serializable params
+    get_files_stat(pathes): path, size, mtime of files, part of fingerprint
+
+Class:
+    Checkpoint(object): finished blocks and their results of one run
+
+Author: Kang Xiaopeng
+Data: 2026/10/17
+E-mail: kangxiaopeng2018@ia.ac.cn
+
+This file is part of meta_analysis.
+
+meta_analysis is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+meta_analysis is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with meta_analysis.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from . import parallel
+from . import result
+
+def get_fingerprint(params):
+    return hashlib.sha256(json.dumps(params, sort_keys=True,
+                                     default=str).encode()).hexdigest()
+
+def get_files_stat(pathes):
+    stats = []
+    for path in pathes:
+        stat = os.stat(path)
+        stats.append([os.path.abspath(path), stat.st_size, stat.st_mtime_ns])
+    return stats
+
+class Checkpoint(object):
+    """ finished blocks and their results of one voxelwise run
+
+    Attributes:
+        checkpoint_dir: str, directory holds state.json, indexes.npy, results.npy
+        state: dict, content of state.json, None before open()
+        results: parallel.SharedArray of results, None before open()
+
+    Function:
+        open(fingerprint, names, indexes, shape, dtype, n_blocks): start or resume
+        commit(done): record blocks before 'done' as finished
+        is_complete(): whether all blocks are finished
+        get_result(): result.MaskedResult of finished run
+        clear(): remove all files of checkpoint
+    """
+    state_name = 'state.json'
+
+    def __init__(self, checkpoint_dir):
+        super().__init__()
+        self.checkpoint_dir = checkpoint_dir
+        self.state = None
+        self.results = None
+
+    def _get_path(self, name):
+        return os.path.join(self.checkpoint_dir, name)
+
+    def load_state(self):
+        """ return content of state.json, None if no checkpoint
+        """
+        try:
+            with open(self._get_path(self.state_name)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _save_state(self):
+        # write then rename, a crash never leaves a partial state.json
+        path = self._get_path(self.state_name)
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f, indent=1)
+        os.replace(tmp_path, path)
+
+    def open(self, fingerprint, names, indexes, shape, dtype, n_blocks):
+        """ resume checkpoint of same fingerprint, or start a new one
+        Args:
+            fingerprint: str, from get_fingerprint() of job
+            names: names of statistics
+            indexes: 1d ndarray, flatten indexes of caculated voxels
+            shape: tuple, shape of volume
+            dtype: dtype of results
+            n_blocks: int, count of blocks
+        Return:
+            done: int, count of finished blocks, caculation restarts from it
+        """
+        state = self.load_state()
+        if state is not None and state['fingerprint'] != fingerprint:
+            raise ValueError('Checkpoint in {} belongs to another job, '
+                             'clear it to restart'.format(self.checkpoint_dir))
+        if state is not None:
+            saved_indexes = np.load(self._get_path('indexes.npy'))
+            if (state['n_blocks'] != n_blocks or
+                    not np.array_equal(saved_indexes, indexes)):
+                raise ValueError('Voxels or blocks differ from checkpoint in {}, '
+                                 'clear it to restart'.format(self.checkpoint_dir))
+        else:
+            # results.npy of a half-written previous start is stale
+            self.clear()
+            os.makedirs(self.checkpoint_dir, exist_ok=True)
+            np.save(self._get_path('indexes.npy'), np.asarray(indexes))
+            state = {'fingerprint': fingerprint, 'names': list(names),
+                     'shape': list(shape), 'dtype': np.dtype(dtype).str,
+                     'n_blocks': n_blocks, 'done': 0}
+        self.state = state
+        self.results = parallel.SharedArray(self._get_path('results.npy'),
+                                            (len(state['names']), len(indexes)),
+                                            state['dtype'])
+        self._save_state()
+        return state['done']
+
+    def commit(self, done):
+        """ flush results, then record blocks before 'done' as finished
+        """
+        self.results.get_array().flush()
+        self.state['done'] = int(done)
+        self._save_state()
+
+    def is_complete(self):
+        return self.state is not None and self.state['done'] >= self.state['n_blocks']
+
+    def get_result(self):
+        return result.MaskedResult(self.results.get_array(),
+                                   np.load(self._get_path('indexes.npy')),
+                                   self.state['shape'], self.state['names'])
+
+    def clear(self):
+        for name in (self.state_name, 'indexes.npy', 'results.npy'):
+            try:
+                os.remove(self._get_path(name))
+            except FileNotFoundError:
+                pass
+        self.state = None
+        self.results = None
@@ -0,0 +1,184 @@
+""" cli module, command line runner of voxelwise meta analysis job spec
+
+A job spec is a JSON or YAML file, relative pathes are relative to it:
+
+    inputs:                       # center directories, files matched by pattern
+      root: data/centers
+      groups: {1: '1_*.nii', 3: '3_*.nii'}
+    # or list files of every center and group, globs are allowed
+    # inputs: {center1: {1: [a.nii, b.nii], 3: ['c*.nii']}, ...}
+    labels: [1, 3]                # experimental group, control group
+    mask: grey_matter.nii         # optional
+    method: cohen_d
+    model: random
+    tau2_method: dl
+    max_iter: 100                 # of reml, pm tau square, see 'converged' output
+    tol: 1.0e-10
+    outputs: [es, se, z, p]       # names in engine.OUTPUT_NAMES
+    output_dir: result            # '<name>.nii' of every output
+    output_dtype: float32
+    block_size: 100000
+    n_jobs: 1
+    load_n_jobs: 1
+    checkpoint_dir: result/checkpoint
+
+Finished blocks are checkpointed, run same command again to resume a
+killed job, see main.resumable_meta_analysis().
+
+Usage:
+    meta-analysis job.yaml [--restart] [--n-jobs 4] [--log-interval 60]
+
+Function:
+    load_spec(path): read JSON or YAML job spec
+    get_center_dict(inputs, base_dir): center_dict from spec's inputs
+    run(spec, base_dir, restart, n_jobs, log_interval): run a job spec
+    main(argv): console entry
+
+Author: Kang Xiaopeng
+Data: 2026/10/17
+E-mail: kangxiaopeng2018@ia.ac.cn
+
+This file is part of meta_analysis.
+
+meta_analysis is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+meta_analysis is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with meta_analysis.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import argparse
+import glob
+import json
+import os
+
+import numpy as np
+
+from . import instrument
+from . import main as meta_main
+from . import mask
+
+DEFAULTS = {'mask': None, 'method': 'cohen_d', 'model': 'random', 'tau2_method': 'dl',
+            'outputs': None, 'output_dir': 'result', 'output_dtype': 'float32',
+            'dtype': 'float32', 'block_size': 100000, 'n_jobs': 1, 'load_n_jobs': 1,
+            'checkpoint_dir': None, 'max_iter': 100, 'tol': 1e-10}
+
+def load_spec(path):
+    """ read JSON or YAML job spec, YAML needs PyYAML
+    Return:
+        spec: dict, missing keys are filled by DEFAULTS
+    """
+    with open(path) as f:
+        if path.lower().endswith(('.yaml', '.yml')):
+            import yaml
+            spec = yaml.safe_load(f)
+        else:
+            spec = json.load(f)
+    for key in ('inputs', 'labels'):
+        if key not in spec:
+            raise ValueError('Job spec {} needs "{}"'.format(path, key))
+    if len(spec['labels']) != 2:
+        raise ValueError('Job spec needs two labels, got {}'.format(spec['labels']))
+    return dict(DEFAULTS, **spec)
+
+def _join(base_dir, path):
+    return os.path.join(base_dir, os.path.expanduser(str(path)))
+
+def _glob(base_dir, patterns):
+    if isinstance(patterns, str):
+        patterns = [patterns]
+    pathes = []
+    for pattern in patterns:
+        pattern = _join(base_dir, pattern)
+        matched = sorted(glob.glob(pattern))
+        pathes += matched if glob.has_magic(pattern) else [pattern]
+    return pathes
+
+def get_center_dict(inputs, base_dir='.'):
+    """ center_dict from spec's inputs, labels are str
+    Args:
+        inputs: {'root': dir, 'groups': {label: pattern}}, every sub directory
+                of root is a center, or {center: {label: [filepathes or globs]}}
+        base_dir: directory relative pathes based on
+    Return:
+        center_dict: {center:{label:[filepathes]}}, same as main.voxelwise_meta_analysis()
+    """
+    center_dict = {}
+    if 'root' in inputs:
+        root = _join(base_dir, inputs['root'])
+        for center_name in sorted(os.listdir(root)):
+            center_dir = os.path.join(root, center_name)
+            if not os.path.isdir(center_dir):
+                continue
+            center_dict[center_name] = {str(label): _glob(center_dir, pattern)
+                                        for label, pattern in inputs['groups'].items()}
+    else:
+        for center_name, group_dict in inputs.items():
+            center_dict[str(center_name)] = {str(label): _glob(base_dir, patterns)
+                                             for label, patterns in group_dict.items()}
+    return center_dict
+
+def run(spec, base_dir='.', restart=False, n_jobs=None, log_interval=None):
+    """ run a job spec from load_spec(), resume from its checkpoint if any
+    Return:
+        pathes: list of saved nii filepathes
+    """
+    import nibabel as nib
+    label1, label2 = (str(label) for label in spec['labels'])
+    center_dict = get_center_dict(spec['inputs'], base_dir)
+    output_dir = _join(base_dir, spec['output_dir'])
+    checkpoint_dir = spec['checkpoint_dir']
+    if checkpoint_dir is None:
+        checkpoint_dir = os.path.join(output_dir, 'checkpoint')
+    else:
+        checkpoint_dir = _join(base_dir, checkpoint_dir)
+
+    _mask = None
+    if spec['mask'] is not None:
+        template_nii = nib.load(_join(base_dir, spec['mask']))
+        _mask = mask.Mask(np.asarray(template_nii.dataobj))
+    else:
+        first_pathes = next(pathes for group_dict in center_dict.values()
+                            for pathes in group_dict.values() if pathes)
+        template_nii = nib.load(first_pathes[0])
+
+    with instrument.Instrument(log_interval=log_interval):
+        masked_result = meta_main.resumable_meta_analysis(
+                            label1, label2, checkpoint_dir, center_dict, _mask=_mask,
+                            dtype=np.dtype(spec['dtype']), model_type=spec['model'],
+                            method=spec['method'], tau2_method=spec['tau2_method'],
+                            block_size=int(spec['block_size']),
+                            n_jobs=spec['n_jobs'] if n_jobs is None else n_jobs,
+                            load_n_jobs=spec['load_n_jobs'], outputs=spec['outputs'],
+                            output_dtype=np.dtype(spec['output_dtype']), restart=restart,
+                            max_iter=int(spec['max_iter']), tol=float(spec['tol']))
+    return masked_result.to_niis(template_nii, output_dir, np.dtype(spec['output_dtype']))
+
+def get_parser():
+    parser = argparse.ArgumentParser(prog='meta-analysis',
+                                     description='Run voxelwise meta analysis of a job spec, '
+                                                 'resume from checkpoint if killed')
+    parser.add_argument('spec', help='JSON or YAML job spec')
+    parser.add_argument('--restart', action='store_true', help='discard checkpoint')
+    parser.add_argument('--n-jobs', type=int, default=None, help='override spec\'s n_jobs')
+    parser.add_argument('--log-interval', type=float, default=None,
+                        help='seconds between progress logs')
+    return parser
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+    spec = load_spec(args.spec)
+    base_dir = os.path.dirname(os.path.abspath(args.spec))
+    pathes = run(spec, base_dir, args.restart, args.n_jobs, args.log_interval)
+    for path in pathes:
+        print(path)
+    return pathes
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,8 @@ Class:
     Group(object): A specific label group within a center
     Study(object): A study which hold two group's mean, std, count,
                    can caculate its effect size, variance.
+    StudyTable(object): Columnar table of studies, holds ndarrays instead of
+                        Study instances.
     Center(object): A center holds lots of group, generate study.
     Cneters(object): Hold list of Center instances.
 
@@ -31,9 +33,9 @@ from dataclasses import dataclass
 from typing import Any
 import math
 
-import nibabel as nib
 import numpy as np
 
+from . import engine
 from . import utils
 
 class Group(object):
@@ -121,6 +123,9 @@ class Study(object):
     Function:
         cohen_d(): cohen's d effect size
         hedge_g(): hedge's g effect size
+        risk_ratio(): log risk ratio of categorical groups
+        odds_ratio(): log odds ratio of categorical groups
+        risk_difference(): risk difference of categorical groups
         get_effect_size(): use specific method to return effect size
         get_variance(): return variance
     """
@@ -139,9 +144,11 @@ class Study(object):
         elif method == 'hedge_g' or method == 'hedge':
             func = self.hedge_g
             data_type = self.num
-        elif method == 'risk_ratio' or method == 'rr':
-            func = self.risk_ratio
+        elif engine.is_categorical(method):
+            func = self.categorical
             data_type = self.cate
+        else:
+            raise ValueError('Unsupported method: {}'.format(self.method))
         self.data_type = data_type
         self.func = func
         self.func()
@@ -166,8 +173,28 @@ class Study(object):
         self.variance = j**2 * self.variance
         self.standard_error = math.sqrt(self.variance)
     
+    def categorical(self):
+        """ risk ratio and odds ratio are on log scale, risk difference isn't.
+            Tables with a zero cell get 0.5 continuity correction.
+        """
+        a, b = self.group_experimental.get_values()
+        c, d = self.group_control.get_values()
+        effect_size, variance = engine.get_categorical_effect_sizes(self.method, a, b, c, d)
+        self.effect_size = float(effect_size)
+        self.variance = float(variance)
+        self.standard_error = math.sqrt(self.variance)
+
     def risk_ratio(self):
-        raise NotImplementedError()
+        self.method = 'risk_ratio'
+        self.categorical()
+
+    def odds_ratio(self):
+        self.method = 'odds_ratio'
+        self.categorical()
+
+    def risk_difference(self):
+        self.method = 'risk_difference'
+        self.categorical()
 
     def get_effect_size(self):
         return self.effect_size
@@ -179,15 +206,104 @@ class Study(object):
         return self.standard_error
 
     def get_confidence_intervals(self):
-        # 95% confidence intervals
-        if self.data_type == self.num:
-            lower_limits = self.effect_size - 1.96 * self.standard_error
-            upper_limits = self.effect_size + 1.96 * self.standard_error
-        elif self.data_type == self.cate:
-            ln_lower_limits = np.log(self.effect_size) - 1.96 * self.standard_error
-            ln_upper_limits = np.log(self.effect_size) + 1.96 * self.standard_error
-            lower_limits = np.exp(ln_lower_limits)
-            upper_limits = np.exp(ln_upper_limits)
+        # 95% confidence intervals, on same scale as effect size, ratios'
+        # effect sizes are already log, np.exp() them to get ratio scale
+        lower_limits = self.effect_size - 1.96 * self.standard_error
+        upper_limits = self.effect_size + 1.96 * self.standard_error
+        return lower_limits, upper_limits
+
+class StudyTable(object):
+    """ columnar table of studies, every column is a contiguous ndarray,
+        so lots of studies are built and caculated without a Study instance each.
+
+    Attributes:
+        names: ndarray, studies' names
+        method: str, method used to caculate effect size
+        data_type: Study.num or Study.cate
+        means1, stds1, counts1: ndarray, experimental groups' mean, std, count,
+                                None if unknown
+        means2, stds2, counts2: ndarray, control groups' mean, std, count,
+                                None if unknown
+        effect_sizes: ndarray, studies' effect size
+        variances: ndarray, studies' variance
+        standard_errors: ndarray, studies' standard error
+
+    Function:
+        from_msn(names, m1, s1, n1, m2, s2, n2, method): caculate all studies at once
+        from_tables(names, a, b, c, d, method): caculate all 2x2 tables at once
+        from_studies(studies): gather list of Study instances
+        get_confidence_intervals(): 95% confidence intervals of all studies
+        has_msn(): whether groups' mean, std, count are known
+    """
+    def __init__(self, names, effect_sizes, variances, method=None,
+                 data_type=Study.num, msn=None):
+        super().__init__()
+        self.names = np.asarray(names)
+        self.method = method
+        self.data_type = data_type
+        self.effect_sizes = np.asarray(effect_sizes, dtype=np.float64)
+        self.variances = np.asarray(variances, dtype=np.float64)
+        self.standard_errors = np.sqrt(self.variances)
+        if msn is None:
+            msn = (None,) * 6
+        (self.means1, self.stds1, self.counts1,
+         self.means2, self.stds2, self.counts2) = [
+            None if column is None else np.asarray(column, dtype=np.float64)
+            for column in msn]
+
+    @classmethod
+    def from_msn(cls, names, m1, s1, n1, m2, s2, n2, method='cohen_d'):
+        """ caculate effect sizes and variances of all studies at once
+        Args:
+            names: studies' names
+            m1, s1, n1: 1d array-like, experimental groups' mean, std, count
+            m2, s2, n2: 1d array-like, control groups' mean, std, count
+            method: str, ways to caculate effect size
+        """
+        msn = [np.asarray(column, dtype=np.float64) for column in (m1, s1, n1, m2, s2, n2)]
+        effect_sizes, variances = engine.get_effect_sizes(method, *msn)
+        return cls(names, effect_sizes, variances, method, Study.num, msn)
+
+    @classmethod
+    def from_tables(cls, names, a, b, c, d, method='odds_ratio', correction=0.5):
+        """ caculate effect sizes and variances of all 2x2 tables at once
+        Args:
+            names: studies' names
+            a, b: 1d array-like, experimental groups' exposed, not exposed count
+            c, d: 1d array-like, control groups' exposed, not exposed count
+            method: 'odds_ratio', 'risk_ratio' or 'risk_difference'
+            correction: float, continuity correction of tables have a zero cell
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            effect_sizes, variances = engine.get_categorical_effect_sizes(
+                                            method, a, b, c, d, correction)
+        return cls(names, effect_sizes, variances, method, Study.cate)
+
+    @classmethod
+    def from_studies(cls, studies):
+        """ gather list of Study instances, effect sizes are not caculated again
+        """
+        names = [study.name for study in studies]
+        effect_sizes = [study.get_effect_size() for study in studies]
+        variances = [study.get_variance() for study in studies]
+        data_type = studies[0].data_type
+        msn = None
+        if data_type == Study.num:
+            msn = list(zip(*[study.group_experimental.get_mean_std_count() +
+                             study.group_control.get_mean_std_count()
+                             for study in studies]))
+        return cls(names, effect_sizes, variances, studies[0].method, data_type, msn)
+
+    def __len__(self):
+        return len(self.effect_sizes)
+
+    def has_msn(self):
+        return self.counts1 is not None
+
+    def get_confidence_intervals(self):
+        # 95% confidence intervals, on same scale as effect sizes
+        lower_limits = self.effect_sizes - 1.96 * self.standard_errors
+        upper_limits = self.effect_sizes + 1.96 * self.standard_errors
         return lower_limits, upper_limits
 
 class Center(object):
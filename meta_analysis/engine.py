@@ -0,0 +1,429 @@
+""" engine module, vectorized meta analysis over lots of voxels at once
+
+All arrays are laid out as (centers, voxels): axis 0 indexes the studies
+and every other axis is an independent meta analysis. Counts broadcast
+against that layout, so they should be shaped (centers, 1).
+
+Class:
+    LazyResults(object): results caculated on first access
+
+Function:
+    cohen_d(m1, s1, n1, m2, s2, n2): caculate cohen's d and its variance
+    hedge_g(m1, s1, n1, m2, s2, n2): caculate hedge's g and its variance
+    get_effect_sizes(method, m1, s1, n1, m2, s2, n2): use specific method to
+                     return effect sizes and variances
+    risk_ratio(a, b, c, d, correction): caculate log risk ratio of 2x2 tables
+    odds_ratio(a, b, c, d, correction): caculate log odds ratio of 2x2 tables
+    risk_difference(a, b, c, d, correction): caculate risk difference of 2x2 tables
+    get_categorical_effect_sizes(method, a, b, c, d, correction): use specific
+                     method to return effect sizes and variances of 2x2 tables
+    fixed_weights(effect_sizes, variances): inverse variance weights
+    random_weights(effect_sizes, variances, tau2_method): random effect weights and tau square
+    get_outputs(outputs): check names of requested statistics
+    caculate(effect_sizes, variances, model_type, tau2_method, outputs, dtype, max_iter, tol):
+             caculate requested results of all voxels
+    mantel_haenszel(a, b, c, d, method): Mantel-Haenszel pooling of 2x2 tables
+    caculate_tables(a, b, c, d, method, model_type): caculate results of 2x2 tables
+    get_block_size(center_count, max_memory): number of voxels fit in max_memory
+
+Author: Kang Xiaopeng
+Data: 2026/10/17
+E-mail: kangxiaopeng2018@ia.ac.cn
+
+This file is part of meta_analysis.
+
+meta_analysis is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+meta_analysis is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with meta_analysis.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import numpy as np
+
+from . import model
+
+# same order as Model.get_results()
+RESULT_NAMES = ('es', 'var', 'se', 'll', 'ul', 'q', 'z', 'p')
+# extra statistics caculated on demand: tau square, I square (%), H square,
+# 95% prediction intervals with t quantile of k - 2 degrees of freedom,
+# iterations of tau square and 1 if it converged within max_iter else 0
+OUTPUT_NAMES = RESULT_NAMES + ('tau2', 'i2', 'h2', 'pi_ll', 'pi_ul',
+                               'tau2_iter', 'converged')
+
+# rough count of float64 (centers, voxels) arrays alive while stacking one
+# block and running get_effect_sizes() + caculate() on it, tracemalloc
+# measured about 8.5, rounded up for safety
+ARRAYS_PER_CENTER = 10
+
+def _as_column(n, ndim):
+    n = np.asarray(n, dtype=np.float64)
+    return np.reshape(n, n.shape + (1,) * (ndim - n.ndim))
+
+def cohen_d(m1, s1, n1, m2, s2, n2):
+    """ details in https://en.wikipedia.org/wiki/Effect_size
+    Args:
+        m1, s1, n1: experimental groups' mean, std, count
+        m2, s2, n2: control groups' mean, std, count
+    Return:
+        d: ndarray, effect sizes
+        variance: ndarray, variances of d
+    """
+    m1 = np.asarray(m1, dtype=np.float64)
+    ndim = m1.ndim
+    n1, n2 = _as_column(n1, ndim), _as_column(n2, ndim)
+    s = np.sqrt(((n1-1)*np.square(s1)+(n2-1)*np.square(s2))/(n1+n2-2))
+    d = (m1 - m2) / s
+    variance = (n1+n2)/(n1*n2) + np.square(d)/(2*(n1+n2))
+    return d, variance
+
+def hedge_g(m1, s1, n1, m2, s2, n2):
+    d, variance = cohen_d(m1, s1, n1, m2, s2, n2)
+    ndim = d.ndim
+    n1, n2 = _as_column(n1, ndim), _as_column(n2, ndim)
+    j = (1-3/(4*(n1+n2)-9))
+    return j * d, j**2 * variance
+
+def get_effect_sizes(method, m1, s1, n1, m2, s2, n2):
+    method = method.lower()
+    if method == 'cohen_d' or method == 'cohen':
+        func = cohen_d
+    elif method == 'hedge_g' or method == 'hedge':
+        func = hedge_g
+    else:
+        raise ValueError('Unsupported method: {}'.format(method))
+    return func(m1, s1, n1, m2, s2, n2)
+
+def correct_tables(a, b, c, d, correction=0.5):
+    """ add correction to every cell of 2x2 tables which have a zero cell
+    Args:
+        a, b: experimental groups' exposed, not exposed count
+        c, d: control groups' exposed, not exposed count
+        correction: float, continuity correction, 0 means none
+    Return:
+        a, b, c, d: float64 ndarrays
+    """
+    a, b, c, d = [np.asarray(cell, dtype=np.float64) for cell in (a, b, c, d)]
+    if correction:
+        has_zero = (a == 0) | (b == 0) | (c == 0) | (d == 0)
+        if np.any(has_zero):
+            added = np.where(has_zero, correction, 0)
+            a, b, c, d = a + added, b + added, c + added, d + added
+    return a, b, c, d
+
+def risk_ratio(a, b, c, d, correction=0.5):
+    """ log risk ratio and its variance
+    Args:
+        same as correct_tables()
+    Return:
+        log_rr: ndarray, effect sizes on log scale
+        variance: ndarray, variances of log_rr
+    """
+    a, b, c, d = correct_tables(a, b, c, d, correction)
+    log_rr = np.log(a / (a+b)) - np.log(c / (c+d))
+    variance = 1/a - 1/(a+b) + 1/c - 1/(c+d)
+    return log_rr, variance
+
+def odds_ratio(a, b, c, d, correction=0.5):
+    """ log odds ratio and its variance, same args as risk_ratio()
+    """
+    a, b, c, d = correct_tables(a, b, c, d, correction)
+    log_or = np.log(a) + np.log(d) - np.log(b) - np.log(c)
+    variance = 1/a + 1/b + 1/c + 1/d
+    return log_or, variance
+
+def risk_difference(a, b, c, d, correction=0.5):
+    """ risk difference and its variance, same args as risk_ratio()
+    """
+    a, b, c, d = correct_tables(a, b, c, d, correction)
+    n1, n2 = a + b, c + d
+    p1, p2 = a / n1, c / n2
+    return p1 - p2, p1*(1-p1)/n1 + p2*(1-p2)/n2
+
+def _get_categorical_func(method):
+    method = method.lower()
+    if method == 'risk_ratio' or method == 'rr':
+        return risk_ratio
+    elif method == 'odds_ratio' or method == 'or':
+        return odds_ratio
+    elif method == 'risk_difference' or method == 'rd':
+        return risk_difference
+    raise ValueError('Unsupported method: {}'.format(method))
+
+def is_categorical(method):
+    try:
+        _get_categorical_func(method)
+    except ValueError:
+        return False
+    return True
+
+def get_categorical_effect_sizes(method, a, b, c, d, correction=0.5):
+    """ use specific method to return effect sizes and variances of 2x2 tables,
+        risk ratio and odds ratio are on log scale.
+    """
+    return _get_categorical_func(method)(a, b, c, d, correction)
+
+def fixed_weights(effect_sizes, variances):
+    return np.reciprocal(variances)
+
+def random_weights(effect_sizes, variances, tau2_method='dl'):
+    """ random effect weights
+    Args:
+        tau2_method: method to caculate tau square, pass to model.get_tau_square()
+    Return:
+        weights: ndarray, same shape as variances
+        tau_square: ndarray, between-study variance of every voxel
+    """
+    tau_square = model.get_tau_square(effect_sizes, variances, tau2_method)
+    return np.reciprocal(variances + tau_square), tau_square
+
+class LazyResults(object):
+    """ results of meta analysis caculated on first access, so only
+        requested statistics and what they depend on are caculated.
+
+    Attributes:
+        effect_sizes: ndarray, shape (centers, voxels)
+        variances: ndarray, shape (centers, voxels)
+        model_type: 'fixed' or 'random', meta analysis model.
+        tau2_method: random model's tau square method
+        max_iter: int, maximum iterations of 'reml' and 'pm' tau square
+        tol: float, relative tolerance of 'reml' and 'pm' tau square
+
+    Function:
+        __getitem__(name): return statistic in OUTPUT_NAMES, or intermediate
+                           'fixed_weights', 'weights', 'sum_weights'
+    """
+    def __init__(self, effect_sizes, variances, model_type='random', tau2_method='dl',
+                 max_iter=100, tol=1e-10):
+        super().__init__()
+        self.effect_sizes = effect_sizes
+        self.variances = variances
+        self.model_type = model_type.lower()
+        self.tau2_method = tau2_method
+        self.max_iter = max_iter
+        self.tol = tol
+        self._values = {}
+
+    def __getitem__(self, name):
+        if name not in self._values:
+            self._values[name] = getattr(self, '_' + name)()
+        return self._values[name]
+
+    def _fixed_weights(self):
+        return fixed_weights(self.effect_sizes, self.variances)
+
+    def _tau2(self):
+        tau_square, report = model.get_tau_square(self.effect_sizes, self.variances,
+                                                  self.tau2_method, self.max_iter,
+                                                  self.tol, return_report=True)
+        # report is kept, so non-converged voxels could be found
+        self._values['tau2_iter'] = report['iterations']
+        self._values['converged'] = report['converged']
+        return tau_square
+
+    def _tau2_iter(self):
+        self['tau2']
+        return self._values['tau2_iter']
+
+    def _converged(self):
+        self['tau2']
+        return self._values['converged']
+
+    def _weights(self):
+        if self.model_type == 'random':
+            return np.reciprocal(self.variances + self['tau2'])
+        return self['fixed_weights']
+
+    def _sum_weights(self):
+        return np.sum(self['weights'], axis=0)
+
+    def _es(self):
+        return np.sum(self.effect_sizes * self['weights'], axis=0) / self['sum_weights']
+
+    def _var(self):
+        return 1 / self['sum_weights']
+
+    def _se(self):
+        return np.sqrt(self['var'])
+
+    def _ll(self):
+        return model.get_confidence_intervals(self['es'], self['se'])[0]
+
+    def _ul(self):
+        return model.get_confidence_intervals(self['es'], self['se'])[1]
+
+    def _q(self):
+        # heterogeneity is always measured with inverse variance weights
+        fixed = self['fixed_weights']
+        fixed_effect_size = np.sum(self.effect_sizes * fixed, axis=0) / np.sum(fixed, axis=0)
+        return model.get_heterogeneity(self.effect_sizes, fixed_effect_size, fixed, axis=0)
+
+    def _z(self):
+        return model.get_z_value(self['es'], self['se'])
+
+    def _p(self):
+        return model.get_p_from_z(self['z'])
+
+    def _i2(self):
+        df = self.effect_sizes.shape[0] - 1
+        q = self['q']
+        # identical studies have no heterogeneity, not 0 / 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(q == 0, 0, np.maximum((q - df) / q, 0) * 100)
+
+    def _h2(self):
+        return self['q'] / (self.effect_sizes.shape[0] - 1)
+
+    def _prediction_se(self):
+        # fixed model assumes no between-study variance
+        if self.model_type == 'random':
+            return np.sqrt(self['tau2'] + self['var'])
+        return self['se']
+
+    def _prediction_width(self):
+        # Higgins, Thompson & Spiegelhalter (2009): t quantile of k - 2
+        # degrees of freedom, undefined for less than 3 studies
+        k = self.effect_sizes.shape[0]
+        if k < 3:
+            return np.full(np.shape(self['es']), np.nan)
+        from scipy.special import stdtrit
+        return stdtrit(k - 2, .975) * self['prediction_se']
+
+    def _pi_ll(self):
+        return self['es'] - self['prediction_width']
+
+    def _pi_ul(self):
+        return self['es'] + self['prediction_width']
+
+def get_outputs(outputs=None):
+    """ check names of requested statistics, None means RESULT_NAMES
+    """
+    if outputs is None:
+        return RESULT_NAMES
+    if isinstance(outputs, str):
+        outputs = (outputs,)
+    outputs = tuple(outputs)
+    for name in outputs:
+        if name not in OUTPUT_NAMES:
+            raise ValueError('Unsupported output: {}, choose from {}'.format(
+                             name, OUTPUT_NAMES))
+    return outputs
+
+def caculate(effect_sizes, variances, model_type='random', tau2_method='dl',
+             outputs=None, dtype=np.float64, max_iter=100, tol=1e-10):
+    """ caculate meta analysis results of all voxels at once
+    Args:
+        effect_sizes: ndarray, shape (centers, voxels)
+        variances: ndarray, shape (centers, voxels)
+        model_type: 'fixed' or 'random', meta analysis model.
+        tau2_method: 'dl', 'reml', 'pm' or 'sj', random model's tau square method
+        outputs: names in OUTPUT_NAMES, only they and what they depend on
+                 are caculated. Default RESULT_NAMES.
+        dtype: dtype of results
+        max_iter: int, maximum iterations of 'reml' and 'pm' tau square,
+                  check 'converged' output for voxels reached it
+        tol: float, relative tolerance of 'reml' and 'pm' tau square
+    Return:
+        results: ndarray, shape (len(outputs), voxels), default outputs
+                 are same order as Model.get_results()
+    """
+    outputs = get_outputs(outputs)
+    effect_sizes = np.asarray(effect_sizes, dtype=np.float64)
+    variances = np.asarray(variances, dtype=np.float64)
+    if model_type.lower() not in ('random', 'fixed'):
+        raise ValueError('Unsupported model: {}'.format(model_type))
+
+    lazy_results = LazyResults(effect_sizes, variances, model_type, tau2_method,
+                               max_iter, tol)
+    results = np.empty((len(outputs),)+effect_sizes.shape[1:], dtype=dtype)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for i, name in enumerate(outputs):
+            results[i] = lazy_results[name]
+    return results
+
+def mantel_haenszel(a, b, c, d, method='odds_ratio', correction=0.5):
+    """ Mantel-Haenszel pooling of lots of 2x2 tables at once
+    Args:
+        a, b, c, d: ndarray, shape (centers, outcomes), same as correct_tables()
+        method: 'odds_ratio', 'risk_ratio' or 'risk_difference'
+        correction: float, continuity correction of every center's effect size,
+                    which is only used by heterogeneity. Pooling needs none.
+                    q is Cochran's Q of these effect sizes around the
+                    Mantel-Haenszel estimate, weighted by inverse variances.
+    Return:
+        results: ndarray, shape (len(RESULT_NAMES), outcomes), es is on log
+                 scale for risk ratio and odds ratio. Variance of odds ratio is
+                 Robins-Breslow-Greenland, others are Greenland-Robins.
+    """
+    func = _get_categorical_func(method)
+    a, b, c, d = [np.asarray(cell, dtype=np.float64) for cell in (a, b, c, d)]
+    n1, n2 = a + b, c + d
+    n = n1 + n2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if func is odds_ratio:
+            r, s = a * d / n, b * c / n
+            p, q = (a + d) / n, (b + c) / n
+            sum_r, sum_s = np.sum(r, axis=0), np.sum(s, axis=0)
+            total_effect_size = np.log(sum_r / sum_s)
+            total_variance = np.sum(p * r, axis=0) / (2 * np.square(sum_r)) +\
+                             np.sum(p * s + q * r, axis=0) / (2 * sum_r * sum_s) +\
+                             np.sum(q * s, axis=0) / (2 * np.square(sum_s))
+        elif func is risk_ratio:
+            r, s = a * n2 / n, c * n1 / n
+            sum_r, sum_s = np.sum(r, axis=0), np.sum(s, axis=0)
+            total_effect_size = np.log(sum_r / sum_s)
+            total_variance = np.sum((n1 * n2 * (a + c) - a * c * n) / np.square(n),
+                                    axis=0) / (sum_r * sum_s)
+        else:
+            weights = n1 * n2 / n
+            sum_weights = np.sum(weights, axis=0)
+            total_effect_size = np.sum((a * n2 - c * n1) / n, axis=0) / sum_weights
+            total_variance = np.sum((a * b * n2**3 + c * d * n1**3) / (n1 * n2 * np.square(n)),
+                                    axis=0) / np.square(sum_weights)
+        total_standard_error = np.sqrt(total_variance)
+        total_lower_limit, total_upper_limit = model.get_confidence_intervals(
+                                    total_effect_size, total_standard_error)
+        effect_sizes, variances = func(a, b, c, d, correction)
+        # Cochran's Q around reported Mantel-Haenszel estimate, inverse variance weighted
+        q = model.get_heterogeneity(effect_sizes, total_effect_size,
+                                    np.reciprocal(variances), axis=0)
+        z = model.get_z_value(total_effect_size, total_standard_error)
+        p = model.get_p_from_z(z)
+    return np.stack((total_effect_size, total_variance, total_standard_error,
+                     total_lower_limit, total_upper_limit, q, z, p))
+
+def caculate_tables(a, b, c, d, method='odds_ratio', model_type='random',
+                    tau2_method='dl', correction=0.5):
+    """ caculate meta analysis results of lots of 2x2 tables at once
+    Args:
+        a, b, c, d: ndarray, shape (centers, outcomes), same as correct_tables()
+        method: 'odds_ratio', 'risk_ratio' or 'risk_difference'
+        model_type: 'fixed', 'random' or 'mh' Mantel-Haenszel
+        tau2_method: random model's tau square method
+        correction: float, continuity correction
+    Return:
+        results: ndarray, shape (len(RESULT_NAMES), outcomes)
+    """
+    if model_type.lower() == 'mh':
+        return mantel_haenszel(a, b, c, d, method, correction)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        effect_sizes, variances = get_categorical_effect_sizes(method, a, b, c, d,
+                                                               correction)
+    return caculate(effect_sizes, variances, model_type, tau2_method)
+
+def get_block_size(center_count, max_memory):
+    """ caculate how many voxels could be caculated at once within max_memory
+    Args:
+        center_count: int, count of centers
+        max_memory: int, bytes
+    Return:
+        block_size: int, at least 1
+    """
+    voxel_bytes = 8 * (ARRAYS_PER_CENTER * center_count + len(RESULT_NAMES))
+    return max(int(max_memory // voxel_bytes), 1)
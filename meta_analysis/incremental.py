@@ -0,0 +1,310 @@
+""" incremental module, persisted sufficient statistics of a voxelwise meta analysis
+
+Every center's effect size and variance maps are stored once, with running
+sums of fixed effect weights over all centers. Adding or removing a center
+only adds or subtracts its own terms, fixed model and DerSimonian-Laird
+random model results are then caculated from the sums and one pass over
+stored variance maps, without loading any nii again.
+Non-finite terms, e.g. of a zero variance, could not be subtracted back,
+so they are kept out of sums and counted per voxel, sums of those voxels
+are caculated from stored centers when needed.
+
+Store layout:
+    store.npz: info (shape of volume, effect size method, labels, stored
+               centers) as JSON, running sums of weights, weighted effect
+               sizes, weighted squared effect sizes and squared weights,
+               count of centers have non-finite terms of every voxel.
+               One file, so centers and sums are always replaced together.
+    indexes.npy: flatten indexes of stored voxels in volume, from mask
+    centers/*.npy: (2, voxels) effect sizes and variances of every center
+
+Class:
+    MetaAnalysisStore(object): on-disk store of centers' effect sizes and variances
+
+Author: Kang Xiaopeng
+Data: 2026/10/17
+E-mail: kangxiaopeng2018@ia.ac.cn
+
+This file is part of meta_analysis.
+
+meta_analysis is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+meta_analysis is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with meta_analysis.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from . import engine
+from . import model
+from . import utils
+
+SUM_NAMES = ('sum_weights', 'sum_weighted_effect_sizes',
+             'sum_weighted_squares', 'sum_square_weights')
+
+def get_sums(effect_sizes, variances):
+    """ fixed effect sums of centers
+    Args:
+        effect_sizes: ndarray, shape (centers, voxels)
+        variances: ndarray, shape (centers, voxels)
+    Return:
+        sums: ndarray, shape (len(SUM_NAMES), voxels)
+    """
+    effect_sizes = np.asarray(effect_sizes, dtype=np.float64)
+    variances = np.asarray(variances, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weights = np.reciprocal(variances)
+        weighted_effect_sizes = weights * effect_sizes
+        return np.stack((np.sum(weights, axis=0),
+                         np.sum(weighted_effect_sizes, axis=0),
+                         np.sum(weighted_effect_sizes * effect_sizes, axis=0),
+                         np.sum(np.square(weights), axis=0)))
+
+class MetaAnalysisStore(object):
+    """ on-disk store of centers' effect sizes and variances, with running
+        sums of fixed effect weights, so centers could be added or removed
+        without recomputing others.
+
+    Attributes:
+        store_dir: str, directory holds the store
+        shape: tuple, shape of volume, None before set_volume()
+        indexes: 1d ndarray, flatten indexes of stored voxels in volume
+        method: str, method used to caculate stored effect sizes
+        labels: list of str, (label1, label2) of stored contrast
+        center_names: list of str, stored centers, in adding order
+        sums: ndarray, shape (len(SUM_NAMES), voxels), finite terms only
+        nonfinite_counts: ndarray, shape (voxels,), count of centers have
+                          non-finite terms of every voxel
+
+    Function:
+        set_volume(shape, indexes, method, labels): set volume of an empty store
+        check(shape, indexes, method, labels): raise if not same as store
+        add_center(center_name, effect_sizes, variances): store a center
+        remove_center(center_name): remove a stored center
+        load_center(center_name): return stored effect sizes and variances
+        rebuild(): caculate sums again from stored centers
+        get_sums(): sums of all stored centers, non-finite voxels included
+        caculate(model_type, tau2_method, block_size): pooled results of stored voxels
+    """
+    store_name = 'store.npz'
+    indexes_name = 'indexes.npy'
+    centers_dir = 'centers'
+
+    def __init__(self, store_dir):
+        super().__init__()
+        self.store_dir = store_dir
+        os.makedirs(os.path.join(store_dir, self.centers_dir), exist_ok=True)
+        self.shape = None
+        self.indexes = None
+        self.method = None
+        self.labels = None
+        self.center_names = []
+        self.sums = None
+        self.nonfinite_counts = None
+        self._files = {}
+        store_path = self._get_path(self.store_name)
+        if os.path.exists(store_path):
+            with np.load(store_path) as npz:
+                info = json.loads(str(npz['info']))
+                self.sums = np.stack([npz[name] for name in SUM_NAMES])
+                self.nonfinite_counts = npz['nonfinite_counts']
+            self.shape = tuple(info['shape'])
+            self.method = info['method']
+            self.labels = info['labels']
+            self._files = dict(info['centers'])
+            self.center_names = list(info['centers'])
+            self.indexes = np.load(self._get_path(self.indexes_name))
+
+    def _get_path(self, *names):
+        return os.path.join(self.store_dir, *names)
+
+    def _get_center_path(self, center_name):
+        return self._get_path(self.centers_dir, self._files[str(center_name)])
+
+    def _save(self):
+        # centers and sums in one file, write then rename, a crash leaves
+        # either old or new store, never centers without their sums
+        info = {'shape': list(self.shape), 'method': self.method, 'labels': self.labels,
+                'centers': {name: self._files[name] for name in self.center_names}}
+        store_path = self._get_path(self.store_name)
+        tmp_path = '{}.{}.tmp.npz'.format(store_path[:-len('.npz')], os.getpid())
+        np.savez(tmp_path, info=json.dumps(info), nonfinite_counts=self.nonfinite_counts,
+                 **dict(zip(SUM_NAMES, self.sums)))
+        os.replace(tmp_path, store_path)
+
+    def set_volume(self, shape, indexes, method=None, labels=None):
+        """ set volume of an empty store
+        Args:
+            shape: tuple, shape of volume
+            indexes: 1d ndarray, flatten indexes of voxels to store
+            method: str, method used to caculate effect sizes
+            labels: (label1, label2) of contrast, stored as str
+        """
+        if self.center_names:
+            raise ValueError('Could\'t change volume of a store holds centers')
+        self.shape = tuple(int(i) for i in shape)
+        self.indexes = np.asarray(indexes, dtype=np.int64)
+        self.method = method
+        self.labels = None if labels is None else [str(label) for label in labels]
+        self.sums = np.zeros((len(SUM_NAMES), len(self.indexes)))
+        self.nonfinite_counts = np.zeros(len(self.indexes), dtype=np.int64)
+        np.save(self._get_path(self.indexes_name), self.indexes)
+        self._save()
+
+    def check(self, shape=None, indexes=None, method=None, labels=None):
+        """ raise ValueError if volume, voxels (mask), method or contrast
+            differ from store's, None is not checked
+        """
+        if method is not None and self.method is not None and method != self.method:
+            raise ValueError('Store holds effect sizes of {}, not {}'.format(
+                             self.method, method))
+        if labels is not None and self.labels is not None:
+            labels = [str(label) for label in labels]
+            if labels != self.labels:
+                raise ValueError('Store holds contrast {}, not {}'.format(self.labels, labels))
+        if shape is not None and self.shape is not None and tuple(shape) != self.shape:
+            raise ValueError('Volume {} differ from store\'s {}'.format(tuple(shape), self.shape))
+        if (indexes is not None and self.indexes is not None and
+                not np.array_equal(self.indexes, indexes)):
+            raise ValueError('Voxels (mask) differ from store')
+
+    def _add_sums(self, center_array, sign):
+        sums = get_sums(center_array[:1], center_array[1:])
+        nonfinite = ~np.all(np.isfinite(sums), axis=0)
+        self.sums += sign * np.where(nonfinite, 0, sums)
+        self.nonfinite_counts += sign * nonfinite
+
+    def add_center(self, center_name, effect_sizes, variances):
+        """ store a center, add its terms to sums
+        Args:
+            center_name: center's name, stored as str
+            effect_sizes: 1d ndarray, effect sizes of stored voxels
+            variances: 1d ndarray, variances of stored voxels
+        """
+        center_name = str(center_name)
+        if self.sums is None:
+            raise ValueError('Call set_volume() before adding centers')
+        if center_name in self._files:
+            raise ValueError('Center {} already in store'.format(center_name))
+        center_array = np.stack((effect_sizes, variances)).astype(np.float64)
+        if center_array.shape != (2, self.sums.shape[1]):
+            raise ValueError('Center {} has {} voxels, store has {}'.format(
+                             center_name, center_array.shape[1:], self.sums.shape[1]))
+        filename = '{}.npy'.format(hashlib.sha256(center_name.encode()).hexdigest()[:32])
+        np.save(self._get_path(self.centers_dir, filename), center_array)
+        self._files[center_name] = filename
+        self.center_names.append(center_name)
+        self._add_sums(center_array, 1)
+        self._save()
+
+    def remove_center(self, center_name):
+        """ remove a stored center, subtract its terms from sums
+        """
+        center_name = str(center_name)
+        if center_name not in self._files:
+            raise KeyError('Center {} not in store'.format(center_name))
+        center_array = self.load_center(center_name)
+        self._add_sums(center_array, -1)
+        path = self._get_center_path(center_name)
+        self.center_names.remove(center_name)
+        self._files.pop(center_name)
+        self._save()
+        os.remove(path)
+
+    def load_center(self, center_name, mmap_mode=None):
+        """ return stored (2, voxels) effect sizes and variances of a center
+        """
+        return np.load(self._get_center_path(center_name), mmap_mode=mmap_mode)
+
+    def rebuild(self):
+        """ caculate sums again from stored centers, drops rounding errors
+            accumulated by lots of add_center() and remove_center()
+        """
+        self.sums = np.zeros_like(self.sums)
+        self.nonfinite_counts = np.zeros_like(self.nonfinite_counts)
+        for center_name in self.center_names:
+            self._add_sums(self.load_center(center_name), 1)
+        self._save()
+
+    def get_sums(self):
+        """ sums of all stored centers, sums of voxels have non-finite terms
+            are caculated from stored centers
+        """
+        sums = self.sums
+        nonfinite_indexes = np.flatnonzero(self.nonfinite_counts)
+        if len(nonfinite_indexes):
+            sums = sums.copy()
+            sums[:, nonfinite_indexes] = get_sums(*self._stack(nonfinite_indexes))
+        return sums
+
+    def _stack(self, block):
+        center_arrays = [self.load_center(center_name, mmap_mode='r')[:, block]
+                         for center_name in self.center_names]
+        return (np.stack([center_array[0] for center_array in center_arrays]),
+                np.stack([center_array[1] for center_array in center_arrays]))
+
+    def caculate(self, model_type='random', tau2_method='dl', block_size=None):
+        """ pooled results of stored voxels
+        Args:
+            model_type: 'fixed' or 'random', meta analysis model.
+            tau2_method: random model's tau square method. 'dl' is caculated
+                         from sums, others stack stored centers block by block.
+            block_size: int, number of voxels caculated at once, default all.
+        Return:
+            results: ndarray, shape (len(engine.RESULT_NAMES), voxels)
+        """
+        if not self.center_names:
+            raise ValueError('No center in store')
+        model_type = model_type.lower()
+        if model_type not in ('random', 'fixed'):
+            raise ValueError('Unsupported model: {}'.format(model_type))
+        voxel_count = self.sums.shape[1]
+        if model_type == 'random' and tau2_method.lower() != 'dl':
+            results = np.empty((len(engine.RESULT_NAMES), voxel_count))
+            for block in utils.gen_blocks(voxel_count, block_size or voxel_count):
+                results[:, block] = engine.caculate(*self._stack(block),
+                                                    model_type, tau2_method)
+            return results
+
+        (sum_weights, sum_weighted_effect_sizes,
+         sum_weighted_squares, sum_square_weights) = self.get_sums()
+        df = len(self.center_names) - 1
+        with np.errstate(divide='ignore', invalid='ignore'):
+            q = sum_weighted_squares - np.square(sum_weighted_effect_sizes) / sum_weights
+            if df == 0:
+                # one center, sums left by removed centers are rounding error
+                q = np.where(np.isfinite(q), 0, q)
+            if model_type == 'fixed':
+                total_variance = 1 / sum_weights
+                total_effect_size = sum_weighted_effect_sizes * total_variance
+            else:
+                c = sum_weights - sum_square_weights / sum_weights
+                tau_square = model.get_dl_tau_square(q, df, c, sum_weights)
+                # random weights need every center's variance, one pass over store
+                sum_random_weights = np.zeros(voxel_count)
+                sum_random_effect_sizes = np.zeros(voxel_count)
+                for center_name in self.center_names:
+                    effect_sizes, variances = self.load_center(center_name, mmap_mode='r')
+                    random_weights = np.reciprocal(variances + tau_square)
+                    sum_random_weights += random_weights
+                    sum_random_effect_sizes += random_weights * effect_sizes
+                total_variance = 1 / sum_random_weights
+                total_effect_size = sum_random_effect_sizes * total_variance
+            total_standard_error = np.sqrt(total_variance)
+            total_lower_limit, total_upper_limit = model.get_confidence_intervals(
+                                        total_effect_size, total_standard_error)
+            z = model.get_z_value(total_effect_size, total_standard_error)
+            p = model.get_p_from_z(z)
+        return np.stack((total_effect_size, total_variance, total_standard_error,
+                         total_lower_limit, total_upper_limit, q, z, p))
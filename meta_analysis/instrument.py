@@ -0,0 +1,204 @@
+""" instrument module, stage timing, throughput, memory and progress of a run
+
+An Instrument is activated as a context manager, then stages reported by
+utils, main and engine code inside the block are timed and counted. Code
+outside any Instrument pays only a check of an empty list.
+
+Stages reported:
+    load: wall time of loading groups' files, files
+    decode: reading and decoding one nii, summed over loader threads or
+            processes, workers' timings are sent back with their arrays
+    reduce: accumulating one loaded array into mean, std
+    prepare: loading or flattening means, stds before caculation
+    caculate: effect sizes and meta analysis of a block, voxels or regions
+    write: densify results or flush sink
+Stages could nest, e.g. load is inside prepare. Callbacks are called
+outside the lock, so they may call get_summary() or progress().
+
+Function:
+    get_active(): return innermost active Instrument or None
+    stage(name, voxels, files): time a stage if an Instrument is active
+    record(name, elapsed, voxels, files): add a stage timed elsewhere
+    progress(name, done, total): report progress if an Instrument is active
+    get_peak_rss(): peak resident memory of this process in bytes
+
+Class:
+    Instrument(object): collect stages, progress, peak memory of a run
+
+Author: Kang Xiaopeng
+Data: 2026/10/17
+E-mail: kangxiaopeng2018@ia.ac.cn
+
+This file is part of meta_analysis.
+
+meta_analysis is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+meta_analysis is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with meta_analysis.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # not available on windows
+    resource = None
+
+_active = []
+
+def get_active():
+    return _active[-1] if _active else None
+
+@contextmanager
+def stage(name, voxels=0, files=0):
+    instrument = get_active()
+    if instrument is None:
+        yield
+        return
+    with instrument.stage(name, voxels, files):
+        yield
+
+def record(name, elapsed, voxels=0, files=0):
+    instrument = get_active()
+    if instrument is not None:
+        instrument.record(name, elapsed, voxels, files)
+
+def progress(name, done, total):
+    instrument = get_active()
+    if instrument is not None:
+        instrument.progress(name, done, total)
+
+def get_peak_rss():
+    """ peak resident memory of this process in bytes, None if unknown
+    """
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macOS
+    if sys.platform != 'darwin':
+        peak_rss *= 1024
+    return peak_rss
+
+class Instrument(object):
+    """ collect stages' time, voxels, files, progress and peak memory of a run
+
+    Attributes:
+        callbacks: list of functions, called with every event dict,
+                   {'event': 'stage', 'stage', 'time', 'voxels', 'files'} or
+                   {'event': 'progress', 'stage', 'done', 'total', 'fraction'}
+        log_interval: float, seconds between progress logs, None means no log
+        log: function to write progress log, default print
+        stages: dict, {name: {'time', 'calls', 'voxels', 'files'}}
+        progresses: dict, {name: latest fraction}
+
+    Function:
+        stage(name, voxels, files): context manager times a stage
+        record(name, elapsed, voxels, files): add a stage timed elsewhere
+        progress(name, done, total): report progress of a stage
+        get_summary(): return summary dict of the run
+        dump(path): save summary as JSON
+    """
+    def __init__(self, callbacks=None, log_interval=None, log=print):
+        super().__init__()
+        self.callbacks = list(callbacks or [])
+        self.log_interval = log_interval
+        self.log = log
+        self.stages = {}
+        self.progresses = {}
+        self.start_time = None
+        self.end_time = None
+        self._last_log_time = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self.start_time = time.perf_counter()
+        self.end_time = None
+        self._last_log_time = self.start_time
+        _active.append(self)
+        return self
+
+    def __exit__(self, *args):
+        self.end_time = time.perf_counter()
+        _active.remove(self)
+
+    def _emit(self, event):
+        for callback in self.callbacks:
+            callback(event)
+
+    @contextmanager
+    def stage(self, name, voxels=0, files=0):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start, voxels, files)
+
+    def record(self, name, elapsed, voxels=0, files=0):
+        """ add a stage timed elsewhere, e.g. inside a worker process
+        """
+        with self._lock:
+            record = self.stages.setdefault(name, {'time': 0., 'calls': 0,
+                                                   'voxels': 0, 'files': 0})
+            record['time'] += elapsed
+            record['calls'] += 1
+            record['voxels'] += int(voxels)
+            record['files'] += int(files)
+        # callbacks run without lock, they may call get_summary() or progress()
+        self._emit({'event': 'stage', 'stage': name, 'time': elapsed,
+                    'voxels': int(voxels), 'files': int(files)})
+
+    def progress(self, name, done, total):
+        fraction = done / total if total else 1.
+        now = time.perf_counter()
+        with self._lock:
+            self.progresses[name] = fraction
+            should_log = (self.log_interval is not None and
+                          (now - self._last_log_time >= self.log_interval or done >= total))
+            if should_log:
+                self._last_log_time = now
+        self._emit({'event': 'progress', 'stage': name, 'done': done,
+                    'total': total, 'fraction': fraction})
+        if not should_log:
+            return
+        peak_rss = get_peak_rss()
+        self.log('[{}] {}/{} {:.1%}, {:.1f}s, peak rss {}'.format(
+                 name, done, total, fraction, now - self.start_time,
+                 'unknown' if peak_rss is None else '{:.1f}MB'.format(peak_rss / 2**20)))
+
+    def get_summary(self):
+        """ summary of the run
+        Return:
+            summary: dict, {'total_time', 'peak_rss', 'progress',
+                            'stages': {name: {'time', 'calls', 'voxels', 'files',
+                                              'voxels_per_second', 'files_per_second'}}}
+        """
+        end_time = self.end_time if self.end_time is not None else time.perf_counter()
+        stages = {}
+        with self._lock:
+            for name, record in self.stages.items():
+                record = dict(record)
+                for count_name in ('voxels', 'files'):
+                    rate = None
+                    if record[count_name] and record['time'] > 0:
+                        rate = record[count_name] / record['time']
+                    record['{}_per_second'.format(count_name)] = rate
+                stages[name] = record
+            progresses = dict(self.progresses)
+        return {'total_time': end_time - self.start_time if self.start_time else 0.,
+                'peak_rss': get_peak_rss(), 'progress': progresses, 'stages': stages}
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.get_summary(), f, indent=2)
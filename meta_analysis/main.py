@@ -2,10 +2,34 @@
 
 Function:
     pop_center_and_group(center_dict, label1, label2): pop inrelvant center and group.
+    get_volume_shape(center_dict): shape of first nii in center_dict
+    gen_msn_dict(center_dict, dtype, _mask, n_jobs): caculate mean, std, count of every group
+    stack_msn(center_mean_dict, center_std_dict, center_count_dict,
+              label1, label2, indexes): stack two groups' mean, std, count of all centers
+    get_center_names(center_mean_dict, label1, label2): get names of centers have both groups
+    share_msn(shared_dir, ...): same as stack_msn(), but stack into shared memory mapped file
+    flatten_msn(center_mean_dict, center_std_dict, _mask, is_masked): flatten groups'
+                mean, std, find voxels to caculate
+    prepare_msn(label1, label2, center_dict, ...): load or flatten groups' mean, std, count
     voxelwise_meta_analysis(center_dict, label1, label2,
                             mask, is_filepath, model, method): perform voxelwise meta analysis
+    resumable_meta_analysis(label1, label2, checkpoint_dir, center_dict, ...): perform
+                            voxelwise meta analysis, checkpoint finished blocks and
+                            resume after crash
+    multi_contrast_meta_analysis(contrasts, center_dict, ...): perform voxelwise meta
+                            analysis of lots of (label1, label2) contrasts at once
+    voxelwise_leave_one_out(label1, label2, center_dict, ...): perform voxelwise
+                            leave-one-center-out sensitivity analysis
+    voxelwise_permutation_test(label1, label2, center_dict, ...): perform voxelwise
+                            permutation test, FWE corrected by max statistic
+    incremental_meta_analysis(store, label1, label2, center_dict, ...): add new centers
+                            to a persisted store, caculate results of all stored centers
     region_volume_meta_analysis(center_dict, label1, label2, 
                             mask, is_filepath, model, method): perform region volume meta analysis
+    csv_meta_analysis(csvpath, header, data_type, method, model_type, tau2_method): perform
+                            meta analysis of one outcome in csv file
+    batch_csv_meta_analysis(path, outcome_column, ...): perform meta analysis of
+                            lots of outcomes in long format csv or parquet file
 
 Author: Kang Xiaopeng
 Data: 2020/03/05
@@ -27,12 +51,23 @@ You should have received a copy of the GNU General Public License
 along with meta_analysis.  If not, see <https://www.gnu.org/licenses/>.
 """
 import copy
+import hashlib
+import os
+from functools import partial
 
 import numpy as np
-import pandas as pd
 
 from . import model
 from . import data
+from . import cache
+from . import checkpoint
+from . import engine
+from . import incremental
+from . import instrument
+from . import parallel
+from . import permutation
+from . import result
+from . import sensitivity
 from . import utils
 from . import mask
 
@@ -53,15 +88,73 @@ def pop_center_and_group(center_dict, label1, label2):
     Return:
         center_dict: dict after pop. 
     """
-    for k, group_dict in center_dict.items():
+    for k in list(center_dict.keys()):
+        group_dict = center_dict[k]
         if label1 not in group_dict and label2 not in group_dict:
             center_dict.pop(k)
-        for label, datas in group_dict.items():
+            continue
+        for label in list(group_dict.keys()):
             if label != label1 and label != label2:
                 group_dict.pop(label)
     return center_dict
 
-def gen_msn_dict(center_dict, dtype=np.float32):
+def get_volume_shape(center_dict):
+    """ shape of first nii in center_dict, None if no file
+    """
+    for group_dict in center_dict.values():
+        for filepathes in group_dict.values():
+            if len(filepathes):
+                return utils.get_nii_shape(filepathes[0])
+    return None
+
+def gen_msn_dict(center_dict, dtype=np.float32, _mask=None,
+                 n_jobs=1, backend='thread', summary_cache=None):
+    """ load every group's files, caculate mean, std, count
+    Args:
+        center_dict: {center1:{group1:[filepath1, filepath2],
+                               group2:[filepath3, filepath4]}
+                      center2:{...}}
+        dtype: dtype of loaded arrays
+        _mask: Mask instance, has same shape as nii. If not None, only load
+               in-mask voxels, means and stds are 1d arrays ordered as
+               np.flatnonzero(_mask.data)
+        n_jobs: int, count of workers load files of all centers and groups
+                at once, -1 means all cpus
+        backend: 'thread' or 'process', pass to utils.load_mean_std_n_dict()
+        summary_cache: cache.SummaryCache instance or cache directory,
+                       groups found in cache are not loaded again.
+    Return:
+        center_mean_dict, center_std_dict, center_count_dict:
+            same structure as center_dict, holds mean, std, count
+    """
+    mask_index = None
+    if _mask is not None:
+        # flatten mask is unravelled to volume's shape
+        mask_index = utils.get_mask_index(_mask.data, get_volume_shape(center_dict))
+    if isinstance(summary_cache, str):
+        summary_cache = cache.SummaryCache(summary_cache)
+
+    msn_dict = {}
+    key_dict = {}
+    pathes_dict = {}
+    for center_name, group_dict in center_dict.items():
+        for label, filepathes in group_dict.items():
+            if summary_cache is not None:
+                key = summary_cache.get_key(filepathes, dtype, mask_index)
+                msn = summary_cache.get(key)
+                if msn is not None:
+                    msn_dict[(center_name, label)] = msn
+                    continue
+                key_dict[(center_name, label)] = key
+            pathes_dict[(center_name, label)] = filepathes
+    loaded_msn_dict = utils.load_mean_std_n_dict(pathes_dict, dtype=dtype,
+                                                 mask_index=mask_index,
+                                                 n_jobs=n_jobs, backend=backend)
+    for group_key, msn in loaded_msn_dict.items():
+        if summary_cache is not None:
+            summary_cache.set(key_dict[group_key], *msn)
+    msn_dict.update(loaded_msn_dict)
+
     center_mean_dict = {}
     center_std_dict = {}
     center_count_dict = {}
@@ -69,12 +162,10 @@ def gen_msn_dict(center_dict, dtype=np.float32):
         group_mean_dict = {}
         group_std_dict = {}
         group_count_dict = {}
-        for label, filepathes in group_dict.items():
-            datas = utils.load_arrays(filepathes, dtype=dtype)
-            mean, std, count = utils.cal_mean_std_n(datas)
-            
-            group_mean_dict[label] = mean.flatten()
-            group_std_dict[label] = std.flatten()
+        for label in group_dict:
+            mean, std, count = msn_dict[(center_name, label)]
+            group_mean_dict[label] = mean
+            group_std_dict[label] = std
             group_count_dict[label] = count
 
         center_mean_dict[center_name] = group_mean_dict
@@ -82,12 +173,192 @@ def gen_msn_dict(center_dict, dtype=np.float32):
         center_count_dict[center_name] = group_count_dict
     return center_mean_dict, center_std_dict, center_count_dict
 
+def get_center_names(center_mean_dict, label1, label2):
+    """ return names of centers which have both groups
+    """
+    center_names = []
+    for center_name, group_dict in center_mean_dict.items():
+        if label1 not in group_dict or label2 not in group_dict:
+            print('Couln\'t found both [label:{}, {}] in [center:{}]'.format(
+                  label1, label2, center_name))
+            continue
+        center_names.append(center_name)
+    if not center_names:
+        raise ValueError('No center has both [label:{}, {}]'.format(label1, label2))
+    return center_names
+
+def stack_msn(center_mean_dict, center_std_dict, center_count_dict,
+              label1, label2, indexes=None, center_names=None):
+    """ stack two groups' mean, std, count of all centers
+        centers which doesn't have both groups are skipped.
+    Args:
+        center_mean_dict: {center1:{group1:mean1, group2:mean2}, ...}
+        center_std_dict: same structure as center_mean_dict, holds std
+        center_count_dict: same structure as center_mean_dict, holds count
+        label1: label of experimental group
+        label2: label of control group
+        indexes: flatten indexes or slice of voxels to stack, None means all
+        center_names: centers to stack, default get_center_names()
+    Return:
+        m1, s1, n1, m2, s2, n2: ndarray, means and stds are shaped
+                                (centers, voxels), counts (centers, 1)
+    """
+    if center_names is None:
+        center_names = get_center_names(center_mean_dict, label1, label2)
+    m1, s1, n1, m2, s2, n2 = [], [], [], [], [], []
+    for center_name in center_names:
+        for label, means, stds, counts in ((label1, m1, s1, n1),
+                                           (label2, m2, s2, n2)):
+            mean = center_mean_dict[center_name][label]
+            std = center_std_dict[center_name][label]
+            if indexes is not None:
+                mean, std = mean[indexes], std[indexes]
+            means.append(mean)
+            stds.append(std)
+            counts.append([center_count_dict[center_name][label]])
+    return (np.stack(m1), np.stack(s1), np.asarray(n1),
+            np.stack(m2), np.stack(s2), np.asarray(n2))
+
+def share_msn(shared_dir, center_mean_dict, center_std_dict, center_count_dict,
+              label1, label2, indexes=None, center_names=None):
+    """ same as stack_msn(), but stack means and stds into one SharedArray
+    Args:
+        shared_dir: parallel.SharedDir instance
+        others: same as stack_msn()
+    Return:
+        inputs: SharedArray, shape (4, centers, voxels), holds m1, s1, m2, s2
+        n1, n2: ndarray, counts, shape (centers, 1)
+    """
+    if center_names is None:
+        center_names = get_center_names(center_mean_dict, label1, label2)
+    if indexes is None:
+        indexes = slice(None)
+    inputs = None
+    for i, center_name in enumerate(center_names):
+        arrays = (center_mean_dict[center_name][label1],
+                  center_std_dict[center_name][label1],
+                  center_mean_dict[center_name][label2],
+                  center_std_dict[center_name][label2])
+        for j, array in enumerate(arrays):
+            array = array[indexes]
+            if inputs is None:
+                inputs = shared_dir.create('inputs', (4, len(center_names), len(array)),
+                                           array.dtype)
+            inputs.get_array()[j, i] = array
+    n1 = np.asarray([[center_count_dict[center_name][label1]] for center_name in center_names])
+    n2 = np.asarray([[center_count_dict[center_name][label2]] for center_name in center_names])
+    return inputs, n1, n2
+
+def _caculate_msn_block(center_mean_dict, center_std_dict, center_count_dict,
+                        label1, label2, indexes, center_names, method, model_type,
+                        tau2_method, outputs, output_dtype, max_iter=100, tol=1e-10):
+    m1, s1, n1, m2, s2, n2 = stack_msn(center_mean_dict, center_std_dict,
+                                       center_count_dict, label1, label2,
+                                       indexes, center_names)
+    effect_sizes, variances = engine.get_effect_sizes(method, m1, s1, n1, m2, s2, n2)
+    return engine.caculate(effect_sizes, variances, model_type, tau2_method,
+                           outputs, output_dtype, max_iter, tol)
+
+def _voxelwise_block(block, inputs, n1, n2, results, method, model_type, tau2_method,
+                     outputs, indexes=None, max_iter=100, tol=1e-10):
+    m1, s1, m2, s2 = inputs.get_array()[:, :, block]
+    effect_sizes, variances = engine.get_effect_sizes(method, m1, s1, n1, m2, s2, n2)
+    block_results = engine.caculate(effect_sizes, variances, model_type, tau2_method,
+                                    outputs, results.dtype, max_iter, tol)
+    if indexes is None:
+        results.get_array()[:, block] = block_results
+    else:
+        # results is a sink.NiiSink
+        results.write(block_results, indexes.get_array()[block])
+
+def flatten_msn(center_mean_dict, center_std_dict, _mask=None, is_masked=False):
+    """ flatten groups' mean, std in place, find voxels to caculate
+    Args:
+        center_mean_dict, center_std_dict: pass to stack_msn()
+        _mask: Mask instance, use to mask array, will only caculate mask region.
+        is_masked: bool, whether means and stds only hold _mask's in-mask voxels
+    Return:
+        origin_shape: tuple, shape of volume
+        flatten_shape: tuple, shape of flatten volume
+        indexes: 1d ndarray, flatten indexes of voxels to caculate
+        stack_indexes: indexes of those voxels in center_mean_dict's arrays,
+                       pass to stack_msn(), None means all
+    """
+    if is_masked:
+        # means and stds only hold in-mask voxels
+        origin_shape = _mask.get_shape()
+        flatten_shape = (_mask.data.size,)
+        indexes = np.flatnonzero(_mask.data)
+        stack_indexes = None
+    else:
+        origin_shape = None
+        flatten_shape = None
+        for center_name, group_dict in center_mean_dict.items():
+            for label, mean in group_dict.items():
+                if origin_shape is None:
+                    origin_shape = mean.shape
+                if flatten_shape is None:
+                    flatten_shape = mean.flatten().shape
+                center_mean_dict[center_name][label] = mean.flatten()
+        for center_name, group_dict in center_std_dict.items():
+            for label, std in group_dict.items():
+                center_std_dict[center_name][label] = std.flatten()
+
+        # check mask shape, flatten mask
+        if _mask is not None:
+            if _mask.get_shape() == origin_shape or _mask.get_shape() == flatten_shape:
+                indexes = np.flatnonzero(_mask.data)
+            else:
+                raise AssertionError('Mask shape couldn\'t fit with data')
+        else:
+            indexes = np.arange(flatten_shape[0])
+        stack_indexes = indexes
+
+    return origin_shape, flatten_shape, indexes, stack_indexes
+
+def prepare_msn(label1, label2, center_dict=None,
+                center_mean_dict=None, center_std_dict=None, center_count_dict=None,
+                _mask=None, dtype=np.float32, load_n_jobs=1, summary_cache=None):
+    """ load or flatten groups' mean, std, count, find voxels to caculate
+    Args:
+        same as voxelwise_meta_analysis()
+    Return:
+        center_mean_dict, center_std_dict, center_count_dict: flatten or masked
+        origin_shape: tuple, shape of volume
+        flatten_shape: tuple, shape of flatten volume
+        indexes: 1d ndarray, flatten indexes of voxels to caculate
+        stack_indexes: indexes of those voxels in center_mean_dict's arrays,
+                       pass to stack_msn(), None means all
+    """
+    is_masked = False
+    if center_mean_dict and center_std_dict and center_count_dict:
+        pass
+    elif center_dict:
+        center_dict = pop_center_and_group(center_dict, label1, label2)
+        center_mean_dict, center_std_dict, center_count_dict = gen_msn_dict(
+                                center_dict, dtype, _mask, n_jobs=load_n_jobs,
+                                summary_cache=summary_cache)
+        is_masked = _mask is not None
+    else:
+        raise ValueError('Need Input For $center_dict$ or\
+                         ($center_mean_dict$, $center_std_dict$,\
+                          $center_count_dict$)')
+
+    origin_shape, flatten_shape, indexes, stack_indexes = flatten_msn(
+                            center_mean_dict, center_std_dict, _mask, is_masked)
+    return (center_mean_dict, center_std_dict, center_count_dict,
+            origin_shape, flatten_shape, indexes, stack_indexes)
+
 def voxelwise_meta_analysis(label1, label2, center_dict=None,
                             center_mean_dict=None,
                             center_std_dict=None,
                             center_count_dict=None,
                             _mask=None, dtype=np.float32,
-                            model_type='random', method='cohen_d'):
+                            model_type='random', method='cohen_d', tau2_method='dl',
+                            block_size=None, max_memory=None, n_jobs=1,
+                            load_n_jobs=1, summary_cache=None,
+                            outputs=None, output_dtype=np.float64, sink=None,
+                            return_masked=False, max_iter=100, tol=1e-10):
     """ perform voxelwise meta analysis
     Args:
         center_dict: dict of dict of group filepathes. pass to load_centers_data()
@@ -100,124 +371,520 @@ def voxelwise_meta_analysis(label1, label2, center_dict=None,
         _mask: Mask instance, use to mask array, will only caculate mask region.
         model: 'fixed' or 'random', meta analysis model.
         method: str, ways to caculate effect size
+        tau2_method: 'dl', 'reml', 'pm' or 'sj', random model's tau square method,
+                     pass to model.get_tau_square()
+        block_size: int, number of voxels caculated at once, default all.
+        max_memory: int, bytes, used to choose block_size if block_size is None.
+        n_jobs: int, count of processes caculate blocks in parallel,
+                -1 means all cpus. Results are identical to n_jobs=1.
+        load_n_jobs: int, count of threads load files, pass to gen_msn_dict()
+        summary_cache: cache.SummaryCache instance or directory, pass to gen_msn_dict()
+        outputs: names in engine.OUTPUT_NAMES, only they and what they depend on
+                 are caculated. Default engine.RESULT_NAMES, same as Model.
+        output_dtype: dtype of results, e.g. np.float32 halves memory
+        sink: sink.NiiSink instance, blocks of results are written into its
+              nii files as they are caculated instead of held in memory.
+              outputs default sink.names, output_dtype is sink's dtype.
+        return_masked: bool, return result.MaskedResult which only holds
+                       caculated voxels instead of dense volumes
+        max_iter: int, maximum iterations of 'reml' and 'pm' tau square, add
+                  'converged' and 'tau2_iter' to outputs to find voxels reached it
+        tol: float, relative tolerance of 'reml' and 'pm' tau square
     Return:
-        results: ndarray, shape=(len(results from Model), data_shape)
+        results: ndarray, shape=(len(outputs), data_shape),
+                 or MaskedResult if return_masked, or sink if sink is given
     """
+    if sink is not None:
+        if outputs is None:
+            outputs = sink.names
+        if tuple(outputs) != sink.names:
+            raise ValueError('Outputs {} differ from sink\'s {}'.format(outputs, sink.names))
+        output_dtype = sink.dtype
+    outputs = engine.get_outputs(outputs)
+    with instrument.stage('prepare'):
+        (center_mean_dict, center_std_dict, center_count_dict,
+         origin_shape, flatten_shape, indexes, stack_indexes) = prepare_msn(
+                    label1, label2, center_dict, center_mean_dict, center_std_dict,
+                    center_count_dict, _mask, dtype, load_n_jobs, summary_cache)
+    if sink is not None and tuple(sink.shape) != tuple(origin_shape):
+        raise ValueError('Sink\'s shape {} differ from data {}'.format(sink.shape, origin_shape))
+
+    center_names = get_center_names(center_mean_dict, label1, label2)
+    voxel_count = len(indexes)
+    n_jobs = parallel.get_n_jobs(n_jobs)
+    if block_size is None:
+        if max_memory is not None:
+            block_size = engine.get_block_size(len(center_names), max_memory / n_jobs)
+        else:
+            # several blocks per process to balance load
+            block_size = max(-(-voxel_count // (4 * n_jobs)), 1)
+    blocks = list(utils.gen_blocks(voxel_count, block_size))
+
+    results_len = len(outputs)
+    if sink is None:
+        # only caculated voxels, densified at last
+        results_array = np.empty((results_len, voxel_count), dtype=output_dtype)
+    if n_jobs == 1:
+        # perform meta analysis block by block, write block results to results array
+        for i, block in enumerate(blocks):
+            if stack_indexes is None:
+                block_stack_indexes = block
+            else:
+                block_stack_indexes = stack_indexes[block]
+            with instrument.stage('caculate', voxels=block.stop - block.start):
+                block_results = _caculate_msn_block(center_mean_dict, center_std_dict,
+                                                    center_count_dict, label1, label2,
+                                                    block_stack_indexes, center_names,
+                                                    method, model_type, tau2_method,
+                                                    outputs, output_dtype, max_iter, tol)
+            with instrument.stage('write'):
+                if sink is None:
+                    results_array[:, block] = block_results
+                else:
+                    sink.write(block_results, indexes[block])
+            instrument.progress('caculate', i + 1, len(blocks))
+    else:
+        # share stacked inputs and results with workers through memory mapped files
+        with parallel.SharedDir() as shared_dir:
+            inputs, n1, n2 = share_msn(shared_dir, center_mean_dict, center_std_dict,
+                                       center_count_dict, label1, label2,
+                                       stack_indexes, center_names)
+            if sink is None:
+                results = shared_dir.create('results', (results_len, voxel_count),
+                                            output_dtype)
+                shared_indexes = None
+            else:
+                # workers write into sink's files directly
+                results = sink
+                shared_indexes = shared_dir.from_array('indexes', indexes)
+            with instrument.stage('caculate', voxels=voxel_count):
+                parallel.map_blocks(_voxelwise_block, blocks, n_jobs,
+                                    args=(inputs, n1, n2, results, method, model_type,
+                                          tau2_method, outputs, shared_indexes,
+                                          max_iter, tol))
+            instrument.progress('caculate', len(blocks), len(blocks))
+            if sink is None:
+                results_array[...] = results.get_array()
+
+    with instrument.stage('write'):
+        if sink is not None:
+            sink.flush()
+            return sink
+        masked_result = result.MaskedResult(results_array, indexes, origin_shape, outputs)
+        if return_masked:
+            return masked_result
+        return masked_result.to_dense()
+
+def get_job_fingerprint(center_dict, label1, label2, _mask=None, **params):
+    """ fingerprint of a voxelwise job, changes if files, mask or params change
+    """
+    files = {}
+    for center_name, group_dict in center_dict.items():
+        for label in (label1, label2):
+            if label in group_dict:
+                files['{}/{}'.format(center_name, label)] = checkpoint.get_files_stat(
+                                                                group_dict[label])
+    mask_sha = None
+    if _mask is not None:
+        mask_sha = hashlib.sha256(np.ascontiguousarray(_mask.data).tobytes()).hexdigest()
+    return checkpoint.get_fingerprint({'files': files, 'labels': [label1, label2],
+                                       'mask': mask_sha, 'params': params})
+
+def resumable_meta_analysis(label1, label2, checkpoint_dir, center_dict,
+                            _mask=None, dtype=np.float32,
+                            model_type='random', method='cohen_d', tau2_method='dl',
+                            block_size=100000, n_jobs=1, load_n_jobs=1,
+                            summary_cache=None, outputs=None, output_dtype=np.float64,
+                            restart=False, max_iter=100, tol=1e-10):
+    """ perform voxelwise meta analysis of filepathes block by block, every
+        finished block is checkpointed, so a killed run resumes from the
+        last finished block. Results are identical to voxelwise_meta_analysis().
+    Args:
+        checkpoint_dir: str, directory of checkpoint.Checkpoint
+        summary_cache: cache.SummaryCache instance or directory, default
+                       'cache' in checkpoint_dir, so resumed run skips loading nii
+        restart: bool, discard existing checkpoint
+        others: same as voxelwise_meta_analysis()
+    Return:
+        results: result.MaskedResult, data is memory mapped results of checkpoint
+    """
+    outputs = engine.get_outputs(outputs)
+    output_dtype = np.dtype(output_dtype)
+    if summary_cache is None:
+        summary_cache = os.path.join(checkpoint_dir, 'cache')
+    center_dict = pop_center_and_group(center_dict, label1, label2)
+    fingerprint = get_job_fingerprint(center_dict, label1, label2, _mask,
+                                      dtype=np.dtype(dtype).str, model_type=model_type,
+                                      method=method, tau2_method=tau2_method,
+                                      block_size=block_size, outputs=outputs,
+                                      output_dtype=output_dtype.str,
+                                      max_iter=max_iter, tol=tol)
+    _checkpoint = checkpoint.Checkpoint(checkpoint_dir)
+    if restart:
+        _checkpoint.clear()
+    with instrument.stage('prepare'):
+        (center_mean_dict, center_std_dict, center_count_dict,
+         origin_shape, flatten_shape, indexes, stack_indexes) = prepare_msn(
+                    label1, label2, center_dict, _mask=_mask, dtype=dtype,
+                    load_n_jobs=load_n_jobs, summary_cache=summary_cache)
+    center_names = get_center_names(center_mean_dict, label1, label2)
+    blocks = list(utils.gen_blocks(len(indexes), block_size))
+    done = _checkpoint.open(fingerprint, outputs, indexes, origin_shape,
+                            output_dtype, len(blocks))
+    results = _checkpoint.results
+    n_jobs = parallel.get_n_jobs(n_jobs)
+    if n_jobs == 1:
+        for i in range(done, len(blocks)):
+            block = blocks[i]
+            if stack_indexes is not None:
+                block_stack_indexes = stack_indexes[block]
+            else:
+                block_stack_indexes = block
+            with instrument.stage('caculate', voxels=block.stop - block.start):
+                results.get_array()[:, block] = _caculate_msn_block(
+                                    center_mean_dict, center_std_dict, center_count_dict,
+                                    label1, label2, block_stack_indexes, center_names,
+                                    method, model_type, tau2_method, outputs, output_dtype,
+                                    max_iter, tol)
+            _checkpoint.commit(i + 1)
+            instrument.progress('caculate', i + 1, len(blocks))
+    elif done < len(blocks):
+        with parallel.SharedDir() as shared_dir:
+            inputs, n1, n2 = share_msn(shared_dir, center_mean_dict, center_std_dict,
+                                       center_count_dict, label1, label2,
+                                       stack_indexes, center_names)
+            # one block per process at a time, then checkpoint
+            for start in range(done, len(blocks), n_jobs):
+                wave = blocks[start:start + n_jobs]
+                with instrument.stage('caculate', voxels=sum(block.stop - block.start
+                                                             for block in wave)):
+                    parallel.map_blocks(_voxelwise_block, wave, n_jobs,
+                                        args=(inputs, n1, n2, results, method, model_type,
+                                              tau2_method, outputs, None, max_iter, tol))
+                _checkpoint.commit(start + len(wave))
+                instrument.progress('caculate', start + len(wave), len(blocks))
+    return _checkpoint.get_result()
+
+def multi_contrast_meta_analysis(contrasts, center_dict=None,
+                                 center_mean_dict=None,
+                                 center_std_dict=None,
+                                 center_count_dict=None,
+                                 _mask=None, dtype=np.float32,
+                                 model_type='random', method='cohen_d', tau2_method='dl',
+                                 block_size=None, max_memory=None,
+                                 load_n_jobs=1, summary_cache=None,
+                                 outputs=None, output_dtype=np.float64):
+    """ perform voxelwise meta analysis of lots of contrasts.
+        every group's mean, std, count is caculated once, contrasts sharing
+        same centers are caculated together by engine.
+    Args:
+        contrasts: list of (label1, label2), experimental and control group labels
+        others: same as voxelwise_meta_analysis()
+    Return:
+        results_dict: {(label1, label2): results, ...}, results is same as
+                      voxelwise_meta_analysis() returns
+    """
+    contrasts = [tuple(contrast) for contrast in contrasts]
+    outputs = engine.get_outputs(outputs)
+    is_masked = False
     if center_mean_dict and center_std_dict and center_count_dict:
         pass
     elif center_dict:
-        center_dict = pop_center_and_group(center_dict, label1, label2)
-        center_mean_dict, center_std_dict, center_count_dict = gen_msn_dict(center_dict, dtype)
+        # only load groups used by contrasts
+        labels = set(label for contrast in contrasts for label in contrast)
+        center_dict = {center_name: {label: filepathes
+                                     for label, filepathes in group_dict.items()
+                                     if label in labels}
+                       for center_name, group_dict in center_dict.items()}
+        center_mean_dict, center_std_dict, center_count_dict = gen_msn_dict(
+                                center_dict, dtype, _mask, n_jobs=load_n_jobs,
+                                summary_cache=summary_cache)
+        is_masked = _mask is not None
     else:
         raise ValueError('Need Input For $center_dict$ or\
                          ($center_mean_dict$, $center_std_dict$,\
                           $center_count_dict$)')
+    origin_shape, flatten_shape, indexes, stack_indexes = flatten_msn(
+                            center_mean_dict, center_std_dict, _mask, is_masked)
 
-    origin_shape = None
-    flatten_shape = None
-    for center_name, group_dict in center_mean_dict.items():
-        for label, mean in group_dict.items():
+    # contrasts of same centers are stacked as (centers, contrasts, voxels)
+    contrast_groups = {}
+    for contrast in contrasts:
+        center_names = tuple(get_center_names(center_mean_dict, *contrast))
+        contrast_groups.setdefault(center_names, []).append(contrast)
+
+    voxel_count = len(indexes)
+    results_len = len(outputs)
+    results_dict = {}
+    for center_names, group_contrasts in contrast_groups.items():
+        group_block_size = block_size
+        if group_block_size is None:
+            if max_memory is not None:
+                group_block_size = engine.get_block_size(
+                        len(center_names) * len(group_contrasts), max_memory)
+            else:
+                group_block_size = max(voxel_count, 1)
+        results_array = np.zeros((len(group_contrasts), results_len)+flatten_shape,
+                                 dtype=output_dtype)
+        for block in utils.gen_blocks(voxel_count, group_block_size):
+            if stack_indexes is None:
+                block_stack_indexes = block
+            else:
+                block_stack_indexes = stack_indexes[block]
+            msns = [stack_msn(center_mean_dict, center_std_dict, center_count_dict,
+                              label1, label2, block_stack_indexes, center_names)
+                    for label1, label2 in group_contrasts]
+            m1, s1, n1, m2, s2, n2 = [np.stack(arrays, axis=1) for arrays in zip(*msns)]
+            effect_sizes, variances = engine.get_effect_sizes(method, m1, s1, n1, m2, s2, n2)
+            results = engine.caculate(effect_sizes, variances, model_type, tau2_method,
+                                      outputs, output_dtype)
+            results_array[:, :, indexes[block]] = np.swapaxes(results, 0, 1)
+        for contrast, results in zip(group_contrasts, results_array):
+            results_dict[contrast] = np.reshape(results, (results_len,)+origin_shape)
+    return results_dict
+
+def voxelwise_leave_one_out(label1, label2, center_dict=None,
+                            center_mean_dict=None,
+                            center_std_dict=None,
+                            center_count_dict=None,
+                            _mask=None, dtype=np.float32,
+                            model_type='random', method='cohen_d', tau2_method='dl',
+                            alpha=0.05, block_size=None,
+                            load_n_jobs=1, summary_cache=None):
+    """ perform voxelwise leave-one-center-out sensitivity analysis,
+        all jackknife maps are caculated in one pass.
+    Args:
+        alpha: float, significance level used to find driving center
+        others: same as voxelwise_meta_analysis()
+    Return:
+        summary: ndarray, shape=(len(sensitivity.SUMMARY_NAMES), data_shape),
+                 min z, max z, max p, index of driving center, robust or not
+        loo_results: ndarray, shape=(centers, len(sensitivity.LOO_RESULT_NAMES), data_shape),
+                     loo_results[i] holds es, z, p without center_names[i]
+        center_names: list of center names
+    """
+    (center_mean_dict, center_std_dict, center_count_dict,
+     origin_shape, flatten_shape, indexes, stack_indexes) = prepare_msn(
+                label1, label2, center_dict, center_mean_dict, center_std_dict,
+                center_count_dict, _mask, dtype, load_n_jobs, summary_cache)
+    center_names = get_center_names(center_mean_dict, label1, label2)
+    voxel_count = len(indexes)
+    if block_size is None:
+        block_size = max(voxel_count, 1)
+
+    summary_len = len(sensitivity.SUMMARY_NAMES)
+    loo_len = len(sensitivity.LOO_RESULT_NAMES)
+    summary = np.zeros((summary_len,)+flatten_shape)
+    loo_results = np.zeros((len(center_names), loo_len)+flatten_shape)
+    for block in utils.gen_blocks(voxel_count, block_size):
+        if stack_indexes is None:
+            block_stack_indexes = block
+        else:
+            block_stack_indexes = stack_indexes[block]
+        m1, s1, n1, m2, s2, n2 = stack_msn(center_mean_dict, center_std_dict,
+                                           center_count_dict, label1, label2,
+                                           block_stack_indexes, center_names)
+        effect_sizes, variances = engine.get_effect_sizes(method, m1, s1, n1, m2, s2, n2)
+        block_results = sensitivity.leave_one_out(effect_sizes, variances,
+                                                  model_type, tau2_method)
+        loo_results[:, :, indexes[block]] = block_results
+        summary[:, indexes[block]] = sensitivity.summarize(block_results, alpha)
+    summary = np.reshape(summary, (summary_len,)+origin_shape)
+    loo_results = np.reshape(loo_results, (len(center_names), loo_len)+origin_shape)
+    return summary, loo_results, center_names
+
+def voxelwise_permutation_test(label1, label2, center_dict=None,
+                               center_mean_dict=None,
+                               center_std_dict=None,
+                               center_count_dict=None,
+                               _mask=None, dtype=np.float32,
+                               model_type='random', method='cohen_d', tau2_method='dl',
+                               n_perm=5000, seed=None, n_jobs=1, perm_batch=None):
+    """ perform voxelwise permutation test, FWE corrected by max statistic.
+        If center_dict is given, group labels are permuted within every center,
+        all subjects' in-mask voxels are held in memory.
+        Otherwise centers' effect sizes are randomly sign flipped.
+    Args:
+        center_dict, center_mean_dict, center_std_dict, center_count_dict,
+        label1, label2, _mask, dtype, model_type, method, tau2_method:
+            same as voxelwise_meta_analysis()
+        n_perm: int, count of permutations
+        seed: random seed, results don't depend on n_jobs
+        n_jobs: int, count of processes, -1 means all cpus
+        perm_batch: int, count of permutations caculated at once
+    Return:
+        results: ndarray, shape=(len(permutation.PERMUTATION_RESULT_NAMES), data_shape)
+                 holds z and FWE corrected p
+        null_distribution: ndarray, maximum |z| of every permutation
+    """
+    if center_dict:
+        center_dict = pop_center_and_group(center_dict, label1, label2)
+        mask_index = None
+        if _mask is not None:
+            mask_index = utils.get_mask_index(_mask.data, get_volume_shape(center_dict))
+        datas, labels_list = [], []
+        origin_shape = None
+        for center_name, group_dict in center_dict.items():
+            if label1 not in group_dict or label2 not in group_dict:
+                continue
+            filepathes = group_dict[label1] + group_dict[label2]
             if origin_shape is None:
-                origin_shape = mean.shape
-            if flatten_shape is None:
-                flatten_shape = mean.flatten().shape
-            center_mean_dict[center_name][label] = mean.flatten()
-    for center_name, group_dict in center_std_dict.items():
-        for label, std in group_dict.items():
-            center_std_dict[center_name][label] = std.flatten()
-
-    # check mask shape, flatten mask
-    if _mask is not None:
-        if _mask.get_shape() == origin_shape:
-            _mask = mask.Mask(_mask.data.flatten())
-        elif _mask.get_shape() == flatten_shape:
-            pass
+                origin_shape = utils.get_nii_shape(filepathes[0])
+            datas.append(utils.load_masked_arrays(filepathes, mask_index, dtype))
+            labels_list.append(np.arange(len(filepathes)) < len(group_dict[label1]))
+        if not datas:
+            raise ValueError('No center has both [label:{}, {}]'.format(label1, label2))
+        if _mask is not None:
+            origin_shape = _mask.get_shape()
+            indexes = np.flatnonzero(_mask.data)
         else:
-            raise AssertionError('Mask shape couldn\'t fit with data')
-        indexes = _mask.get_nonzero_index()
+            indexes = np.arange(datas[0].shape[1])
+        flatten_shape = (int(np.prod(origin_shape)),)
+        z, p_fwe, null_distribution = permutation.label_permutation_test(
+                datas, labels_list, n_perm=n_perm, method=method, model_type=model_type,
+                tau2_method=tau2_method,
+                seed=seed, n_jobs=n_jobs, perm_batch=perm_batch)
     else:
-        indexes = np.transpose(np.nonzero(np.ones(flatten_shape)))
+        (center_mean_dict, center_std_dict, center_count_dict,
+         origin_shape, flatten_shape, indexes, stack_indexes) = prepare_msn(
+                    label1, label2, None, center_mean_dict, center_std_dict,
+                    center_count_dict, _mask, dtype)
+        m1, s1, n1, m2, s2, n2 = stack_msn(center_mean_dict, center_std_dict,
+                                           center_count_dict, label1, label2,
+                                           stack_indexes)
+        effect_sizes, variances = engine.get_effect_sizes(method, m1, s1, n1, m2, s2, n2)
+        z, p_fwe, null_distribution = permutation.sign_flip_test(
+                effect_sizes, variances, n_perm=n_perm, model_type=model_type,
+                tau2_method=tau2_method,
+                seed=seed, n_jobs=n_jobs, perm_batch=perm_batch)
 
-    results_array = None
-    for index in indexes:
-        # construct Centers for indexed voxel
-        center_list = []
-        for center_name, group_dict in center_mean_dict.items():
-            groups = []
-            for label, _ in group_dict.items():
-                mean = center_mean_dict[center_name][label][index][0]
-                std = center_std_dict[center_name][label][index][0]
-                count = center_count_dict[center_name][label]
-                group = data.NumericalGroup(label=label, mean=mean, std=std, count=count)
-                groups.append(group)
-            center = data.Center(center_name, groups)
-            center_list.append(center)
-        centers = data.Centers(center_list)
-        studies = centers.gen_studies(label1, label2, method)
-        # perform meta analysis
-        if model_type.lower() == 'random':
-            result_model = model.RandomModel(studies)
-        elif model_type.lower() == 'fixed':
-            result_model = model.FixedModel(studies)
-        results = result_model.get_results()
-        # init results_array
-        if results_array is None:
-            results_len = len(results)
-            results_array = np.zeros(flatten_shape+(results_len,))
-        # write results to results array
-        results_array[index] = results
-    # reshape results_array to origin shape
-    results_array = np.transpose(results_array)
+    results_len = len(permutation.PERMUTATION_RESULT_NAMES)
+    results_array = np.zeros((results_len,)+flatten_shape)
+    results_array[0, indexes] = z
+    results_array[1, indexes] = p_fwe
     results_array = np.reshape(results_array, (results_len,)+origin_shape)
-    return results_array
+    return results_array, null_distribution
+
+def incremental_meta_analysis(store, label1, label2, center_dict=None,
+                              center_mean_dict=None,
+                              center_std_dict=None,
+                              center_count_dict=None,
+                              _mask=None, dtype=np.float32,
+                              model_type='random', method='cohen_d', tau2_method='dl',
+                              remove_centers=None, block_size=None,
+                              load_n_jobs=1, summary_cache=None):
+    """ perform voxelwise meta analysis on a persisted store of centers,
+        only centers not in store yet are loaded and caculated.
+    Args:
+        store: incremental.MetaAnalysisStore instance or store directory
+        remove_centers: list of center names to remove from store
+        block_size: int, number of voxels caculated at once, default all.
+        others: same as voxelwise_meta_analysis(), centers already in store
+                are skipped
+    Return:
+        results: ndarray, shape=(len(results from Model), data_shape),
+                 results of all centers in store
+    """
+    if isinstance(store, str):
+        store = incremental.MetaAnalysisStore(store)
+    for center_name in remove_centers or []:
+        store.remove_center(center_name)
+    store.check(method=method, labels=(label1, label2))
+
+    def is_new(center_name):
+        return str(center_name) not in store.center_names
+    if center_mean_dict and center_std_dict and center_count_dict:
+        center_mean_dict = {center_name: group_dict for center_name, group_dict
+                            in center_mean_dict.items() if is_new(center_name)}
+    elif center_dict:
+        center_dict = {center_name: group_dict for center_name, group_dict
+                       in center_dict.items() if is_new(center_name)}
+
+    if center_mean_dict or center_dict:
+        (center_mean_dict, center_std_dict, center_count_dict,
+         origin_shape, flatten_shape, indexes, stack_indexes) = prepare_msn(
+                    label1, label2, center_dict, center_mean_dict, center_std_dict,
+                    center_count_dict, _mask, dtype, load_n_jobs, summary_cache)
+        if store.shape is None:
+            store.set_volume(origin_shape, indexes, method, (label1, label2))
+        else:
+            store.check(origin_shape, indexes, method, (label1, label2))
+        for center_name in get_center_names(center_mean_dict, label1, label2):
+            m1, s1, n1, m2, s2, n2 = stack_msn(center_mean_dict, center_std_dict,
+                                               center_count_dict, label1, label2,
+                                               stack_indexes, [center_name])
+            effect_sizes, variances = engine.get_effect_sizes(method, m1, s1, n1,
+                                                              m2, s2, n2)
+            store.add_center(center_name, effect_sizes[0], variances[0])
+
+    results_len = len(engine.RESULT_NAMES)
+    results_array = np.zeros((results_len, int(np.prod(store.shape))))
+    results_array[:, store.indexes] = store.caculate(model_type, tau2_method, block_size)
+    return np.reshape(results_array, (results_len,)+store.shape)
 
 def region_volume_meta_analysis(center_dict, label1, label2, 
-                                _mask, model_type='random', method='cohen_d'):
-    """ perform region volume meta analysis
+                                _mask, model_type='random', method='cohen_d',
+                                tau2_method='dl', dtype=np.float32, n_jobs=1,
+                                backend='thread'):
+    """ perform region volume meta analysis.
+        every subject file is read once, all region volumes are reduced in
+        one pass, then regions are meta analysed at once.
     Args:
-        center_dict: dict of dict of group filepathes. pass to gen_array_center()
+        center_dict: dict of dict of group filepathes.
                     {center1:{group1:[filepath1, filepath2],
                               group2:[filepath3, filepath4]}
                      center2:{...}}
         label1: label of experimental group
         label2: label of control group
-        mask: Mask instance, use to mask array, will only caculate mask region.
-        is_filepath: bool, is filepath or ndarray. pass to gen_array_center()
-        model: 'fixed' or 'random', meta analysis model.
+        _mask: Mask instance of atlas, has same shape as nii, nonzero values are region labels.
+        model_type: 'fixed' or 'random', meta analysis model.
         method: str, ways to caculate effect size
+        tau2_method: str, random model's tau square method, pass to model.get_tau_square()
+        dtype: dtype of loaded arrays
+        n_jobs: int, count of workers load files, -1 means all cpus
+        backend: 'thread' or 'process', pass to utils.load_mean_std_n_dict()
     Return:
         results: dict of tuple, {region_label1: result1, ...}
     """
     center_dict = pop_center_and_group(center_dict, label1, label2)
 
-    region_labels = mask.get_labels()
+    # only read labeled voxels, grouped by region, then sum every region
+    region_labels, indptr, indexes = _mask.get_label_index()
+    shape = get_volume_shape(center_dict)
+    if shape is None:
+        shape = _mask.get_shape()
+    elif int(np.prod(shape)) != _mask.data.size:
+        raise AssertionError('Mask shape couldn\'t fit with data')
+    mask_index = np.unravel_index(indexes, shape)
+    reducer = partial(utils.sum_by_segment, starts=indptr[:-1])
+
+    pathes_dict = {}
+    for center_name, group_dict in center_dict.items():
+        for label, filepathes in group_dict.items():
+            pathes_dict[(center_name, label)] = filepathes
+    msn_dict = utils.load_mean_std_n_dict(pathes_dict, dtype=dtype,
+                                          mask_index=mask_index, n_jobs=n_jobs,
+                                          backend=backend, reducer=reducer)
+    center_mean_dict, center_std_dict, center_count_dict = {}, {}, {}
+    for (center_name, label), (mean, std, count) in msn_dict.items():
+        center_mean_dict.setdefault(center_name, {})[label] = mean
+        center_std_dict.setdefault(center_name, {})[label] = std
+        center_count_dict.setdefault(center_name, {})[label] = count
+
+    with instrument.stage('caculate', voxels=len(region_labels)):
+        m1, s1, n1, m2, s2, n2 = stack_msn(center_mean_dict, center_std_dict,
+                                           center_count_dict, label1, label2)
+        effect_sizes, variances = engine.get_effect_sizes(method, m1, s1, n1, m2, s2, n2)
+        results = engine.caculate(effect_sizes, variances, model_type, tau2_method)
+    instrument.progress('caculate', 1, 1)
+
     results_dict = {}
-    for region_label in region_labels:
-        center_list = []
-        for center_name, group_dict in center_dict.items():
-            groups = []
-            for label, filepathes in group_dict.items():
-                region_volumes = []
-                datas = utils.load_arrays(filepathes)
-                for data in datas:
-                    region_volume = _mask.get_masked_volume(data, label)
-                    region_volumes.append(region_volume)
-                group = data.Group(label, datas=region_volumes)
-                groups.append(group)
-            center = data.Center(center_name, groups)
-            center_list.append(center)
-        centers = data.Centers(center_list)
-        studies = centers.gen_studies(label1, label2, method)
-        if model_type.lower() == 'random':
-            result_model = model.RandomModel(studies)
-        elif model_type.lower() == 'fixed':
-            result_model = model.FixedModel(studies)
-        results = result_model.get_results()
-        results_dict[region_label] = results
+    for i, region_label in enumerate(region_labels):
+        results_dict[region_label] = tuple(results[:, i])
     return results_dict
 
 def csv_meta_analysis(csvpath, header=0, data_type='num',
-                      method='cohen_d', model_type='random'):
+                      method='cohen_d', model_type='random', tau2_method='dl'):
     """ perform meta analysis based on csv file
     Args:
         csvpath: csv filepath,
@@ -225,31 +892,115 @@ def csv_meta_analysis(csvpath, header=0, data_type='num',
                     center_name, m1, s1, n1, m2, s2, n2
                     center1, 1, 1, 10, 2, 2, 20
                     center2, 1.2, 2, 15, 2.2, 2, 15
+                 categorical csv example:
+                    center_name, a, c, b, d
+                    center1, 5, 45, 2, 48
+                    a, c are experimental group's exposed, not exposed count,
+                    b, d are control group's
         header: 0 or None, pandas.read_csv args.
                 None means no header
         model: 'fixed' or 'random', meta analysis model.
-        method: str, ways to caculate effect size
+        method: str, ways to caculate effect size, 'cohen_d', 'hedge_g' for
+                numerical data, 'risk_ratio', 'odds_ratio', 'risk_difference'
+                for categorical data
+        tau2_method: 'dl', 'reml', 'pm' or 'sj', random model's tau square method,
+                     pass to model.get_tau_square()
     Return:
         results: Model instance
     """
+    import pandas as pd
     df = pd.read_csv(csvpath, header=header, index_col=0)
-    studies = []
-    eg_label = 1
-    cg_label = 0
-    for index, row in df.iterrows():
-        if data_type == 'num':
-            m1,s1,n1,m2,s2,n2 = row.values
-            group1 = data.NumericalGroup(eg_label, mean=m1, std=s1, count=n1)
-            group2 = data.NumericalGroup(cg_label, mean=m2, std=s2, count=n2)
-        else:
-            a,c,b,d = row.values
-            group1 = data.CategoricalGroup(eg_label, a, c)
-            group2 = data.CategoricalGroup(cg_label, b, d)
-        center = data.Center(index, [group1, group2])
-        studies.append(center.gen_study(eg_label, cg_label, method))
+    if data_type == 'num':
+        # columns are caculated at once, no Study instance per row
+        m1, s1, n1, m2, s2, n2 = df.to_numpy(dtype=np.float64).T
+        studies = data.StudyTable.from_msn(df.index.to_numpy(), m1, s1, n1,
+                                           m2, s2, n2, method)
+    else:
+        # experimental group's exposed, not exposed are a, c here
+        a, c, b, d = df.to_numpy(dtype=np.float64).T
+        studies = data.StudyTable.from_tables(df.index.to_numpy(), a, c, b, d, method)
     if model_type.lower() == 'random':
-        result_model = model.RandomModel(studies)
+        result_model = model.RandomModel(studies, tau2_method)
     elif model_type.lower() == 'fixed':
         result_model = model.FixedModel(studies)
     return result_model
 
+MSN_COLUMNS = ('m1', 's1', 'n1', 'm2', 's2', 'n2')
+TABLE_COLUMNS = ('a', 'b', 'c', 'd')
+
+def read_table(path):
+    """ read csv or parquet file into DataFrame, DataFrame passes through
+    """
+    import pandas as pd
+    if isinstance(path, pd.DataFrame):
+        return path
+    if str(path).lower().endswith(('.parquet', '.pq')):
+        return pd.read_parquet(path)
+    return pd.read_csv(path)
+
+def batch_csv_meta_analysis(path, outcome_column='outcome', columns=None,
+                            method='cohen_d', model_type='random', tau2_method='dl',
+                            correction=0.5):
+    """ perform meta analysis of lots of outcomes in one long format table,
+        every row is one study of one outcome.
+    Args:
+        path: csv or parquet filepath, or DataFrame
+              csv example:
+                outcome, center, m1, s1, n1, m2, s2, n2
+                gene1, center1, 1, 1, 10, 2, 2, 20
+                gene1, center2, 1.2, 2, 15, 2.2, 2, 15
+                gene2, center1, 0.3, 1, 10, 0.1, 2, 20
+        outcome_column: name of column holds outcome
+        columns: names of (m1, s1, n1, m2, s2, n2) columns, or names of
+                 (effect_size, variance) columns if effect sizes are caculated,
+                 or names of 2x2 tables' (a, b, c, d) columns, see
+                 engine.correct_tables(), if method is categorical.
+                 Default MSN_COLUMNS or TABLE_COLUMNS.
+        method: str, ways to caculate effect size
+        model_type: 'fixed' or 'random', meta analysis model.
+                    'mh' Mantel-Haenszel for 2x2 tables.
+        tau2_method: random model's tau square method, pass to engine.caculate()
+        correction: float, continuity correction of 2x2 tables have a zero cell
+    Return:
+        results: DataFrame, indexed by outcome in order of first appearance,
+                 columns are engine.RESULT_NAMES and 'k', count of studies
+    """
+    import pandas as pd
+    df = read_table(path)
+    if columns is None:
+        columns = TABLE_COLUMNS if engine.is_categorical(method) else MSN_COLUMNS
+    codes, outcomes = pd.factorize(df[outcome_column])
+    if np.any(codes < 0):
+        raise ValueError('{} rows have no {}, rows: {}'.format(
+                         np.count_nonzero(codes < 0), outcome_column,
+                         list(df.index[codes < 0][:10])))
+    values = df[list(columns)].to_numpy(dtype=np.float64)
+    # rows of every outcome are contiguous after stable sort
+    order = np.argsort(codes, kind='stable')
+    values = values[order]
+    counts = np.bincount(codes, minlength=len(outcomes))
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    results = np.empty((len(outcomes), len(engine.RESULT_NAMES)))
+    # outcomes with same count of studies are caculated at once as
+    # (studies, outcomes) arrays, no padding needed for ragged outcomes
+    for k in np.unique(counts):
+        outcome_indexes = np.flatnonzero(counts == k)
+        rows = starts[outcome_indexes, None] + np.arange(k)
+        stacked = values[rows.T]
+        if engine.is_categorical(method):
+            results[outcome_indexes] = engine.caculate_tables(
+                                        *np.moveaxis(stacked, -1, 0), method,
+                                        model_type, tau2_method, correction).T
+            continue
+        if len(columns) == 2:
+            effect_sizes, variances = stacked[..., 0], stacked[..., 1]
+        else:
+            effect_sizes, variances = engine.get_effect_sizes(
+                                        method, *np.moveaxis(stacked, -1, 0))
+        results[outcome_indexes] = engine.caculate(effect_sizes, variances,
+                                                   model_type, tau2_method).T
+    results = pd.DataFrame(results, columns=engine.RESULT_NAMES,
+                           index=pd.Index(outcomes, name=outcome_column))
+    results['k'] = counts
+    return results
@@ -24,7 +24,6 @@ along with meta_analysis.  If not, see <https://www.gnu.org/licenses/>.
 """
 
 import os
-import nibabel as nib
 import numpy as np
 
 def nomalize(data):
@@ -45,9 +44,12 @@ class Mask(object):
         get_mask_data(label): get this mask's array data of label
         get_shape(): get data shape
         get_nonzero_index(): get index of all nozero element
+        get_label_index(): get cached label -> flatten index of all labels
+        get_label_indexes(label): get flatten index of label
         get_masked_data(array, label): get masked array of label
         get_masked_volume(array, label): get sum of masked array of label
         get_labels(): get all label except 0
+        get_label_volumes(array): get all label's masked volume as ndarray
         get_all_masked_volume(): get all label's masked volume
         get_masked_count(): get lebel's count
         get_masked_mean(): get mean value of label region
@@ -56,6 +58,15 @@ class Mask(object):
     def __init__(self, data):
         self.data = data
 
+    @property
+    def data(self):
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        self._data = data
+        self._label_index = None
+
     def get_mask_data(self, label=None):
         """get this mask's array data
 
@@ -75,6 +86,40 @@ class Mask(object):
     def get_nonzero_index(self):
         return np.transpose(np.nonzero(self.data))
 
+    def get_label_index(self):
+        """ build CSR style index of all nonzero labels once, then cache it.
+        Return:
+            labels: 1D ndarray of unique labels without 0
+            indptr: 1D ndarray, indexes[indptr[i]:indptr[i+1]] belong to labels[i]
+            indexes: 1D ndarray, flatten indexes of all labeled elements,
+                     grouped by label, ascending within each label
+        """
+        if self._label_index is None:
+            flatten_data = np.ravel(self.data)
+            nonzero = np.flatnonzero(flatten_data)
+            order = np.argsort(flatten_data[nonzero], kind='stable')
+            indexes = nonzero[order]
+            labels, starts = np.unique(flatten_data[indexes], return_index=True)
+            indptr = np.append(starts, len(indexes))
+            self._label_index = (labels, indptr, indexes)
+        return self._label_index
+
+    def get_label_indexes(self, label):
+        """ return flatten indexes of label, O(in-label elements) after first call
+        """
+        labels, indptr, indexes = self.get_label_index()
+        i = np.searchsorted(labels, label)
+        if i < len(labels) and labels[i] == label:
+            return indexes[indptr[i]:indptr[i+1]]
+        # label 0 or label not exists
+        return np.flatnonzero(np.ravel(self.data) == label)
+
+    def _take(self, array, indexes):
+        array = np.asarray(array)
+        if array.flags.c_contiguous:
+            return np.ravel(array)[indexes]
+        return array[np.unravel_index(indexes, array.shape)]
+
     def get_masked_data(self, array, label=None):
         """return masked array
         Args:
@@ -87,27 +132,33 @@ class Mask(object):
         return np.multiply(mask_data, array)
 
     def get_masked_volume(self, array, label):
-        return np.sum(self.get_masked_data(array, label))
+        if label is None:
+            return np.sum(self.get_masked_data(array, label))
+        return np.sum(self._take(array, self.get_label_indexes(label)))
 
     def get_labels(self):
         """return all unique label, exclude 0 cause it usually doesn't count as label. 
         Return:
             1D ndarray of unique labels without 0
         """
-        unique = np.unique(self.data)
-        return unique[unique != 0]
+        return self.get_label_index()[0]
+
+    def get_label_volumes(self, array):
+        """ return all label's masked volume in one pass
+        Return:
+            1D float64 ndarray, same order as get_labels()
+        """
+        labels, indptr, indexes = self.get_label_index()
+        if not len(labels):
+            return np.zeros(0)
+        return np.add.reduceat(self._take(array, indexes), indptr[:-1], dtype=np.float64)
 
     def get_all_masked_volume(self, array):
-        volumes = {}
-        labels = self.get_labels()
-        for i in labels:
-            volumes[i] = self.get_masked_volume(array, i)
-        return volumes
+        volumes = self.get_label_volumes(array)
+        return dict(zip(self.get_labels(), volumes))
     
     def get_masked_count(self, label):
-        mask_data = self.get_mask_data(label)
-        count = np.sum(mask_data==True)
-        return count
+        return len(self.get_label_indexes(label))
 
     def get_masked_mean(self, array, label):
         volume = self.get_masked_volume(array, label)
@@ -115,8 +166,6 @@ class Mask(object):
         return volume / count
 
     def get_all_masked_mean(self, array):
-        means = {}
-        labels = self.get_labels()
-        for i in labels:
-            means[i] = self.get_masked_mean(array, i)
-        return means
\ No newline at end of file
+        labels, indptr, _ = self.get_label_index()
+        means = self.get_label_volumes(array) / np.diff(indptr)
+        return dict(zip(labels, means))
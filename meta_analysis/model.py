@@ -4,6 +4,9 @@ Function:
     inverse_variance(variance): inverse variance
     get_confidence_intervals(effect_size, standard_error): caculate 95% confidence intervals
     get_heterogeneity(effect_sizes, total_effect_size, weights)： caculate heterogeneity
+    get_tau_square(effect_sizes, variances, method): caculate between-study variance,
+                   DerSimonian-Laird, REML, Paule-Mandel or Sidik-Jonkman
+    get_dl_tau_square(q, df, c, sum_weights): DerSimonian-Laird tau square from sums
     get_z_value(total_effect_size, standard_error, x0): caculate z test value
     get_p_from_z(z, one_side): caculate p value from z value
 
@@ -31,11 +34,7 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with meta_analysis.  If not, see <https://www.gnu.org/licenses/>.
 """
-import matplotlib.pyplot as plt
-from matplotlib.patches import Rectangle, Polygon
-
 import numpy as np
-from scipy.stats import norm
 
 from . import data
 
@@ -48,26 +47,170 @@ def get_confidence_intervals(effect_size, standard_error):
     upper_limits = effect_size + 1.96 * standard_error
     return lower_limits, upper_limits
 
-def get_heterogeneity(effect_sizes, total_effect_size, weights):
+def get_heterogeneity(effect_sizes, total_effect_size, weights, axis=None):
     diff_es_square = (effect_sizes - total_effect_size) ** 2
-    q = np.sum(np.multiply(weights, diff_es_square))
+    q = np.sum(np.multiply(weights, diff_es_square), axis=axis)
     return q
 
+TAU2_METHODS = ('dl', 'reml', 'pm', 'sj')
+
+# C under this fraction of sum of weights is rounding error, e.g. of sums
+# with studies subtracted, only one study is effectively left
+DL_C_TOLERANCE = 1e-10
+
+def get_dl_tau_square(q, df, c, sum_weights):
+    """ DerSimonian-Laird tau square from heterogeneity and sums of weights
+    Args:
+        q: ndarray, heterogeneity of fixed model
+        df: int, count of studies minus 1
+        c: ndarray, sum of weights minus sum of square weights / sum of weights
+        sum_weights: ndarray, scale of rounding error in c
+    Return:
+        tau_square: ndarray, 0 if one study or c is rounding error
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        tau_square = np.maximum((q - df) / c, 0)
+    # one study has no between-study variance, (Q - df) / C is 0 / 0
+    return np.where((df <= 0) | (c <= DL_C_TOLERANCE * sum_weights), 0, tau_square)
+
+def _dl_tau_square(effect_sizes, variances):
+    fixed_weights = np.reciprocal(variances)
+    sum_fixed_weights = np.sum(fixed_weights, axis=0)
+    mean_effect_size = np.sum(effect_sizes * fixed_weights, axis=0) / sum_fixed_weights
+    Q = np.sum(np.square(effect_sizes-mean_effect_size)/variances, axis=0)
+    df = variances.shape[0] - 1
+    C = sum_fixed_weights - np.sum(np.square(fixed_weights), axis=0) / sum_fixed_weights
+    return get_dl_tau_square(Q, df, C, sum_fixed_weights)
+
+def _sj_tau_square(effect_sizes, variances):
+    # Sidik-Jonkman, start from unweighted variance of effect sizes
+    k = variances.shape[0]
+    if k == 1:
+        return np.zeros(variances.shape[1:])
+    tau_square = np.sum(np.square(effect_sizes - np.mean(effect_sizes, axis=0)), axis=0) / k
+    weights = np.reciprocal(variances + tau_square)
+    mean_effect_size = np.sum(effect_sizes * weights, axis=0) / np.sum(weights, axis=0)
+    return tau_square * np.sum(weights * np.square(effect_sizes - mean_effect_size),
+                               axis=0) / (k - 1)
+
+def _reml_update(effect_sizes, variances, tau_square):
+    # fixed point of restricted maximum likelihood, Viechtbauer (2005)
+    weights = np.reciprocal(variances + tau_square)
+    sum_weights = np.sum(weights, axis=0)
+    mean_effect_size = np.sum(effect_sizes * weights, axis=0) / sum_weights
+    square_weights = np.square(weights)
+    new_tau_square = np.sum(square_weights * (np.square(effect_sizes - mean_effect_size)
+                                              - variances), axis=0) /\
+                     np.sum(square_weights, axis=0) + 1 / sum_weights
+    return np.maximum(new_tau_square, 0)
+
+def _pm_update(effect_sizes, variances, tau_square):
+    # Paule-Mandel, newton step to solve generalized Q(tau_square) = k - 1
+    weights = np.reciprocal(variances + tau_square)
+    mean_effect_size = np.sum(effect_sizes * weights, axis=0) / np.sum(weights, axis=0)
+    square_residuals = np.square(effect_sizes - mean_effect_size)
+    q = np.sum(weights * square_residuals, axis=0)
+    derivative = np.sum(np.square(weights) * square_residuals, axis=0)
+    df = variances.shape[0] - 1
+    step = np.where(derivative > 0, (q - df) / derivative, 0)
+    return np.maximum(tau_square + step, 0)
+
+def _iterate_tau_square(update, effect_sizes, variances, tau_square, max_iter, tol):
+    """ iterate update() until tau_square converged, converged voxels drop
+        out of later iterations.
+    """
+    iterations = np.zeros(tau_square.shape, dtype=int)
+    converged = np.zeros(tau_square.shape, dtype=bool)
+    active = np.flatnonzero(np.isfinite(tau_square))
+    for _ in range(max_iter):
+        if not active.size:
+            break
+        old_tau_square = tau_square[active]
+        new_tau_square = update(effect_sizes[:, active], variances[:, active],
+                                old_tau_square)
+        iterations[active] += 1
+        tau_square[active] = new_tau_square
+        done = np.abs(new_tau_square - old_tau_square) <= tol * np.maximum(old_tau_square, 1)
+        converged[active[done]] = True
+        active = active[~done & np.isfinite(new_tau_square)]
+    return tau_square, iterations, converged
+
+def get_tau_square(effect_sizes, variances, method='dl',
+                   max_iter=100, tol=1e-10, return_report=False):
+    """ caculate between-study variance, vectorized across voxels
+    Args:
+        effect_sizes: ndarray, shape (studies,) or (studies, voxels)
+        variances: ndarray, same shape as effect_sizes
+        method: 'dl' DerSimonian-Laird, 'reml' restricted maximum likelihood,
+                'pm' Paule-Mandel, 'sj' Sidik-Jonkman
+        max_iter: int, maximum iterations of 'reml' and 'pm'
+        tol: float, relative tolerance of 'reml' and 'pm'
+        return_report: bool, also return convergence report
+    Return:
+        tau_square: ndarray, shape (voxels,) or scalar
+        report: dict, only if return_report,
+                {'method', 'max_iter', 'tol',
+                 'iterations': iterations of every voxel,
+                 'converged': whether every voxel converged}
+    """
+    effect_sizes = np.asarray(effect_sizes, dtype=np.float64)
+    variances = np.asarray(variances, dtype=np.float64)
+    is_scalar = effect_sizes.ndim == 1
+    if is_scalar:
+        effect_sizes, variances = effect_sizes[:, None], variances[:, None]
+    method = method.lower()
+    iterations = np.zeros(effect_sizes.shape[1:], dtype=int)
+    converged = np.ones(effect_sizes.shape[1:], dtype=bool)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if method == 'dl':
+            tau_square = _dl_tau_square(effect_sizes, variances)
+        elif method == 'sj':
+            tau_square = _sj_tau_square(effect_sizes, variances)
+        elif method in ('reml', 'pm'):
+            if method == 'reml':
+                update = _reml_update
+                tau_square = _dl_tau_square(effect_sizes, variances)
+            else:
+                update = _pm_update
+                tau_square = np.zeros(effect_sizes.shape[1:])
+            # iterate over flatten voxels
+            voxel_shape = tau_square.shape
+            tau_square, iterations, converged = _iterate_tau_square(
+                update,
+                effect_sizes.reshape(effect_sizes.shape[0], -1),
+                variances.reshape(variances.shape[0], -1),
+                tau_square.reshape(-1), max_iter, tol)
+            tau_square = tau_square.reshape(voxel_shape)
+            iterations = iterations.reshape(voxel_shape)
+            converged = converged.reshape(voxel_shape)
+        else:
+            raise ValueError('Unsupported tau square method: {}'.format(method))
+    if is_scalar:
+        tau_square, iterations, converged = tau_square[0], iterations[0], converged[0]
+    if return_report:
+        report = {'method': method, 'max_iter': max_iter, 'tol': tol,
+                  'iterations': iterations, 'converged': converged}
+        return tau_square, report
+    return tau_square
+
 def get_z_value(total_effect_size, standard_error, x0=0):
     return (total_effect_size - x0) / standard_error
 
 def get_p_from_z(z, one_side=False):
+    # ndtr(-x) is norm.sf(x), without importing scipy.stats
+    from scipy.special import ndtr
     if one_side:
-        p_value = norm.sf(abs(z))
+        p_value = ndtr(-abs(z))
     else:
-        p_value = norm.sf(abs(z)) * 2
+        p_value = ndtr(-abs(z)) * 2
     return p_value
 
 class Model(object):
     """Basic class to perform check effect size from all study.
 
     Attributes:
-        studies: list of Study instance.
+        studies: list of Study instance or StudyTable instance.
+        table: StudyTable instance, columns of all studies
         effect_sizes: list, all studies' effect size
         variances: list, all studies' variance
         weights: list, all studies' weight
@@ -90,23 +233,14 @@ class Model(object):
     def __init__(self, studies):
         super().__init__()
         self.studies = studies
-        effect_sizes = []
-        variances = []
-        lower_limits = []
-        upper_limits = []
-        for study in studies:
-            es = study.get_effect_size()
-            v = study.get_variance()
-            ll, ul = study.get_confidence_intervals()
-            effect_sizes.append(es)
-            variances.append(v)
-            lower_limits.append(ll)
-            upper_limits.append(ul)
-
-        self.effect_sizes = np.asarray(effect_sizes)
-        self.variances = np.asarray(variances)
-        self.lower_limits = np.asarray(lower_limits)
-        self.upper_limits = np.asarray(upper_limits)
+        if isinstance(studies, data.StudyTable):
+            self.table = studies
+        else:
+            self.table = data.StudyTable.from_studies(studies)
+
+        self.effect_sizes = self.table.effect_sizes
+        self.variances = self.table.variances
+        self.lower_limits, self.upper_limits = self.table.get_confidence_intervals()
         self.gen_weights()
 
         self.caculate()
@@ -117,7 +251,7 @@ class Model(object):
     def caculate(self):
         effect_sizes = self.effect_sizes
         variances = self.variances
-        weights = np.reciprocal(variances)
+        weights = self.weights
 
         total_effect_size = np.sum(np.multiply(effect_sizes, weights)) /\
                    np.sum(weights)
@@ -125,7 +259,11 @@ class Model(object):
         total_standard_error = np.sqrt(total_variance)
 
         total_lower_limit, total_upper_limit = get_confidence_intervals(total_effect_size, total_standard_error)
-        q = get_heterogeneity(effect_sizes, total_effect_size, weights)
+        # heterogeneity is always measured with inverse variance weights
+        fixed_weights = np.reciprocal(variances)
+        fixed_effect_size = np.sum(np.multiply(effect_sizes, fixed_weights)) /\
+                   np.sum(fixed_weights)
+        q = get_heterogeneity(effect_sizes, fixed_effect_size, fixed_weights)
         z = get_z_value(total_effect_size, total_standard_error)
         p = get_p_from_z(z)
 
@@ -147,20 +285,24 @@ class Model(object):
     def plot_forest(self, title='meta analysis', 
                     plot_group_details=True,save_path=None,
                     show=True):
+        # matplotlib is only imported when plotting
+        import matplotlib.pyplot as plt
+        from matplotlib.patches import Rectangle, Polygon
+
         dpi = 100
         grid_width = 1
         grid_height = 1
         forest_plot_width = 4 * grid_width
-        forest_plot_height = (len(self.studies) + 1) * grid_height
+        forest_plot_height = (len(self.table) + 1) * grid_height
 
         is_cont = True
-        data_type = self.studies[0].data_type
+        data_type = self.table.data_type
         if data_type == data.Study.num:
             is_cont = True
-        elif data == data.Study.cate:
+        elif data_type == data.Study.cate:
             is_cont = False
         
-        if not is_cont:
+        if not is_cont or not self.table.has_msn():
             plot_group_details = False
 
         width = 18
@@ -227,9 +369,6 @@ class Model(object):
             ax.text(cg_std_x, subheader_y, 'std',ha=ha, va=va, fontsize=font_size)
             ax.text(cg_count_x, subheader_y, 'count',ha=ha, va=va, fontsize=font_size)
 
-        total_eg_count = 0
-        total_cg_count = 0
-
         row_y = height - grid_height
         ax.axhline((subheader_y+row_y)/2, color='black')
         # draw Study details
@@ -237,16 +376,18 @@ class Model(object):
         weights = np.reciprocal(self.variances)
         weights = weights / np.sum(weights)
         first_row_y = height - grid_height * 1.5
-        for i, (study, effect_size, weight,
+        for i, (name, effect_size, weight,
                 lower_limit, upper_limit) in enumerate(
-                    zip(self.studies, self.effect_sizes, weights,
+                    zip(self.table.names, self.effect_sizes, weights,
                         self.lower_limits, self.upper_limits)):
             row_y = first_row_y - grid_height * i
-            eg_mean, eg_std, eg_count = study.group_experimental.get_mean_std_count()
-            cg_mean, cg_std, cg_count = study.group_control.get_mean_std_count()
 
-            ax.text(study_x, row_y, study.name, ha=llha, va=va, fontsize=font_size)
+            ax.text(study_x, row_y, name, ha=llha, va=va, fontsize=font_size)
             if plot_group_details:
+                eg_mean, eg_std, eg_count = (self.table.means1[i], self.table.stds1[i],
+                                             self.table.counts1[i])
+                cg_mean, cg_std, cg_count = (self.table.means2[i], self.table.stds2[i],
+                                             self.table.counts2[i])
                 ax.text(eg_mean_x, row_y, '{:.2f}'.format(eg_mean), ha=ha, va=va, fontsize=font_size)
                 ax.text(eg_std_x, row_y, '{:.2f}'.format(eg_std), ha=ha, va=va, fontsize=font_size)
                 ax.text(eg_count_x, row_y, int(eg_count), ha=ha, va=va, fontsize=font_size)
@@ -258,13 +399,12 @@ class Model(object):
             ax.text(lower_limit_x, row_y, '[{:.2f}'.format(lower_limit), ha=ha, va=va, fontsize=font_size)
             ax.text(upper_limit_x, row_y, '{:.2f}]'.format(upper_limit), ha=ha, va=va, fontsize=font_size)
             ax.text(weight_x, row_y, '{:.2f}%'.format(weight*100), ha=ha, va=va, fontsize=font_size)
-
-            total_eg_count += eg_count
-            total_cg_count += cg_count
         # draw total
         total_y = row_y - grid_height
         ax.text(study_x, total_y, 'Total', ha=llha, va=va, fontsize=font_size)
         if plot_group_details:
+            total_eg_count = np.sum(self.table.counts1)
+            total_cg_count = np.sum(self.table.counts2)
             ax.text(eg_count_x, total_y, int(total_eg_count), ha=ha, va=va, fontsize=font_size)
             ax.text(cg_count_x, total_y, int(total_cg_count), ha=ha, va=va, fontsize=font_size)
         ax.text(effect_size_x, total_y, '{:.2f}'.format(self.total_effect_size), ha=ha, va=va, fontsize=font_size)
@@ -350,20 +490,22 @@ class FixedModel(Model):
         self.weights = np.reciprocal(self.variances)
 
 class RandomModel(Model):
-    def __init__(self, studies):
+    """ Random model
+    Attributes:
+        tau2_method: str, method to caculate tau square, pass to get_tau_square()
+        tau_square: float, between-study variance
+        tau_square_report: dict, convergence report of get_tau_square()
+    """
+    def __init__(self, studies, tau2_method='dl'):
+        self.tau2_method = tau2_method
         super().__init__(studies)
 
     def gen_weights(self):
         effect_sizes = self.effect_sizes
         variances = self.variances
 
-        fixed_weights = np.reciprocal(variances)
-        mean_effect_size = np.dot(effect_sizes, fixed_weights)/np.sum(fixed_weights)
-        Q = np.sum(np.square(effect_sizes-mean_effect_size)/variances)
-        df = len(variances) - 1
-        C = np.sum(fixed_weights) - np.sum(np.square(fixed_weights)) / np.sum(fixed_weights)
-        tau_square = (Q - df) / C
-        if tau_square < 0:
-            tau_square = 0
+        tau_square, report = get_tau_square(effect_sizes, variances,
+                                            self.tau2_method, return_report=True)
         self.tau_square = tau_square
+        self.tau_square_report = report
         self.weights = np.reciprocal(variances + tau_square)
\ No newline at end of file
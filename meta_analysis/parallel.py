@@ -0,0 +1,129 @@
+""" parallel module, run blocks of work in a process pool
+
+Arrays reach the workers through memory mapped files instead of being
+pickled, workers write their results into a shared memory mapped buffer.
+
+Function:
+    get_n_jobs(n_jobs): normalize n_jobs, -1 means all cpus
+    map_blocks(func, blocks, n_jobs, args): call func(block, *args) for every block
+
+Class:
+    SharedArray(object): ndarray backed by a memory mapped file, pickled by path.
+    SharedDir(object): temporary directory holding SharedArray files.
+
+Author: Kang Xiaopeng
+Data: 2026/10/17
+E-mail: kangxiaopeng2018@ia.ac.cn
+
+This file is part of meta_analysis.
+
+meta_analysis is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+meta_analysis is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with meta_analysis.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+def get_n_jobs(n_jobs):
+    if n_jobs is None:
+        return 1
+    n_jobs = int(n_jobs)
+    if n_jobs < 0:
+        n_jobs = max((os.cpu_count() or 1) + 1 + n_jobs, 1)
+    return max(n_jobs, 1)
+
+class SharedArray(object):
+    """ ndarray backed by a memory mapped file. Only path, shape and dtype
+        are pickled, so every process maps the same pages.
+
+    Attributes:
+        path: str, filepath of memory mapped file
+        shape: tuple, array shape
+        dtype: np.dtype, array dtype
+
+    Function:
+        get_array(): return memory mapped ndarray
+    """
+    def __init__(self, path, shape, dtype=np.float64):
+        super().__init__()
+        self.path = path
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self._array = None
+        if not os.path.exists(path):
+            np.lib.format.open_memmap(path, mode='w+', dtype=self.dtype,
+                                      shape=self.shape)
+
+    def get_array(self):
+        if self._array is None:
+            self._array = np.load(self.path, mmap_mode='r+')
+        return self._array
+
+    def __getstate__(self):
+        return self.path, self.shape, self.dtype
+
+    def __setstate__(self, state):
+        self.path, self.shape, self.dtype = state
+        self._array = None
+
+class SharedDir(object):
+    """ temporary directory holding SharedArray files, removed on exit
+
+    Function:
+        create(name, shape, dtype): create SharedArray of zeros
+        from_array(name, array): create SharedArray holding copy of array
+        close(): remove directory and all arrays
+    """
+    def __init__(self, dir=None):
+        super().__init__()
+        self.dir = tempfile.mkdtemp(prefix='meta_analysis_', dir=dir)
+
+    def create(self, name, shape, dtype=np.float64):
+        return SharedArray(os.path.join(self.dir, '{}.npy'.format(name)),
+                           shape, dtype)
+
+    def from_array(self, name, array):
+        array = np.asarray(array)
+        shared = self.create(name, array.shape, array.dtype)
+        shared.get_array()[...] = array
+        return shared
+
+    def close(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def map_blocks(func, blocks, n_jobs=1, args=()):
+    """ call func(block, *args) for every block, in a process pool if n_jobs > 1
+    Args:
+        func: picklable function, usually writes into a SharedArray in args
+        blocks: iterable of blocks, usually slices from utils.gen_blocks()
+        n_jobs: int, count of processes, -1 means all cpus
+        args: extra args pass to func
+    Return:
+        results: list of func's returns, same order as blocks
+    """
+    n_jobs = get_n_jobs(n_jobs)
+    blocks = list(blocks)
+    if n_jobs == 1 or len(blocks) <= 1:
+        return [func(block, *args) for block in blocks]
+    with ProcessPoolExecutor(max_workers=min(n_jobs, len(blocks))) as executor:
+        futures = [executor.submit(func, block, *args) for block in blocks]
+        return [future.result() for future in futures]
@@ -0,0 +1,262 @@
+""" permutation module, nonparametric inference with max statistic FWE correction
+
+Two kinds of null distribution are supported:
+    sign flip: only centers' effect size maps exist, under null hypothesis
+               every center's effect is symmetric around 0, so randomly flip
+               signs of centers' effect sizes.
+    label permutation: subject data exist, randomly permute group labels
+               within every center, then recompute everything.
+Pooled z maps of a batch of permutations are caculated at once as
+(permutations, voxels) arrays, only maximum |z| of every permutation is kept.
+
+Function:
+    gen_sign_flips(n_perm, center_count, seed): random signs of centers
+    gen_label_permutations(labels_list, n_perm, seed): permute labels within centers
+    sign_flip_z(signs, effect_sizes, variances, model_type, tau2_method): batched pooled z
+    label_permutation_z(perms, datas, method, model_type, tau2_method): batched pooled z
+    get_fwe_p(z, null_distribution): FWE corrected p from max statistic null
+    sign_flip_test(effect_sizes, variances, ...): perform sign flip test
+    label_permutation_test(datas, labels_list, ...): perform label permutation test
+
+Author: Kang Xiaopeng
+Data: 2026/10/17
+E-mail: kangxiaopeng2018@ia.ac.cn
+
+This file is part of meta_analysis.
+
+meta_analysis is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+meta_analysis is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with meta_analysis.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import numpy as np
+
+from . import engine
+from . import parallel
+from . import utils
+
+PERMUTATION_RESULT_NAMES = ('z', 'p_fwe')
+
+# bytes of temporaries one worker may use for one batch of permutations
+MAX_MEMORY = 1 << 28
+
+def gen_sign_flips(n_perm, center_count, seed=None):
+    rng = np.random.default_rng(seed)
+    return rng.choice(np.array([-1., 1.]), size=(n_perm, center_count))
+
+def gen_label_permutations(labels_list, n_perm, seed=None):
+    """ permute group labels within every center
+    Args:
+        labels_list: list of 1d bool ndarray, True means experimental group
+        n_perm: int, count of permutations
+        seed: random seed
+    Return:
+        perms: list of 2d bool ndarray, shape (n_perm, len(labels))
+    """
+    rng = np.random.default_rng(seed)
+    perms = []
+    for labels in labels_list:
+        labels = np.tile(np.asarray(labels, dtype=bool), (n_perm, 1))
+        perms.append(rng.permuted(labels, axis=1))
+    return perms
+
+def _abs_max(z):
+    # voxels without variance are nan, they never count
+    z = np.abs(z)
+    z[np.isnan(z)] = 0
+    return np.max(z, axis=-1)
+
+def sign_flip_z(signs, effect_sizes, variances, model_type='random', tau2_method='dl'):
+    """ pooled z of every sign flip
+    Args:
+        signs: ndarray, shape (permutations, centers), 1 or -1
+        effect_sizes: ndarray, shape (centers, voxels)
+        variances: ndarray, shape (centers, voxels)
+        model_type: 'fixed' or 'random', meta analysis model.
+        tau2_method: random model's tau square method, only 'dl' has a
+                     closed form here, others are caculated by engine.
+    Return:
+        z: ndarray, shape (permutations, voxels)
+    """
+    effect_sizes = np.asarray(effect_sizes, dtype=np.float64)
+    if model_type.lower() == 'random' and tau2_method.lower() != 'dl':
+        # (centers, permutations, voxels)
+        flipped_effect_sizes = signs.T[:, :, None] * effect_sizes[:, None, :]
+        flipped_variances = np.broadcast_to(variances[:, None, :], flipped_effect_sizes.shape)
+        results = engine.caculate(flipped_effect_sizes, flipped_variances,
+                                  model_type, tau2_method)
+        return results[engine.RESULT_NAMES.index('z')]
+    variances = np.asarray(variances, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weights = np.reciprocal(variances)
+        weighted_effect_sizes = weights * effect_sizes
+        sum_weights = np.sum(weights, axis=0)
+        # sum of weighted effect sizes under each sign flip
+        t = signs @ weighted_effect_sizes
+        if model_type.lower() == 'fixed':
+            return t / np.sqrt(sum_weights)
+        elif model_type.lower() != 'random':
+            raise ValueError('Unsupported model: {}'.format(model_type))
+        # DerSimonian-Laird, Q = sum(w*es^2) - sum(w*es)^2 / sum(w),
+        # only the second term depends on signs
+        a = np.sum(weighted_effect_sizes * effect_sizes, axis=0)
+        c = sum_weights - np.sum(np.square(weights), axis=0) / sum_weights
+        df = variances.shape[0] - 1
+        tau_square = np.maximum((a - np.square(t) / sum_weights - df) / c, 0)
+        random_weights = np.reciprocal(variances + tau_square[:, None, :])
+        numerator = np.einsum('pk,pkv->pv', signs, random_weights * effect_sizes)
+        return numerator / np.sqrt(np.sum(random_weights, axis=1))
+
+def label_permutation_z(perms, datas, method='cohen_d', model_type='random',
+                        tau2_method='dl'):
+    """ pooled z of every label permutation
+    Args:
+        perms: list of 2d bool ndarray, shape (permutations, subjects) of every center
+        datas: list of 2d ndarray, shape (subjects, voxels) of every center
+        method: str, ways to caculate effect size
+        model_type: 'fixed' or 'random', meta analysis model.
+        tau2_method: random model's tau square method, pass to engine.caculate()
+    Return:
+        z: ndarray, shape (permutations, voxels)
+    """
+    effect_sizes, variances = [], []
+    for perm, data in zip(perms, datas):
+        data = np.asarray(data, dtype=np.float64)
+        perm = np.asarray(perm, dtype=np.float64)
+        n1 = np.sum(perm[0])
+        n2 = perm.shape[1] - n1
+        sum1 = perm @ data
+        square_sum1 = perm @ np.square(data)
+        m1 = sum1 / n1
+        m2 = (np.sum(data, axis=0) - sum1) / n2
+        # population std, same as utils.cal_mean_std_n
+        s1 = np.sqrt(np.maximum(square_sum1 / n1 - np.square(m1), 0))
+        s2 = np.sqrt(np.maximum((np.sum(np.square(data), axis=0) - square_sum1) / n2
+                                - np.square(m2), 0))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            es, var = engine.get_effect_sizes(method, m1, s1, n1, m2, s2, n2)
+        effect_sizes.append(es)
+        variances.append(var)
+    results = engine.caculate(np.stack(effect_sizes), np.stack(variances),
+                              model_type, tau2_method)
+    return results[engine.RESULT_NAMES.index('z')]
+
+def get_fwe_p(z, null_distribution):
+    """ FWE corrected p, (1 + count(null >= |z|)) / (1 + n_perm)
+    """
+    null_distribution = np.sort(null_distribution)
+    n_perm = len(null_distribution)
+    count = n_perm - np.searchsorted(null_distribution, np.abs(z), side='left')
+    p = (1 + count) / (1 + n_perm)
+    p[np.isnan(z)] = 1
+    return p
+
+def _get_block_sizes(n_perm, voxel_count, center_count, n_jobs, perm_batch):
+    if perm_batch is None:
+        perm_batch = max(-(-n_perm // (4 * n_jobs)), 1)
+    voxel_block = engine.get_block_size(center_count * perm_batch, MAX_MEMORY)
+    return perm_batch, min(voxel_block, max(voxel_count, 1))
+
+def _sign_flip_chunk(perm_block, signs, inputs, model_type, tau2_method, voxel_block):
+    effect_sizes, variances = inputs.get_array()
+    signs = signs[perm_block]
+    null = np.zeros(len(signs))
+    for block in utils.gen_blocks(effect_sizes.shape[1], voxel_block):
+        z = sign_flip_z(signs, effect_sizes[:, block], variances[:, block],
+                        model_type, tau2_method)
+        null = np.maximum(null, _abs_max(z))
+    return null
+
+def sign_flip_test(effect_sizes, variances, n_perm=5000, model_type='random',
+                   tau2_method='dl', seed=None, n_jobs=1, perm_batch=None):
+    """ perform sign flip test of centers' effect sizes
+    Args:
+        effect_sizes: ndarray, shape (centers, voxels)
+        variances: ndarray, shape (centers, voxels)
+        n_perm: int, count of permutations
+        model_type: 'fixed' or 'random', meta analysis model.
+        tau2_method: random model's tau square method, pass to sign_flip_z()
+        seed: random seed, results don't depend on n_jobs
+        n_jobs: int, count of processes, -1 means all cpus
+        perm_batch: int, count of permutations caculated at once
+    Return:
+        z: ndarray, shape (voxels,)
+        p_fwe: ndarray, FWE corrected p, shape (voxels,)
+        null_distribution: ndarray, maximum |z| of every permutation
+    """
+    effect_sizes = np.asarray(effect_sizes, dtype=np.float64)
+    variances = np.asarray(variances, dtype=np.float64)
+    center_count, voxel_count = effect_sizes.shape
+    n_jobs = parallel.get_n_jobs(n_jobs)
+    signs = gen_sign_flips(n_perm, center_count, seed)
+    z = sign_flip_z(np.ones((1, center_count)), effect_sizes, variances,
+                    model_type, tau2_method)[0]
+
+    perm_batch, voxel_block = _get_block_sizes(n_perm, voxel_count, center_count,
+                                               n_jobs, perm_batch)
+    perm_blocks = utils.gen_blocks(n_perm, perm_batch)
+    with parallel.SharedDir() as shared_dir:
+        inputs = shared_dir.from_array('inputs', np.stack((effect_sizes, variances)))
+        nulls = parallel.map_blocks(_sign_flip_chunk, perm_blocks, n_jobs,
+                                    args=(signs, inputs, model_type, tau2_method,
+                                          voxel_block))
+    null_distribution = np.concatenate(nulls)
+    return z, get_fwe_p(z, null_distribution), null_distribution
+
+def _label_permutation_chunk(perm_block, perms, inputs, method, model_type,
+                             tau2_method, voxel_block):
+    datas = [data.get_array() for data in inputs]
+    perms = [perm[perm_block] for perm in perms]
+    null = np.zeros(perm_block.stop - perm_block.start)
+    for block in utils.gen_blocks(datas[0].shape[1], voxel_block):
+        z = label_permutation_z(perms, [data[:, block] for data in datas],
+                                method, model_type, tau2_method)
+        null = np.maximum(null, _abs_max(z))
+    return null
+
+def label_permutation_test(datas, labels_list, n_perm=5000, method='cohen_d',
+                           model_type='random', tau2_method='dl', seed=None,
+                           n_jobs=1, perm_batch=None):
+    """ perform label permutation test, labels are permuted within every center
+    Args:
+        datas: list of 2d ndarray, shape (subjects, voxels) of every center
+        labels_list: list of 1d bool ndarray, True means experimental group
+        n_perm: int, count of permutations
+        method: str, ways to caculate effect size
+        model_type: 'fixed' or 'random', meta analysis model.
+        tau2_method: random model's tau square method, pass to engine.caculate()
+        seed: random seed, results don't depend on n_jobs
+        n_jobs: int, count of processes, -1 means all cpus
+        perm_batch: int, count of permutations caculated at once
+    Return:
+        z: ndarray, shape (voxels,)
+        p_fwe: ndarray, FWE corrected p, shape (voxels,)
+        null_distribution: ndarray, maximum |z| of every permutation
+    """
+    n_jobs = parallel.get_n_jobs(n_jobs)
+    labels_list = [np.asarray(labels, dtype=bool) for labels in labels_list]
+    perms = gen_label_permutations(labels_list, n_perm, seed)
+    z = label_permutation_z([labels[None] for labels in labels_list], datas,
+                            method, model_type, tau2_method)[0]
+
+    # subjects' data enter the matrix products, so they count as centers here
+    subject_count = sum(len(labels) for labels in labels_list)
+    perm_batch, voxel_block = _get_block_sizes(n_perm, len(z), subject_count,
+                                               n_jobs, perm_batch)
+    perm_blocks = utils.gen_blocks(n_perm, perm_batch)
+    with parallel.SharedDir() as shared_dir:
+        inputs = [shared_dir.from_array('data{}'.format(i), data)
+                  for i, data in enumerate(datas)]
+        nulls = parallel.map_blocks(_label_permutation_chunk, perm_blocks, n_jobs,
+                                    args=(perms, inputs, method, model_type,
+                                          tau2_method, voxel_block))
+    null_distribution = np.concatenate(nulls)
+    return z, get_fwe_p(z, null_distribution), null_distribution
@@ -0,0 +1,336 @@
+""" plot module, batch export of forest plots without an interactive backend
+
+Figures are drawn on the Agg canvas directly, pyplot is never used. One
+ForestTemplate is built for every count of studies, its header, text cells,
+whiskers, boxes and diamond are created once and only updated for every
+model, whiskers and boxes are one LineCollection and one PatchCollection.
+Models are split into chunks and exported in a process pool, every process
+keeps its own templates.
+
+Function:
+    get_template(n_studies, plot_group_details): cached ForestTemplate
+    plot_forest(result_model, save_path, title, ...): draw a model, save to files
+    export_forest_plots(models, output_dir, formats, n_jobs): export plots of lots of models
+
+Class:
+    ForestTemplate(object): figure of a forest plot, reused across models
+
+Author: Kang Xiaopeng
+Data: 2026/10/17
+E-mail: kangxiaopeng2018@ia.ac.cn
+
+This file is part of meta_analysis.
+
+meta_analysis is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+meta_analysis is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with meta_analysis.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import os
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection, PatchCollection
+from matplotlib.figure import Figure
+from matplotlib.patches import Polygon, Rectangle
+
+from . import data
+from . import parallel
+
+FORMATS = ('png', 'svg', 'pdf')
+
+class ForestTemplate(object):
+    """ figure of a forest plot of n_studies studies, same layout as
+        model.Model.plot_forest(), artists are updated by draw()
+
+    Attributes:
+        n_studies: int, count of studies
+        plot_group_details: bool, draw mean, std, count of groups
+        figure: matplotlib Figure on Agg canvas
+
+    Function:
+        draw(result_model, title): update artists with a model's results
+        save(path, format): save figure
+    """
+    dpi = 100
+    grid_width = 1
+    grid_height = 1
+    font_size = 18
+    accent_color = 'grey'
+    largest_box_scale = 1 / 4
+
+    def __init__(self, n_studies, plot_group_details=True):
+        super().__init__()
+        self.n_studies = n_studies
+        self.plot_group_details = plot_group_details
+
+        grid_width, grid_height = self.grid_width, self.grid_height
+        forest_plot_width = 4 * grid_width
+        forest_plot_height = (n_studies + 1) * grid_height
+        width = 18 if plot_group_details else 12
+        height = 2 + forest_plot_height
+
+        self.figure = Figure(figsize=(width, height), dpi=self.dpi)
+        FigureCanvasAgg(self.figure)
+        ax = self.figure.add_axes([0, 0, 1, 1])
+        ax.set_axis_off()
+        ax.set_xlim(0, width)
+        ax.set_ylim(0, height)
+        self._ax = ax
+
+        study_x = 0
+        experimental_group_x = study_x + grid_width * 4
+        control_group_x = experimental_group_x + grid_width * 3
+        if plot_group_details:
+            forest_plot_x = control_group_x + 2 + forest_plot_width / 2
+        else:
+            forest_plot_x = study_x + 2 + forest_plot_width / 2
+        effect_size_x = forest_plot_x + 1 + forest_plot_width / 2
+        lower_limit_x = effect_size_x + grid_width
+        upper_limit_x = lower_limit_x + grid_width
+        interval_x = (lower_limit_x + upper_limit_x) / 2
+        weight_x = upper_limit_x + grid_width
+        eg_mean_x, eg_std_x, eg_count_x = experimental_group_x + np.arange(-1, 2) * grid_width
+        cg_mean_x, cg_std_x, cg_count_x = control_group_x + np.arange(-1, 2) * grid_width
+
+        # header
+        header_y = height
+        subheader_y = height - grid_height / 2
+        self._text(study_x, header_y, 'Study', ha='left')
+        if plot_group_details:
+            self._text(experimental_group_x, header_y, 'experimental group')
+            self._text(control_group_x, header_y, 'control group')
+            for x, s in zip((eg_mean_x, eg_std_x, eg_count_x, cg_mean_x, cg_std_x, cg_count_x),
+                            ('mean', 'std', 'count') * 2):
+                self._text(x, subheader_y, s)
+        self._text(forest_plot_x, header_y, 'forest plot')
+        self._text(effect_size_x, header_y, 'effect size')
+        self._text(interval_x, header_y, '95% interval')
+        self._text(weight_x, header_y, 'weight')
+        ax.axhline((subheader_y + height - grid_height) / 2, color='black')
+        ax.axhline(grid_height / 2, 0, 1, color='black')
+
+        # cells of every study and total, texts are set by draw()
+        columns = [('name', study_x, 'left')]
+        if plot_group_details:
+            columns += [('eg_mean', eg_mean_x, 'center'), ('eg_std', eg_std_x, 'center'),
+                        ('eg_count', eg_count_x, 'center'), ('cg_mean', cg_mean_x, 'center'),
+                        ('cg_std', cg_std_x, 'center'), ('cg_count', cg_count_x, 'center')]
+        columns += [('effect_size', effect_size_x, 'center'),
+                    ('lower_limit', lower_limit_x, 'center'),
+                    ('upper_limit', upper_limit_x, 'center'),
+                    ('weight', weight_x, 'center')]
+        first_row_y = height - grid_height * 1.5
+        self._rows = []
+        for i in range(n_studies + 1):
+            row_y = first_row_y - grid_height * i
+            self._rows.append({name: self._text(x, row_y, '', ha=ha)
+                               for name, x, ha in columns})
+        self._rows[-1]['name'].set_text('Total')
+
+        # summary
+        self._summary = {
+            'q': self._text(study_x, 0, '', ha='left', va='bottom'),
+            'z': self._text(effect_size_x, 0, '', va='bottom'),
+            'p': self._text(upper_limit_x, 0, '', va='bottom'),
+            'title': self._text(forest_plot_x, 0, '', va='bottom')}
+
+        # forest plot
+        forest_ax = self.figure.add_axes([(forest_plot_x - forest_plot_width / 2) / width,
+                                          grid_height / height,
+                                          forest_plot_width / width,
+                                          forest_plot_height / height])
+        forest_ax.tick_params(left=False, labelleft=False)
+        forest_ax.set_ylim(0, forest_plot_height)
+        for side in ('left', 'right', 'top'):
+            forest_ax.spines[side].set_color('none')
+        forest_ax.axvline(0, 0, 1, color='black')
+        self._forest_ax = forest_ax
+        self._row_ys = forest_plot_height - grid_height * (np.arange(n_studies + 1) + .5)
+
+        self._whiskers = LineCollection([])
+        self._boxes = PatchCollection([], edgecolor='none')
+        self._diamond = Polygon(np.zeros((4, 2)))
+        forest_ax.add_collection(self._whiskers)
+        forest_ax.add_collection(self._boxes)
+        forest_ax.add_patch(self._diamond)
+
+    def _text(self, x, y, s, ha='center', va='top'):
+        return self._ax.text(x, y, s, ha=ha, va=va, fontsize=self.font_size)
+
+    def _get_color(self, lower_limits, upper_limits):
+        colors = np.where(np.asarray(lower_limits) * np.asarray(upper_limits) < 0,
+                          self.accent_color, 'black')
+        return colors.tolist()
+
+    def draw(self, result_model, title='meta analysis'):
+        """ update artists with results of a model.Model instance
+        """
+        table = result_model.table
+        if len(table) != self.n_studies:
+            raise ValueError('Template of {} studies could not draw {} studies'.format(
+                             self.n_studies, len(table)))
+        effect_sizes = np.asarray(result_model.effect_sizes, dtype=np.float64)
+        lower_limits = np.asarray(result_model.lower_limits, dtype=np.float64)
+        upper_limits = np.asarray(result_model.upper_limits, dtype=np.float64)
+        weights = np.reciprocal(np.asarray(result_model.variances, dtype=np.float64))
+        weights = weights / np.sum(weights)
+
+        for i, row in enumerate(self._rows[:-1]):
+            row['name'].set_text(str(table.names[i]))
+            row['effect_size'].set_text('{:.2f}'.format(effect_sizes[i]))
+            row['lower_limit'].set_text('[{:.2f}'.format(lower_limits[i]))
+            row['upper_limit'].set_text('{:.2f}]'.format(upper_limits[i]))
+            row['weight'].set_text('{:.2f}%'.format(weights[i] * 100))
+            if self.plot_group_details:
+                row['eg_mean'].set_text('{:.2f}'.format(table.means1[i]))
+                row['eg_std'].set_text('{:.2f}'.format(table.stds1[i]))
+                row['eg_count'].set_text(str(int(table.counts1[i])))
+                row['cg_mean'].set_text('{:.2f}'.format(table.means2[i]))
+                row['cg_std'].set_text('{:.2f}'.format(table.stds2[i]))
+                row['cg_count'].set_text(str(int(table.counts2[i])))
+        total = self._rows[-1]
+        if self.plot_group_details:
+            total['eg_count'].set_text(str(int(np.sum(table.counts1))))
+            total['cg_count'].set_text(str(int(np.sum(table.counts2))))
+        total['effect_size'].set_text('{:.2f}'.format(result_model.total_effect_size))
+        total['lower_limit'].set_text('[{:.2f}'.format(result_model.total_lower_limit))
+        total['upper_limit'].set_text('{:.2f}]'.format(result_model.total_upper_limit))
+        total['weight'].set_text('{:.2f}%'.format(np.sum(weights) * 100))
+
+        self._summary['q'].set_text('Heterogeneity:{:.2f}'.format(result_model.q))
+        self._summary['z'].set_text('z-value:{:.2f}'.format(result_model.z))
+        self._summary['p'].set_text('p-value:{:.2e}'.format(result_model.p))
+        self._summary['title'].set_text('Title:{}'.format(title))
+
+        # whiskers are interval line and two caps of every study
+        row_ys = self._row_ys[:-1]
+        box_height = self.grid_height * self.largest_box_scale
+        bottoms, tops = row_ys - box_height / 2, row_ys + box_height / 2
+        segments = np.empty((self.n_studies, 3, 2, 2))
+        segments[:, 0] = np.stack([np.stack([lower_limits, row_ys], -1),
+                                   np.stack([upper_limits, row_ys], -1)], 1)
+        segments[:, 1] = np.stack([np.stack([lower_limits, bottoms], -1),
+                                   np.stack([lower_limits, tops], -1)], 1)
+        segments[:, 2] = np.stack([np.stack([upper_limits, bottoms], -1),
+                                   np.stack([upper_limits, tops], -1)], 1)
+        colors = self._get_color(lower_limits, upper_limits)
+        self._whiskers.set_segments(np.reshape(segments, (-1, 2, 2)))
+        self._whiskers.set_color(np.repeat(colors, 3).tolist())
+
+        box_widths = weights / np.max(weights) * self.grid_width * self.largest_box_scale
+        self._boxes.set_paths([Rectangle((x - w / 2, y), w, box_height)
+                               for x, w, y in zip(effect_sizes, box_widths, bottoms)])
+        self._boxes.set_facecolor(colors)
+
+        total_y = self._row_ys[-1]
+        total_lower_limit = result_model.total_lower_limit
+        total_upper_limit = result_model.total_upper_limit
+        total_effect_size = result_model.total_effect_size
+        self._diamond.set_xy([[total_lower_limit, total_y],
+                              [total_effect_size, total_y + box_height / 2],
+                              [total_upper_limit, total_y],
+                              [total_effect_size, total_y - box_height / 2]])
+        self._diamond.set_fill(result_model.q > 0.5)
+        self._diamond.set_facecolor(self._get_color(total_lower_limit, total_upper_limit))
+
+        # collections are not autoscaled, same margin as autoscale
+        left = min(np.min(lower_limits), total_lower_limit, 0)
+        right = max(np.max(upper_limits), total_upper_limit, 0)
+        margin = (right - left) * 0.05 or 0.5
+        self._forest_ax.set_xlim(left - margin, right + margin)
+
+    def save(self, path, format=None):
+        self.figure.savefig(path, format=format)
+
+_templates = {}
+
+def get_plot_group_details(result_model, plot_group_details=True):
+    """ group details only could be drawn of numerical studies with mean, std, count
+    """
+    table = result_model.table
+    return bool(plot_group_details and table.data_type == data.Study.num
+                and table.has_msn())
+
+def get_template(n_studies, plot_group_details=True):
+    """ ForestTemplate of n_studies studies, built once per process
+    """
+    key = (n_studies, bool(plot_group_details))
+    if key not in _templates:
+        _templates[key] = ForestTemplate(n_studies, plot_group_details)
+    return _templates[key]
+
+def plot_forest(result_model, save_path, title='meta analysis',
+                plot_group_details=True, formats=None):
+    """ draw forest plot of a model on a cached template and save it
+    Args:
+        result_model: model.Model instance
+        save_path: str, filepath, or filepath without extension if formats given
+        title: str, title in summary
+        plot_group_details: bool, draw mean, std, count of groups if available
+        formats: tuple of extensions, e.g. ('png', 'pdf'), None means use
+                 save_path's extension
+    Return:
+        pathes: list of saved filepathes
+    """
+    template = get_template(len(result_model.table),
+                            get_plot_group_details(result_model, plot_group_details))
+    template.draw(result_model, title)
+    if formats is None:
+        template.save(save_path)
+        return [save_path]
+    pathes = []
+    for extension in formats:
+        path = '{}.{}'.format(save_path, extension)
+        template.save(path, format=extension)
+        pathes.append(path)
+    return pathes
+
+def _export_chunk(items, output_dir, formats, plot_group_details):
+    pathes = []
+    for name, title, result_model in items:
+        pathes.append(plot_forest(result_model, os.path.join(output_dir, str(name)),
+                                  title, plot_group_details, formats))
+    return pathes
+
+def export_forest_plots(models, output_dir, formats=('png',), titles=None,
+                        plot_group_details=True, n_jobs=1, chunks_per_job=4):
+    """ export forest plots of lots of models, e.g. every region of an atlas
+    Args:
+        models: dict, {name: model.Model instance}, name is used as filename
+        output_dir: str, directory to save plots
+        formats: tuple of FORMATS
+        titles: dict, {name: title}, default title is name
+        plot_group_details: bool, draw mean, std, count of groups if available
+        n_jobs: int, count of processes, -1 means all cpus
+        chunks_per_job: int, models are split into n_jobs * chunks_per_job chunks
+    Return:
+        pathes: dict, {name: list of saved filepathes}
+    """
+    for extension in formats:
+        if extension not in FORMATS:
+            raise ValueError('Unsupported format: {}, should be one of {}'.format(
+                             extension, FORMATS))
+    os.makedirs(output_dir, exist_ok=True)
+    titles = titles or {}
+    items = [(name, str(titles.get(name, name)), result_model)
+             for name, result_model in models.items()]
+    # models of same count of studies share a template, keep them in same chunk
+    order = sorted(range(len(items)), key=lambda i: len(items[i][2].table))
+    n_chunks = max(min(parallel.get_n_jobs(n_jobs) * chunks_per_job, len(items)), 1)
+    chunks = [[items[i] for i in indexes] for indexes in np.array_split(order, n_chunks)]
+    chunk_pathes = parallel.map_blocks(_export_chunk, chunks, n_jobs,
+                                       args=(output_dir, tuple(formats), plot_group_details))
+    pathes = {}
+    for chunk, chunk_path in zip(chunks, chunk_pathes):
+        for (name, _, _), path in zip(chunk, chunk_path):
+            pathes[name] = path
+    return {name: pathes[name] for name in models}
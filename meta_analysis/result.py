@@ -0,0 +1,159 @@
+""" result module, results of voxelwise meta analysis only for in-mask voxels
+
+Results are stored as (statistics, in-mask voxels) with flatten indexes of
+those voxels, full volumes are only built on request.
+
+Class:
+    MaskedResult(object): in-mask results with lazy densification
+
+Author: Kang Xiaopeng
+Data: 2026/10/17
+E-mail: kangxiaopeng2018@ia.ac.cn
+
+This file is part of meta_analysis.
+
+meta_analysis is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+meta_analysis is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with meta_analysis.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import os
+
+import numpy as np
+
+from . import utils
+
+class MaskedResult(object):
+    """ results of in-mask voxels, densified to volumes on request
+
+    Attributes:
+        data: ndarray, shape (len(names), voxels), results of in-mask voxels
+        indexes: 1d ndarray, sorted flatten indexes of in-mask voxels in volume
+        shape: tuple, shape of volume
+        names: tuple, names of statistics
+
+    Function:
+        from_dense(results, _mask, names): build from dense results
+        get(name): in-mask values of a statistic, no copy
+        select(names): MaskedResult of some statistics, no copy
+        get_voxel(coordinate): all statistics of one voxel
+        get_volume(name, fill, out): dense volume of a statistic
+        to_dense(fill): dense (statistics, volume) array
+        to_nii(name, template_nii, path): nii of a statistic
+        to_niis(template_nii, output_dir): save nii of every statistic
+    """
+    def __init__(self, data, indexes, shape, names):
+        super().__init__()
+        self.data = data
+        self.indexes = np.asarray(indexes)
+        self.shape = tuple(shape)
+        self.names = tuple(names)
+        if self.data.shape != (len(self.names), len(self.indexes)):
+            raise ValueError('Data shape {} differ from ({}, {})'.format(
+                             self.data.shape, len(self.names), len(self.indexes)))
+
+    @classmethod
+    def from_dense(cls, results, _mask, names):
+        """ build from dense results of shape (statistics,) + volume shape
+        """
+        indexes = np.flatnonzero(_mask.data)
+        data = np.reshape(results, (len(results), -1))[:, indexes]
+        return cls(data, indexes, _mask.get_shape(), names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, name):
+        return self.get(name)
+
+    def get(self, name):
+        return self.data[self.names.index(name)]
+
+    def select(self, names):
+        if isinstance(names, str):
+            names = (names,)
+        rows = [self.names.index(name) for name in names]
+        if rows == list(range(rows[0], rows[-1] + 1)):
+            # contiguous rows are a view
+            data = self.data[rows[0]:rows[-1] + 1]
+        else:
+            data = self.data[rows]
+        return MaskedResult(data, self.indexes, self.shape, names)
+
+    def get_voxel(self, coordinate, fill=np.nan):
+        """ all statistics of one voxel
+        Args:
+            coordinate: tuple, index of voxel in volume
+            fill: value of out-mask voxel
+        Return:
+            values: ndarray, shape (len(names),)
+        """
+        index = np.ravel_multi_index(tuple(coordinate), self.shape)
+        i = np.searchsorted(self.indexes, index)
+        if i < len(self.indexes) and self.indexes[i] == index:
+            return self.data[:, i]
+        return np.full(len(self.names), fill, dtype=self.data.dtype)
+
+    def _write_volume(self, values, fill, out):
+        if out is None:
+            out = np.empty(self.shape, dtype=self.data.dtype)
+        elif out.shape != self.shape or not out.flags.c_contiguous:
+            raise ValueError('out should be C contiguous of shape {}, got {}'.format(
+                             self.shape, out.shape))
+        flat = out.reshape(-1)
+        flat.fill(fill)
+        flat[self.indexes] = values
+        return out
+
+    def get_volume(self, name, fill=0, out=None):
+        """ dense volume of a statistic
+        Args:
+            name: str, name of statistic
+            fill: value of out-mask voxels
+            out: C contiguous ndarray of volume shape, written in place if given
+        Return:
+            volume: ndarray, shape of volume
+        """
+        return self._write_volume(self.get(name), fill, out)
+
+    def to_dense(self, fill=0):
+        """ dense array of shape (len(names),) + shape, same as
+            voxelwise_meta_analysis() returns. Every statistic is written
+            into its slice of one uninitialized output.
+        """
+        dense = np.empty((len(self.names),) + self.shape, dtype=self.data.dtype)
+        for values, volume in zip(self.data, dense):
+            self._write_volume(values, fill, volume)
+        return dense
+
+    def __array__(self, dtype=None, copy=None):
+        dense = self.to_dense()
+        if dtype is not None:
+            dense = dense.astype(dtype)
+        return dense
+
+    def to_nii(self, name, template_nii, path=None, dtype=np.float32):
+        """ nii of a statistic, pass to utils.gen_nii()
+        """
+        return utils.gen_nii(self.get_volume(name), template_nii, path, dtype)
+
+    def to_niis(self, template_nii, output_dir, dtype=np.float32):
+        """ save '<name>.nii' of every statistic in output_dir
+        Return:
+            pathes: list of saved filepathes
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        pathes = []
+        for name in self.names:
+            path = os.path.join(output_dir, '{}.nii'.format(name))
+            self.to_nii(name, template_nii, path, dtype)
+            pathes.append(path)
+        return pathes
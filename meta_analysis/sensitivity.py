@@ -0,0 +1,122 @@
+""" sensitivity module, leave-one-center-out analysis of all voxels at once
+
+Sums of weights and weighted effect sizes of all centers are caculated
+once, every jackknife result subtracts one center's contribution from
+them, DerSimonian-Laird tau square is recomputed the same way, other tau
+square methods are solved again for every left out center.
+
+Function:
+    leave_one_out(effect_sizes, variances, model_type, tau2_method): jackknife es, z, p of every center
+    summarize(loo_results, alpha): min/max z, max p, center drives significance
+
+Author: Kang Xiaopeng
+Data: 2026/10/17
+E-mail: kangxiaopeng2018@ia.ac.cn
+
+This file is part of meta_analysis.
+
+meta_analysis is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+meta_analysis is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with meta_analysis.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import numpy as np
+
+from . import model
+
+LOO_RESULT_NAMES = ('es', 'z', 'p')
+SUMMARY_NAMES = ('min_z', 'max_z', 'max_p', 'driving_center', 'robust')
+
+def leave_one_out(effect_sizes, variances, model_type='random', tau2_method='dl'):
+    """ meta analysis results with every center left out
+    Args:
+        effect_sizes: ndarray, shape (centers, voxels)
+        variances: ndarray, shape (centers, voxels)
+        model_type: 'fixed' or 'random', meta analysis model.
+        tau2_method: random model's tau square method, pass to model.get_tau_square().
+                     'dl' is caculated from leave-one-out sums, others are
+                     solved again for every left out center.
+    Return:
+        loo_results: ndarray, shape (centers, len(LOO_RESULT_NAMES), voxels),
+                     loo_results[i] are results without center i
+    """
+    effect_sizes = np.asarray(effect_sizes, dtype=np.float64)
+    variances = np.asarray(variances, dtype=np.float64)
+    center_count = effect_sizes.shape[0]
+    if center_count < 2:
+        raise ValueError('Need at least 2 centers to leave one out')
+    if model_type.lower() not in ('random', 'fixed'):
+        raise ValueError('Unsupported model: {}'.format(model_type))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weights = np.reciprocal(variances)
+        weighted_effect_sizes = weights * effect_sizes
+        # every center's sums minus its own contribution
+        sum_weights = np.sum(weights, axis=0) - weights
+        sum_weighted_effect_sizes = np.sum(weighted_effect_sizes, axis=0) - weighted_effect_sizes
+
+        if model_type.lower() == 'fixed':
+            total_effect_size = sum_weighted_effect_sizes / sum_weights
+            total_standard_error = np.sqrt(1 / sum_weights)
+        else:
+            if tau2_method.lower() == 'dl':
+                weighted_square = weighted_effect_sizes * effect_sizes
+                sum_weighted_square = np.sum(weighted_square, axis=0) - weighted_square
+                square_weights = np.square(weights)
+                sum_square_weights = np.sum(square_weights, axis=0) - square_weights
+                q = sum_weighted_square - np.square(sum_weighted_effect_sizes) / sum_weights
+                c = sum_weights - sum_square_weights / sum_weights
+                df = center_count - 2
+                # sums with a center subtracted are inexact, c is compared
+                # with all centers' sum of weights, the scale of its error
+                tau_square = model.get_dl_tau_square(q, df, c, np.sum(weights, axis=0))
+            elif center_count == 2:
+                tau_square = np.zeros_like(effect_sizes)
+            else:
+                tau_square = np.stack([model.get_tau_square(np.delete(effect_sizes, i, axis=0),
+                                                            np.delete(variances, i, axis=0),
+                                                            tau2_method)
+                                       for i in range(center_count)])
+
+            total_effect_size = np.empty_like(effect_sizes)
+            total_standard_error = np.empty_like(effect_sizes)
+            for i in range(center_count):
+                random_weights = np.reciprocal(variances + tau_square[i])
+                random_weights[i] = 0
+                sum_random_weights = np.sum(random_weights, axis=0)
+                total_effect_size[i] = np.sum(random_weights * effect_sizes, axis=0) /\
+                                       sum_random_weights
+                total_standard_error[i] = np.sqrt(1 / sum_random_weights)
+        z = model.get_z_value(total_effect_size, total_standard_error)
+        p = model.get_p_from_z(z)
+    return np.stack((total_effect_size, z, p), axis=1)
+
+def summarize(loo_results, alpha=0.05):
+    """ summarize leave-one-out results of every voxel
+    Args:
+        loo_results: ndarray, returned by leave_one_out()
+        alpha: float, significance level
+    Return:
+        summary: ndarray, shape (len(SUMMARY_NAMES), voxels)
+            min_z, max_z: range of z over all leave-one-out results
+            max_p: largest p, i.e. p after leaving out the most influential center
+            driving_center: index of the most influential center, removing it
+                            weakens significance most
+            robust: 1 if p < alpha whichever center is left out, else 0
+    """
+    z = loo_results[:, LOO_RESULT_NAMES.index('z')]
+    p = loo_results[:, LOO_RESULT_NAMES.index('p')]
+    p = np.where(np.isnan(p), 1, p)
+    driving_center = np.argmax(p, axis=0)
+    max_p = np.max(p, axis=0)
+    # fmin/fmax ignore nan
+    return np.stack((np.fmin.reduce(z, axis=0), np.fmax.reduce(z, axis=0),
+                     max_p, driving_center, max_p < alpha))
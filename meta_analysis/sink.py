@@ -0,0 +1,170 @@
+""" sink module, stream results into nii files on disk
+
+Nii files are preallocated with template's header and affine, their data
+are memory mapped, so blocks of results are written as they are caculated
+and whole volumes of results never need to be held in memory. A sink is
+pickled by path like parallel.SharedArray, workers of a process pool write
+their blocks into same files.
+
+Function:
+    get_vox_offset(header): bytes before data, extensions included
+    create_nii(path, template_nii, shape, dtype): write header of nii for memory map
+
+Class:
+    NiiSink(object): preallocated nii files of results, written block by block
+
+Author: Kang Xiaopeng
+Data: 2026/10/17
+E-mail: kangxiaopeng2018@ia.ac.cn
+
+This file is part of meta_analysis.
+
+meta_analysis is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+meta_analysis is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with meta_analysis.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import os
+
+import numpy as np
+
+# bytes of nifti1 header and extension flag, before extensions
+VOX_OFFSET = 352
+
+def get_vox_offset(header):
+    """ bytes before data, header's extensions included, multiple of 16
+    """
+    offset = VOX_OFFSET + int(header.extensions.get_sizeondisk())
+    return -(-offset // 16) * 16
+
+def create_nii(path, template_nii, shape, dtype=np.float32):
+    """ write header of nii filled with zeros, data is left for memory map
+    Args:
+        path: str, filepath, must be uncompressed .nii
+        template_nii: nibabel Nifti1 instance, use its affine and header
+        shape: tuple, shape of data
+        dtype: dtype of data
+    Return:
+        offset: int, bytes before data
+        dtype: np.dtype of data with header's byte order
+    """
+    header = template_nii.header.copy()
+    header.set_data_shape(shape)
+    header.set_data_dtype(dtype)
+    header.set_slope_inter(None, None)
+    header.set_qform(template_nii.affine)
+    header.set_sform(template_nii.affine)
+    # extensions of template, e.g. from other pipelines, are kept
+    offset = get_vox_offset(header)
+    header['vox_offset'] = offset
+    data_dtype = header.get_data_dtype()
+    with open(path, 'wb') as f:
+        header.write_to(f)
+        f.write(b'\x00' * (offset - f.tell()))
+        f.truncate(offset + int(np.prod(shape)) * data_dtype.itemsize)
+    return offset, data_dtype
+
+class NiiSink(object):
+    """ preallocated nii files of results, written block by block
+
+    Attributes:
+        names: tuple, names of statistics, e.g. engine.RESULT_NAMES
+        dtype: np.dtype, dtype of nii data
+        shape: tuple, shape of volume
+        pathes: list of str, filepathes of nii files
+        split: bool, one 3-D nii per statistic instead of one 4-D nii
+
+    Function:
+        write(results, indexes): write block of results
+        get_array(name): return memory mapped volume of a statistic
+        flush(): flush written blocks to disk
+        close(): flush and drop memory maps
+    """
+    def __init__(self, path, names, template_nii, dtype=np.float32, split=False):
+        """
+        Args:
+            path: str, 4-D nii filepath, or directory holds '<name>.nii' of
+                  every statistic if split
+            names: names of statistics, same order as results to write
+            template_nii: nibabel Nifti1 instance or its filepath
+            dtype: dtype of nii data
+            split: bool, one file per statistic
+        """
+        super().__init__()
+        if isinstance(template_nii, str):
+            import nibabel as nib
+            template_nii = nib.load(template_nii)
+        self.names = tuple(names)
+        self.dtype = np.dtype(dtype)
+        self.shape = tuple(template_nii.shape[:3])
+        self.split = split
+        if split:
+            os.makedirs(path, exist_ok=True)
+            self.pathes = [os.path.join(path, '{}.nii'.format(name)) for name in self.names]
+            file_shape = self.shape
+        else:
+            if not path.endswith('.nii'):
+                raise ValueError('Only uncompressed .nii could be memory mapped: {}'.format(path))
+            self.pathes = [path]
+            file_shape = self.shape + (len(self.names),)
+        self._files = []
+        for filepath in self.pathes:
+            offset, data_dtype = create_nii(filepath, template_nii, file_shape, dtype)
+            self._files.append((filepath, offset, data_dtype, file_shape))
+        self._arrays = None
+
+    def _get_arrays(self):
+        if self._arrays is None:
+            self._arrays = [np.memmap(filepath, dtype=data_dtype, mode='r+', offset=offset,
+                                      shape=file_shape, order='F')
+                            for filepath, offset, data_dtype, file_shape in self._files]
+        return self._arrays
+
+    def get_array(self, name):
+        """ return memory mapped 3-D volume of a statistic
+        """
+        i = self.names.index(name)
+        arrays = self._get_arrays()
+        if self.split:
+            return arrays[i]
+        return arrays[0][..., i]
+
+    def write(self, results, indexes):
+        """ write block of results
+        Args:
+            results: ndarray, shape (len(names), voxels)
+            indexes: 1d ndarray, flatten (C order) indexes of voxels in volume
+        """
+        # nii data is fortran ordered
+        multi_index = np.unravel_index(indexes, self.shape)
+        for name, result in zip(self.names, results):
+            self.get_array(name)[multi_index] = result
+
+    def flush(self):
+        if self._arrays is not None:
+            for array in self._arrays:
+                array.flush()
+
+    def close(self):
+        self.flush()
+        self._arrays = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __getstate__(self):
+        self.flush()
+        state = self.__dict__.copy()
+        state['_arrays'] = None
+        return state
@@ -2,10 +2,22 @@
 
 Function:
     load_array(path): load nii's array.
+    get_nii_shape(path): get nii's shape from its header.
     load_arrays(pathes, axis): load niis' array then stack them along 'axis'.
+    get_mask_index(mask_data, shape): get index of in-mask voxels within 'shape'.
+    load_masked_array(path, mask_index): load only in-mask voxels of nii as 1d array.
+    load_masked_arrays(pathes, mask_index): load niis' in-mask voxels then stack them.
+    gen_blocks(length, block_size): generate contiguous slices to split 'length' items.
+    sum_by_segment(array, starts): sum every contiguous segment of array.
     cal_mean_std_n(arrays, axis): calculate arrays' mean, std, count along 'axis'.
+    load_mean_std_n(pathes, dtype, mask_index): stream niis one by one, calculate mean, std, count.
+    load_mean_std_n_dict(pathes_dict, dtype, mask_index, n_jobs, backend, reducer): load lots of
+                         groups' niis in a thread or process pool, calculate mean, std, count.
     gen_nii(array, template_nii, path): generate nii file using template's header and affine
 
+Class:
+    RunningMeanStd(object): Welford's online mean, std, count accumulator.
+
 Author: Kang Xiaopeng
 Data: 2020/03/06
 E-mail: kangxiaopeng2018@ia.ac.cn
@@ -26,22 +38,96 @@ You should have received a copy of the GNU General Public License
 along with meta_analysis.  If not, see <https://www.gnu.org/licenses/>.
 """
 import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from functools import partial
 
 import numpy as np
-import nibabel as nib
+
+from . import instrument
+from . import parallel
 
 def load_array(path, dtype=np.float32):
+    import nibabel as nib
     nii = nib.load(path)
     array = np.asarray(nii.dataobj, dtype=dtype)
     array = np.nan_to_num(array)
     return array
 
+def get_nii_shape(path):
+    import nibabel as nib
+    return tuple(nib.load(path).shape)
+
 def load_arrays(pathes, dtype=np.float32, axis=0):
     arrays = np.array([])
     if pathes:
         arrays = np.stack([load_array(path, dtype) for path in pathes], axis=axis)
     return arrays
 
+def get_mask_index(mask_data, shape=None):
+    """ get index of in-mask voxels, ordered the same as np.flatnonzero(mask_data)
+    Args:
+        mask_data: ndarray, nonzero voxels are in mask
+        shape: shape of array to index, default mask_data's shape.
+               mask_data could be flatten as long as it has the same size.
+    Return:
+        mask_index: tuple of ndarray, could be used to index array of 'shape'
+    """
+    mask_data = np.asarray(mask_data)
+    if shape is None or tuple(shape) == mask_data.shape:
+        return np.nonzero(mask_data)
+    if np.prod(shape) != mask_data.size:
+        raise AssertionError('Mask shape couldn\'t fit with data')
+    return np.unravel_index(np.flatnonzero(mask_data), shape)
+
+def load_masked_array(path, mask_index, dtype=np.float32):
+    """ load only in-mask voxels of nii.
+        uncompressed nii is memory mapped, so only in-mask voxels are read,
+        NaNs are cleaned in place and dtype is cast only when needed.
+    Args:
+        path: nii filepath
+        mask_index: tuple of ndarray from get_mask_index(), or mask ndarray
+        dtype: dtype of returned array
+    Return:
+        array: 1d ndarray of in-mask voxels
+    """
+    import nibabel as nib
+    nii = nib.load(path, mmap=True)
+    dataobj = nii.dataobj
+    if nib.is_proxy(dataobj):
+        raw = dataobj.get_unscaled()
+        slope, inter = dataobj.slope, dataobj.inter
+    else:
+        raw = np.asanyarray(dataobj)
+        slope, inter = 1.0, 0.0
+    if not isinstance(mask_index, tuple):
+        mask_index = get_mask_index(mask_index, raw.shape)
+    array = np.asarray(raw[mask_index])
+    if slope != 1.0 or inter != 0.0:
+        array = array * slope + inter
+    array = array.astype(dtype, copy=False)
+    np.nan_to_num(array, copy=False)
+    return array
+
+def gen_blocks(length, block_size):
+    """ generate contiguous slices, each one has at most block_size items
+    """
+    block_size = max(int(block_size), 1)
+    for start in range(0, length, block_size):
+        yield slice(start, min(start + block_size, length))
+
+def load_masked_arrays(pathes, mask_index=None, dtype=np.float32):
+    """ load niis' in-mask voxels, then stack them
+    Args:
+        pathes: list of nii filepathes
+        mask_index: pass to load_masked_array(), None means flatten whole volume
+        dtype: dtype of loaded arrays
+    Return:
+        arrays: 2d ndarray, shape (len(pathes), voxels)
+    """
+    return np.stack([_load(path, dtype, mask_index).reshape(-1) for path in pathes])
+
 def cal_mean_std_n(arrays, axis=0):
     arrays = np.asarray(arrays)
     mean = np.mean(arrays, axis=axis)
@@ -49,6 +135,173 @@ def cal_mean_std_n(arrays, axis=0):
     n = arrays.shape[axis]
     return mean, std, n
 
+class RunningMeanStd(object):
+    """ Welford's online algorithm, accumulate arrays one by one in float64,
+        so memory only scales with one array instead of all of them.
+        details in https://en.wikipedia.org/wiki/Algorithms_for_calculating_variance
+
+    Attributes:
+        n: int, count of accumulated arrays
+        mean: ndarray, running mean
+        m2: ndarray, running sum of squares of differences from the mean
+
+    Function:
+        update(array): accumulate one array
+        get_mean_std_n(dtype): return mean, std, count, nan mean and std if empty
+    """
+    def __init__(self):
+        super().__init__()
+        self.n = 0
+        self.mean = None
+        self.m2 = None
+
+    def update(self, array):
+        # always copy, array is used as buffer below
+        array = np.array(array, dtype=np.float64)
+        if self.mean is None:
+            self.mean = np.zeros_like(array)
+            self.m2 = np.zeros_like(array)
+        self.n += 1
+        delta = array - self.mean
+        self.mean += delta / self.n
+        # delta * (array - new_mean), computed in place of array
+        np.subtract(array, self.mean, out=array)
+        np.multiply(array, delta, out=array)
+        self.m2 += array
+
+    def get_mean_std_n(self, dtype=None):
+        if not self.n:
+            # empty group, same as cal_mean_std_n() of no array
+            mean = std = np.float64(np.nan)
+        else:
+            mean = self.mean
+            std = np.sqrt(self.m2 / self.n)
+        if dtype is not None:
+            mean, std = mean.astype(dtype), std.astype(dtype)
+        return mean, std, self.n
+
+def load_mean_std_n(pathes, dtype=np.float32, mask_index=None):
+    """ calculate mean, std, count of niis without stacking them,
+        same results as cal_mean_std_n(load_arrays(pathes, dtype))
+    Args:
+        pathes: list of nii filepathes
+        dtype: dtype of loaded arrays and returned mean, std
+        mask_index: if not None, only load in-mask voxels, pass to load_masked_array()
+    Return:
+        mean, std, n: nan, nan, 0 if pathes is empty
+    """
+    accumulator = RunningMeanStd()
+    for path in pathes:
+        if mask_index is None:
+            array = load_array(path, dtype)
+        else:
+            array = load_masked_array(path, mask_index, dtype)
+        accumulator.update(array)
+    return accumulator.get_mean_std_n(dtype)
+
+def sum_by_segment(array, starts):
+    """ sum every contiguous segment of array in one pass, in float64
+    Args:
+        array: 1d ndarray, grouped by segment, e.g. ordered by Mask.get_label_index()
+        starts: 1d int ndarray, start of every segment, no empty segment
+    Return:
+        sums: 1d float64 ndarray, shape (len(starts),)
+    """
+    return np.add.reduceat(array, starts, dtype=np.float64)
+
+def _load(path, dtype, mask_index, reducer=None):
+    with instrument.stage('decode', files=1):
+        if mask_index is None:
+            array = load_array(path, dtype)
+        else:
+            array = load_masked_array(path, mask_index, dtype)
+        if reducer is not None:
+            array = reducer(array)
+    return array
+
+_loader_args = None
+
+def _init_loader(dtype, mask_index, reducer):
+    # mask_index is sent to every process once, instead of with every file
+    global _loader_args
+    _loader_args = (dtype, mask_index, reducer)
+
+def _load_in_process(path):
+    # no Instrument in worker process, decode time is returned to parent
+    start = time.perf_counter()
+    array = _load(path, *_loader_args)
+    return array, time.perf_counter() - start
+
+def _get_process_result(future):
+    array, elapsed = future.result()
+    instrument.record('decode', elapsed, files=1)
+    return array
+
+def load_mean_std_n_dict(pathes_dict, dtype=np.float32, mask_index=None,
+                         n_jobs=1, backend='thread', reducer=None):
+    """ load every group's niis with a pool of workers, files are decompressed
+        in parallel and fed to each group's RunningMeanStd in order, so
+        results are identical to load_mean_std_n().
+    Args:
+        pathes_dict: {key1:[filepath1, filepath2], key2:[...]}
+        dtype: dtype of loaded arrays and returned mean, std
+        mask_index: if not None, only load in-mask voxels, pass to load_masked_array()
+        n_jobs: int, count of workers, -1 means all cpus
+        backend: 'thread' or 'process'. gzip decoding releases the GIL,
+                 so threads are usually enough and avoid pickling arrays.
+        reducer: picklable function, applied to every loaded array inside
+                 workers, e.g. partial(sum_by_segment, ...). If not None,
+                 returned mean, std are kept in float64.
+    Return:
+        msn_dict: {key1:(mean, std, n), ...}
+    """
+    n_jobs = parallel.get_n_jobs(n_jobs)
+    accumulators = {key: RunningMeanStd() for key in pathes_dict}
+    tasks = [(key, path) for key, pathes in pathes_dict.items() for path in pathes]
+    with instrument.stage('load', files=len(tasks)):
+        _load_tasks(tasks, accumulators, dtype, mask_index, n_jobs, backend, reducer)
+    if reducer is not None:
+        dtype = None
+    return {key: accumulator.get_mean_std_n(dtype)
+            for key, accumulator in accumulators.items()}
+
+def _update(accumulator, array, done, total):
+    with instrument.stage('reduce'):
+        accumulator.update(array)
+    instrument.progress('load', done, total)
+
+def _load_tasks(tasks, accumulators, dtype, mask_index, n_jobs, backend, reducer):
+    if n_jobs == 1:
+        for i, (key, path) in enumerate(tasks):
+            _update(accumulators[key], _load(path, dtype, mask_index, reducer),
+                    i + 1, len(tasks))
+    else:
+        if backend == 'thread':
+            executor = ThreadPoolExecutor(max_workers=n_jobs)
+            load = partial(_load, dtype=dtype, mask_index=mask_index, reducer=reducer)
+            get_result = lambda future: future.result()
+        elif backend == 'process':
+            executor = ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_loader,
+                                           initargs=(dtype, mask_index, reducer))
+            load = _load_in_process
+            get_result = _get_process_result
+        else:
+            raise ValueError('Unsupported backend: {}'.format(backend))
+        with executor:
+            # bounded window of files in flight, keeps memory at ~2 * n_jobs arrays
+            pending = deque()
+            done = 0
+            for key, path in tasks:
+                pending.append((key, executor.submit(load, path)))
+                if len(pending) >= 2 * n_jobs:
+                    key, future = pending.popleft()
+                    done += 1
+                    _update(accumulators[key], get_result(future), done, len(tasks))
+            while pending:
+                key, future = pending.popleft()
+                done += 1
+                _update(accumulators[key], get_result(future), done, len(tasks))
+
 def gen_nii(array, template_nii, path=None, dtype=np.float32):
     """ generate nii file using template's header and affine
         if input path then save nii in disk.
@@ -59,6 +312,7 @@ def gen_nii(array, template_nii, path=None, dtype=np.float32):
     Return:
         nii: nibabel Nifti1 instance 
     """
+    import nibabel as nib
     affine = template_nii.affine
     header = template_nii.header
     header.set_data_dtype(dtype)
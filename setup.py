@@ -1,4 +1,4 @@
-from setuptools import setup, find_packages
+from setuptools import setup
 
 with open("README.md", "r") as fh:
     long_description = fh.read()
@@ -11,6 +11,11 @@ setup(
     long_description=long_description,
     long_description_content_type="text/markdown",
     url="",
-    packages=find_packages('./meta_analysis'),
+    # meta_analysis has no __init__.py, find_packages() would miss it
+    packages=['meta_analysis'],
     python_requires='>=3.7',
+    extras_require={'yaml': ['PyYAML']},
+    entry_points={
+        'console_scripts': ['meta-analysis=meta_analysis.cli:main'],
+    },
 )
\ No newline at end of file
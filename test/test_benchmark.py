@@ -0,0 +1,46 @@
+import json
+import os
+import sys
+
+import nibabel as nib
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                'benchmark'))
+import bench_import
+import bench_meta
+import synthetic
+
+def test_gen_cohort(tmp_path):
+    cohorts = [synthetic.gen_cohort(str(tmp_path / str(i)), n_centers=2, n_subjects=3,
+                                    shape=(10, 12, 8), density=.3, extension='.nii.gz')
+               for i in range(2)]
+    mask_data = np.asarray(nib.load(cohorts[0]['mask']).dataobj)
+    assert abs(np.count_nonzero(mask_data) / mask_data.size - .3) < .01
+    # same seed, same files
+    for pathes1, pathes2 in zip(cohorts[0]['center_dict']['center1'].values(),
+                                cohorts[1]['center_dict']['center1'].values()):
+        assert len(pathes1) == 3
+        for path1, path2 in zip(pathes1, pathes2):
+            assert np.array_equal(nib.load(path1).get_fdata(), nib.load(path2).get_fdata())
+
+def test_bench_meta(tmp_path):
+    output = str(tmp_path / 'bench.json')
+    bench_meta.main(['--centers', '2', '--subjects', '3', '--shape', '8', '9', '7',
+                     '--repeat', '1', '--work-dir', str(tmp_path), '--output', output])
+    with open(output) as f:
+        report = json.load(f)
+    assert list(report['results']) == list(bench_meta.BENCHMARK_NAMES)
+    for result in report['results'].values():
+        assert result['min'] > 0 and result['peak_memory'] > 0
+
+def test_bench_import(tmp_path):
+    output = str(tmp_path / 'import.json')
+    bench_import.main(['--repeat', '1', '--only', 'meta_analysis.main',
+                       'meta_analysis.plot', '--output', output])
+    with open(output) as f:
+        results = json.load(f)['results']
+    # heavy dependencies are only imported by features need them
+    assert results['meta_analysis.main']['modules'] == []
+    assert 'matplotlib' in results['meta_analysis.plot']['modules']
+    assert 'matplotlib.pyplot' not in results['meta_analysis.plot']['modules']
@@ -0,0 +1,51 @@
+import os
+
+import numpy as np
+from meta_analysis import cache, main, utils
+
+from test_utils import gen_niis
+
+def test_summary_cache(tmp_path, monkeypatch):
+    center_dict = {}
+    for center_name in ['a', 'b']:
+        center_dict[center_name] = {}
+        for label in [1, 3]:
+            file_dir = tmp_path / '{}{}'.format(center_name, label)
+            file_dir.mkdir()
+            center_dict[center_name][label] = gen_niis(file_dir, n=3,
+                                                       seed=len(center_dict)*label)
+    summary_cache = cache.SummaryCache(str(tmp_path / 'cache'))
+    msn = main.gen_msn_dict(center_dict)
+    cached_msn = main.gen_msn_dict(center_dict, summary_cache=summary_cache)
+    assert len(os.listdir(summary_cache.cache_dir)) == 4
+
+    # hit: files are never read
+    def load_mean_std_n_dict(pathes_dict, **kwargs):
+        assert not pathes_dict
+        return {}
+    monkeypatch.setattr(utils, 'load_mean_std_n_dict', load_mean_std_n_dict)
+    hit_msn = main.gen_msn_dict(center_dict, summary_cache=summary_cache)
+    for result in [cached_msn, hit_msn]:
+        for expected_dict, result_dict in zip(msn, result):
+            for center_name in center_dict:
+                for label in [1, 3]:
+                    assert np.array_equal(expected_dict[center_name][label],
+                                          result_dict[center_name][label])
+
+    # key covers dtype and mask
+    pathes = center_dict['b'][1]
+    mask_index = utils.get_mask_index(np.ones((9, 8, 7)))
+    keys = {summary_cache.get_key(pathes, np.float32),
+            summary_cache.get_key(pathes, np.float64),
+            summary_cache.get_key(pathes, np.float32, mask_index)}
+    assert len(keys) == 3
+
+def test_summary_cache_evict(tmp_path):
+    summary_cache = cache.SummaryCache(str(tmp_path), max_size=5000)
+    array = np.zeros(100)
+    for key in ['a', 'b', 'c', 'd']:
+        summary_cache.set(key, array, array, 1)
+        assert summary_cache.get('a') is not None
+    assert summary_cache.get('a') is not None
+    assert summary_cache.get('b') is None
+    assert summary_cache.get('d') is not None
@@ -0,0 +1,83 @@
+import copy
+import json
+
+import nibabel as nib
+import numpy as np
+import pytest
+from meta_analysis import checkpoint, cli, main, mask
+
+from test_utils import gen_niis
+
+def gen_job(tmp_path):
+    center_dict = {}
+    for center in range(3):
+        center_name = 'center{}'.format(center)
+        center_dict[center_name] = {}
+        for label in ['1', '3']:
+            file_dir = tmp_path / 'centers' / center_name / label
+            file_dir.mkdir(parents=True)
+            center_dict[center_name][label] = gen_niis(file_dir, n=4, seed=center*10+int(label))
+    mask_data = np.random.default_rng(0).integers(0, 2, (9, 8, 7)).astype(np.int16)
+    nib.save(nib.Nifti1Image(mask_data, np.eye(4)), str(tmp_path / 'mask.nii'))
+    spec = {'inputs': {'root': 'centers', 'groups': {'1': '1/*.nii', '3': '3/*.nii'}},
+            'labels': [1, 3], 'mask': 'mask.nii', 'outputs': ['es', 'z', 'p'],
+            'output_dir': 'result', 'output_dtype': 'float64', 'block_size': 40}
+    return center_dict, mask.Mask(mask_data), spec
+
+def test_cli_resume(tmp_path, monkeypatch):
+    center_dict, _mask, spec = gen_job(tmp_path)
+    spec_path = str(tmp_path / 'job.json')
+    with open(spec_path, 'w') as f:
+        json.dump(spec, f)
+    expected = main.voxelwise_meta_analysis('1', '3', center_dict=copy.deepcopy(center_dict),
+                                            _mask=_mask, outputs=spec['outputs'])
+    n_blocks = -(-np.count_nonzero(_mask.data) // spec['block_size'])
+
+    # killed after 2 blocks
+    caculate_block = main._caculate_msn_block
+    calls = []
+    def crash(*args):
+        if len(calls) == 2:
+            raise KeyboardInterrupt
+        calls.append(1)
+        return caculate_block(*args)
+    monkeypatch.setattr(main, '_caculate_msn_block', crash)
+    with pytest.raises(KeyboardInterrupt):
+        cli.main([spec_path])
+    state = checkpoint.Checkpoint(str(tmp_path / 'result' / 'checkpoint')).load_state()
+    assert state['done'] == 2 and state['n_blocks'] == n_blocks
+
+    # resumed from block 2
+    calls.clear()
+    def count(*args):
+        calls.append(1)
+        return caculate_block(*args)
+    monkeypatch.setattr(main, '_caculate_msn_block', count)
+    pathes = cli.main([spec_path])
+    assert len(calls) == n_blocks - 2
+    for path, result in zip(pathes, expected):
+        assert np.array_equal(np.asarray(nib.load(path).dataobj), result)
+
+    # yaml spec listing files, in a process pool, restarted
+    yaml = pytest.importorskip('yaml')
+    spec['inputs'] = {center_name: {label: [p.replace(str(tmp_path) + '/', '') for p in pathes]
+                                    for label, pathes in group_dict.items()}
+                      for center_name, group_dict in center_dict.items()}
+    spec['inputs']['center0']['3'] = 'centers/center0/3/sub*.nii'
+    spec['output_dir'] = 'result_yaml'
+    spec['n_jobs'] = 2
+    yaml_path = str(tmp_path / 'job.yaml')
+    with open(yaml_path, 'w') as f:
+        yaml.safe_dump(spec, f)
+    calls.clear()
+    pathes = cli.main([yaml_path, '--restart'])
+    assert len(calls) == 0
+    for path, result in zip(pathes, expected):
+        assert np.array_equal(np.asarray(nib.load(path).dataobj), result)
+
+    # checkpoint of another job is never resumed
+    spec['method'] = 'hedge_g'
+    with open(yaml_path, 'w') as f:
+        yaml.safe_dump(spec, f)
+    with pytest.raises(ValueError):
+        cli.main([yaml_path])
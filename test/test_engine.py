@@ -0,0 +1,421 @@
+import copy
+
+import numpy as np
+from meta_analysis import main, mask, model, data, engine
+
+def gen_msn(shape=(6, 7, 5), n_center=5, seed=0):
+    rng = np.random.default_rng(seed)
+    center_mean_dict, center_std_dict, center_count_dict = {}, {}, {}
+    for center in range(n_center):
+        center_mean_dict[center] = {1: rng.normal(1, 1, shape).astype(np.float32),
+                                    3: rng.normal(0, 1, shape).astype(np.float32)}
+        center_std_dict[center] = {1: rng.uniform(.5, 2, shape).astype(np.float32),
+                                   3: rng.uniform(.5, 2, shape).astype(np.float32)}
+        center_count_dict[center] = {1: int(rng.integers(10, 40)),
+                                     3: int(rng.integers(10, 40))}
+    _mask = mask.Mask((rng.random(shape) > .3).astype(np.int8))
+    return center_mean_dict, center_std_dict, center_count_dict, _mask
+
+def test_voxelwise_engine():
+    center_mean_dict, center_std_dict, center_count_dict, _mask = gen_msn()
+    for model_type in ['random', 'fixed']:
+        for method in ['cohen_d', 'hedge_g']:
+            results = main.voxelwise_meta_analysis(1, 3,
+                            center_mean_dict=copy.deepcopy(center_mean_dict),
+                            center_std_dict=copy.deepcopy(center_std_dict),
+                            center_count_dict=center_count_dict,
+                            _mask=_mask, model_type=model_type, method=method)
+            assert results.shape == (8,) + _mask.get_shape()
+            assert np.all(results[:, _mask.data == 0] == 0)
+
+            for index in np.argwhere(_mask.data)[:20]:
+                index = tuple(index)
+                studies = []
+                for center_name in center_mean_dict:
+                    groups = [data.NumericalGroup(label,
+                                mean=center_mean_dict[center_name][label][index],
+                                std=center_std_dict[center_name][label][index],
+                                count=center_count_dict[center_name][label])
+                              for label in (1, 3)]
+                    center = data.Center(center_name, groups)
+                    studies.append(center.gen_study(1, 3, method))
+                if model_type == 'random':
+                    result_model = model.RandomModel(studies)
+                else:
+                    result_model = model.FixedModel(studies)
+                assert np.allclose(results[(slice(None),)+index],
+                                   result_model.get_results(), rtol=1e-5)
+
+def test_voxelwise_blocks():
+    center_mean_dict, center_std_dict, center_count_dict, _mask = gen_msn()
+    results = main.voxelwise_meta_analysis(1, 3,
+                    center_mean_dict=copy.deepcopy(center_mean_dict),
+                    center_std_dict=copy.deepcopy(center_std_dict),
+                    center_count_dict=center_count_dict, _mask=_mask)
+    for kwargs in [{'block_size': 7}, {'block_size': 1}, {'max_memory': 4096}]:
+        block_results = main.voxelwise_meta_analysis(1, 3,
+                        center_mean_dict=copy.deepcopy(center_mean_dict),
+                        center_std_dict=copy.deepcopy(center_std_dict),
+                        center_count_dict=center_count_dict, _mask=_mask, **kwargs)
+        assert np.array_equal(results, block_results)
+
+def test_voxelwise_n_jobs():
+    center_mean_dict, center_std_dict, center_count_dict, _mask = gen_msn()
+    results = main.voxelwise_meta_analysis(1, 3,
+                    center_mean_dict=copy.deepcopy(center_mean_dict),
+                    center_std_dict=copy.deepcopy(center_std_dict),
+                    center_count_dict=center_count_dict, _mask=_mask)
+    parallel_results = main.voxelwise_meta_analysis(1, 3,
+                    center_mean_dict=copy.deepcopy(center_mean_dict),
+                    center_std_dict=copy.deepcopy(center_std_dict),
+                    center_count_dict=center_count_dict, _mask=_mask,
+                    block_size=10, n_jobs=3)
+    assert np.array_equal(results, parallel_results)
+
+def test_region_volume(tmp_path):
+    from meta_analysis import utils
+    from test_utils import gen_niis
+
+    center_dict = {}
+    for center in range(3):
+        center_dict[center] = {}
+        for label in [1, 3]:
+            file_dir = tmp_path / '{}_{}'.format(center, label)
+            file_dir.mkdir()
+            center_dict[center][label] = gen_niis(file_dir, n=6+label, seed=center*label)
+    _mask = mask.Mask(np.random.default_rng(3).integers(0, 6, (9, 8, 7)))
+    results = main.region_volume_meta_analysis(copy.deepcopy(center_dict), 1, 3, _mask)
+    assert sorted(results) == list(_mask.get_labels())
+
+    for region_label in _mask.get_labels():
+        studies = []
+        for center_name, group_dict in center_dict.items():
+            groups = []
+            for label, filepathes in group_dict.items():
+                volumes = [_mask.get_masked_volume(utils.load_array(path), region_label)
+                           for path in filepathes]
+                mean, std, count = utils.cal_mean_std_n(np.asarray(volumes, dtype=np.float64))
+                groups.append(data.NumericalGroup(label, mean=mean, std=std, count=count))
+            studies.append(data.Center(center_name, groups).gen_study(1, 3, 'cohen_d'))
+        expected = model.RandomModel(studies).get_results()
+        assert np.allclose(results[region_label], expected, rtol=1e-5)
+
+def test_multi_contrast():
+    center_mean_dict, center_std_dict, center_count_dict, _mask = gen_msn()
+    rng = np.random.default_rng(1)
+    # group 5 only exists in some centers
+    for center_name in [0, 2, 3]:
+        center_mean_dict[center_name][5] = rng.normal(size=_mask.get_shape())
+        center_std_dict[center_name][5] = rng.uniform(.5, 2, _mask.get_shape())
+        center_count_dict[center_name][5] = 12
+    contrasts = [(1, 3), (3, 1), (5, 1), (1, 5)]
+    results_dict = main.multi_contrast_meta_analysis(contrasts,
+                    center_mean_dict=copy.deepcopy(center_mean_dict),
+                    center_std_dict=copy.deepcopy(center_std_dict),
+                    center_count_dict=center_count_dict, _mask=_mask, block_size=50)
+    assert list(results_dict) == contrasts
+    for label1, label2 in contrasts:
+        results = main.voxelwise_meta_analysis(label1, label2,
+                    center_mean_dict=copy.deepcopy(center_mean_dict),
+                    center_std_dict=copy.deepcopy(center_std_dict),
+                    center_count_dict=center_count_dict, _mask=_mask)
+        assert np.allclose(results_dict[(label1, label2)], results, equal_nan=True)
+
+def test_leave_one_out():
+    center_mean_dict, center_std_dict, center_count_dict, _mask = gen_msn()
+    summary, loo_results, center_names = main.voxelwise_leave_one_out(1, 3,
+                    center_mean_dict=copy.deepcopy(center_mean_dict),
+                    center_std_dict=copy.deepcopy(center_std_dict),
+                    center_count_dict=center_count_dict, _mask=_mask, block_size=40)
+    assert loo_results.shape == (len(center_names), 3) + _mask.get_shape()
+    for i, center_name in enumerate(center_names):
+        left_mean_dict = copy.deepcopy(center_mean_dict)
+        left_std_dict = copy.deepcopy(center_std_dict)
+        left_mean_dict.pop(center_name)
+        left_std_dict.pop(center_name)
+        results = main.voxelwise_meta_analysis(1, 3, center_mean_dict=left_mean_dict,
+                    center_std_dict=left_std_dict, center_count_dict=center_count_dict,
+                    _mask=_mask)
+        assert np.allclose(loo_results[i], results[[0, 6, 7]])
+    z = loo_results[:, 1]
+    assert np.allclose(summary[0], z.min(axis=0))
+    assert np.allclose(summary[1], z.max(axis=0))
+    assert np.array_equal(summary[3], np.argmax(loo_results[:, 2], axis=0))
+
+def test_leave_one_out_two_centers():
+    # one center is left, subtracted sums must not leave a tau square
+    from meta_analysis import sensitivity
+    rng = np.random.default_rng(5)
+    effect_sizes = rng.normal(0, 1, (2, 20000))
+    variances = rng.uniform(.01, 1, (2, 20000)) * 10. ** rng.integers(-3, 3, (2, 20000))
+    for model_type in ['random', 'fixed']:
+        loo_results = sensitivity.leave_one_out(effect_sizes, variances, model_type)
+        for i in range(2):
+            left_results = engine.caculate(effect_sizes[[1 - i]], variances[[1 - i]],
+                                           model_type)
+            assert np.allclose(loo_results[i], left_results[[0, 6, 7]])
+
+def test_tau_square():
+    from meta_analysis import sensitivity
+    rng = np.random.default_rng(2)
+    m1, m2 = rng.normal(0, 1, (6, 50)), rng.normal(0, 1, (6, 50))
+    s1, s2 = rng.uniform(.5, 2, (6, 50)), rng.uniform(.5, 2, (6, 50))
+    n1, n2 = rng.integers(10, 40, (6, 1)), rng.integers(10, 40, (6, 1))
+    effect_sizes, variances = engine.cohen_d(m1, s1, n1, m2, s2, n2)
+    df = effect_sizes.shape[0] - 1
+    for method in model.TAU2_METHODS:
+        tau_square, report = model.get_tau_square(effect_sizes, variances, method,
+                                                  return_report=True)
+        assert tau_square.shape == (50,) and np.all(tau_square >= 0)
+        assert np.all(report['converged'])
+        results = engine.caculate(effect_sizes, variances, tau2_method=method)
+        for i in range(0, 50, 7):
+            studies = []
+            for j in range(effect_sizes.shape[0]):
+                groups = [data.NumericalGroup(1, mean=m1[j, i], std=s1[j, i], count=n1[j, 0]),
+                          data.NumericalGroup(3, mean=m2[j, i], std=s2[j, i], count=n2[j, 0])]
+                studies.append(data.Center(j, groups).gen_study(1, 3, 'cohen_d'))
+            random_model = model.RandomModel(studies, tau2_method=method)
+            assert np.isclose(random_model.tau_square, tau_square[i])
+            assert np.allclose(results[:, i], random_model.get_results())
+        loo_results = sensitivity.leave_one_out(effect_sizes, variances, 'random', method)
+        for i in range(effect_sizes.shape[0]):
+            left_results = engine.caculate(np.delete(effect_sizes, i, axis=0),
+                                           np.delete(variances, i, axis=0),
+                                           tau2_method=method)
+            assert np.allclose(loo_results[i], left_results[[0, 6, 7]])
+
+    # Paule-Mandel solves generalized Q(tau_square) = k - 1
+    tau_square = model.get_tau_square(effect_sizes, variances, 'pm')
+    weights = 1 / (variances + tau_square)
+    mean = np.sum(weights * effect_sizes, axis=0) / np.sum(weights, axis=0)
+    q = np.sum(weights * np.square(effect_sizes - mean), axis=0)
+    positive = tau_square > 0
+    assert np.any(positive)
+    assert np.allclose(q[positive], df)
+    assert np.all(q[~positive] <= df)
+
+    # REML maximizes restricted log likelihood
+    def restricted_likelihood(tau_square, es, var):
+        weights = 1 / (var + tau_square)
+        mean = np.sum(weights * es) / np.sum(weights)
+        return -.5 * (np.sum(np.log(var + tau_square)) + np.log(np.sum(weights))
+                      + np.sum(weights * np.square(es - mean)))
+    tau_square = model.get_tau_square(effect_sizes, variances, 'reml')
+    for i in range(0, 50, 5):
+        grid = np.linspace(0, 2 * tau_square[i] + 1, 20001)
+        likelihoods = [restricted_likelihood(t, effect_sizes[:, i], variances[:, i])
+                       for t in grid]
+        assert abs(grid[np.argmax(likelihoods)] - tau_square[i]) <= grid[1]
+
+def test_study_table(tmp_path):
+    import pandas as pd
+    rng = np.random.default_rng(4)
+    names = ['c{}'.format(i) for i in range(7)]
+    m1, m2 = rng.normal(1, 1, 7), rng.normal(0, 1, 7)
+    s1, s2 = rng.uniform(.5, 2, 7), rng.uniform(.5, 2, 7)
+    n1, n2 = rng.integers(10, 40, 7), rng.integers(10, 40, 7)
+    for method in ['cohen_d', 'hedge_g']:
+        table = data.StudyTable.from_msn(names, m1, s1, n1, m2, s2, n2, method)
+        studies = [data.Center(names[i], [data.NumericalGroup(1, mean=m1[i], std=s1[i], count=n1[i]),
+                                          data.NumericalGroup(3, mean=m2[i], std=s2[i], count=n2[i])]
+                               ).gen_study(1, 3, method) for i in range(7)]
+        for model_class in [model.FixedModel, model.RandomModel]:
+            table_model = model_class(table)
+            study_model = model_class(studies)
+            assert np.allclose(table_model.get_results(), study_model.get_results())
+            assert np.allclose(table_model.lower_limits, study_model.lower_limits)
+            assert np.array_equal(study_model.table.names, names)
+            assert np.allclose(study_model.table.counts2, n2)
+
+    csvpath = tmp_path / 'msn.csv'
+    pd.DataFrame({'m1': m1, 's1': s1, 'n1': n1, 'm2': m2, 's2': s2, 'n2': n2},
+                 index=names).to_csv(csvpath)
+    result_model = main.csv_meta_analysis(str(csvpath))
+    assert np.allclose(result_model.get_results(),
+                       model.RandomModel(data.StudyTable.from_msn(
+                           names, m1, s1, n1, m2, s2, n2)).get_results())
+    for tau2_method in model.TAU2_METHODS:
+        result_model = main.csv_meta_analysis(str(csvpath), tau2_method=tau2_method)
+        expected = model.RandomModel(data.StudyTable.from_msn(names, m1, s1, n1, m2, s2, n2),
+                                     tau2_method)
+        assert result_model.tau2_method == tau2_method
+        assert result_model.tau_square == expected.tau_square
+        assert np.allclose(result_model.get_results(), expected.get_results())
+    result_model.plot_forest(save_path=str(tmp_path / 'forest.png'), show=False)
+    assert (tmp_path / 'forest.png').exists()
+
+def test_batch_csv(tmp_path):
+    import pandas as pd
+    rng = np.random.default_rng(5)
+    rows = []
+    for outcome in range(30):
+        # ragged, every outcome has its own count of studies
+        for center in range(int(rng.integers(2, 8))):
+            rows.append(('g{}'.format(outcome), center, rng.normal(1, 1), rng.uniform(.5, 2),
+                         rng.integers(10, 40), rng.normal(0, 1), rng.uniform(.5, 2),
+                         rng.integers(10, 40)))
+    df = pd.DataFrame(rows, columns=('outcome', 'center') + main.MSN_COLUMNS)
+    df = df.sample(frac=1, random_state=0)
+    csvpath = tmp_path / 'long.csv'
+    df.to_csv(csvpath, index=False)
+    for model_type, tau2_method in [('random', 'dl'), ('fixed', 'dl'), ('random', 'reml')]:
+        results = main.batch_csv_meta_analysis(str(csvpath), model_type=model_type,
+                                               tau2_method=tau2_method)
+        assert list(results.index) == list(pd.unique(df['outcome']))
+        for outcome, group in df.groupby('outcome'):
+            table = data.StudyTable.from_msn(group['center'], *[group[column] for column
+                                                                in main.MSN_COLUMNS])
+            if model_type == 'random':
+                expected = model.RandomModel(table, tau2_method).get_results()
+            else:
+                expected = model.FixedModel(table).get_results()
+            assert np.allclose(results.loc[outcome, list(engine.RESULT_NAMES)], expected)
+            assert results.loc[outcome, 'k'] == len(group)
+
+    df['es'], df['var'] = engine.cohen_d(*[df[column].to_numpy() for column in main.MSN_COLUMNS])
+    es_results = main.batch_csv_meta_analysis(df, columns=('es', 'var'))
+    assert np.allclose(es_results, main.batch_csv_meta_analysis(df))
+
+    # outcome of one study, no between-study variance
+    single = df[df['outcome'] == 'g0'].iloc[:1].assign(outcome='single')
+    results = main.batch_csv_meta_analysis(pd.concat([df, single]), columns=('es', 'var'))
+    assert results.loc['single', 'k'] == 1
+    assert np.allclose(results.loc['single', list(engine.RESULT_NAMES)],
+                       model.FixedModel(data.StudyTable(['c'], single['es'].to_numpy(),
+                                                        single['var'].to_numpy())).get_results())
+    for tau2_method in model.TAU2_METHODS:
+        assert model.get_tau_square(single['es'].to_numpy(), single['var'].to_numpy(),
+                                    tau2_method) == 0
+    # rows without outcome
+    missing = df.copy()
+    missing.loc[missing.index[:2], 'outcome'] = np.nan
+    try:
+        main.batch_csv_meta_analysis(missing)
+        assert False
+    except ValueError as e:
+        assert '2 rows have no outcome' in str(e)
+
+def test_categorical(tmp_path):
+    import pandas as pd
+    rng = np.random.default_rng(6)
+    a, b, c, d = rng.integers(0, 30, (4, 8, 20))
+    for method in ['risk_ratio', 'odds_ratio', 'risk_difference']:
+        effect_sizes, variances = engine.get_categorical_effect_sizes(method, a, b, c, d)
+        assert np.all(np.isfinite(effect_sizes)) and np.all(variances > 0)
+        # single table Mantel-Haenszel is the table's own effect size
+        results = engine.mantel_haenszel(a[:1] + 1, b[:1] + 1, c[:1] + 1, d[:1] + 1, method)
+        expected = engine.get_categorical_effect_sizes(method, a[:1] + 1, b[:1] + 1,
+                                                       c[:1] + 1, d[:1] + 1)
+        assert np.allclose(results[0], expected[0][0])
+        assert np.allclose(results[1], expected[1][0])
+        # strata of same proportions pool to same effect size
+        scales = np.arange(1, 9)[:, None]
+        results = engine.mantel_haenszel(scales * (a[0] + 1), scales * (b[0] + 1),
+                                         scales * (c[0] + 1), scales * (d[0] + 1), method)
+        assert np.allclose(results[0], expected[0][0])
+        # q is around Mantel-Haenszel estimate, not inverse variance one
+        results = engine.mantel_haenszel(a, b, c, d, method)
+        effect_sizes, variances = engine.get_categorical_effect_sizes(method, a, b, c, d)
+        assert np.allclose(results[5], np.sum(np.square(effect_sizes - results[0]) / variances,
+                                              axis=0))
+
+        for i in range(0, 20, 6):
+            studies = [data.Center(j, [data.CategoricalGroup(1, a[j, i], b[j, i]),
+                                       data.CategoricalGroup(0, c[j, i], d[j, i])]
+                                   ).gen_study(1, 0, method) for j in range(8)]
+            assert np.allclose(engine.caculate_tables(a, b, c, d, method)[:, i],
+                               model.RandomModel(studies).get_results())
+            ll, ul = studies[0].get_confidence_intervals()
+            assert ll < studies[0].get_effect_size() < ul
+
+    csvpath = tmp_path / 'tables.csv'
+    pd.DataFrame({'a': a[:, 0], 'c': b[:, 0], 'b': c[:, 0], 'd': d[:, 0]}).to_csv(csvpath)
+    result_model = main.csv_meta_analysis(str(csvpath), data_type='cate', method='or')
+    assert np.allclose(result_model.get_results(),
+                       engine.caculate_tables(a, b, c, d, 'or')[:, 0])
+
+    df = pd.DataFrame({'outcome': np.repeat(np.arange(20), 8), 'a': a.T.ravel(),
+                       'b': b.T.ravel(), 'c': c.T.ravel(), 'd': d.T.ravel()})
+    results = main.batch_csv_meta_analysis(df, method='rr', model_type='mh')
+    assert np.allclose(results[list(engine.RESULT_NAMES)].to_numpy().T,
+                       engine.mantel_haenszel(a, b, c, d, 'rr'))
+
+def test_tau2_convergence():
+    rng = np.random.default_rng(3)
+    effect_sizes = rng.normal(0, 1, (6, 200))
+    variances = rng.uniform(.05, 2, (6, 200))
+    tau_square, report = model.get_tau_square(effect_sizes, variances, 'reml', max_iter=3,
+                                              return_report=True)
+    assert np.any(report['converged']) and not np.all(report['converged'])
+    results = engine.caculate(effect_sizes, variances, tau2_method='reml', max_iter=3,
+                              outputs=('tau2', 'tau2_iter', 'converged'))
+    assert np.allclose(results[0], tau_square)
+    assert np.array_equal(results[1], report['iterations'])
+    assert np.array_equal(results[2], report['converged'])
+    dl_results = engine.caculate(effect_sizes, variances, outputs=('tau2_iter', 'converged'))
+    assert np.all(dl_results == [[0], [1]])
+
+    center_mean_dict, center_std_dict, center_count_dict, _mask = gen_msn()
+    in_mask = _mask.data != 0
+    outputs = ('tau2', 'tau2_iter', 'converged')
+    for n_jobs in [1, 2]:
+        results = [main.voxelwise_meta_analysis(1, 3,
+                        center_mean_dict=copy.deepcopy(center_mean_dict),
+                        center_std_dict=copy.deepcopy(center_std_dict),
+                        center_count_dict=center_count_dict, _mask=_mask,
+                        tau2_method='reml', outputs=outputs, n_jobs=n_jobs, block_size=50,
+                        max_iter=max_iter)[:, in_mask]
+                   for max_iter in [2, 100]]
+        assert np.all(results[0][1] <= 2) and np.any(results[0][2] == 0)
+        assert np.all(results[1][2] == 1)
+        converged = results[0][2] == 1
+        assert np.allclose(results[0][0][converged], results[1][0][converged])
+
+def test_outputs():
+    center_mean_dict, center_std_dict, center_count_dict, _mask = gen_msn()
+    kwargs = dict(center_count_dict=center_count_dict, _mask=_mask)
+    results = main.voxelwise_meta_analysis(1, 3, center_mean_dict=copy.deepcopy(center_mean_dict),
+                    center_std_dict=copy.deepcopy(center_std_dict), **kwargs)
+    outputs = ('p', 'z', 'tau2', 'i2', 'h2', 'pi_ll', 'pi_ul')
+    for n_jobs in [1, 2]:
+        selected = main.voxelwise_meta_analysis(1, 3,
+                        center_mean_dict=copy.deepcopy(center_mean_dict),
+                        center_std_dict=copy.deepcopy(center_std_dict), outputs=outputs,
+                        output_dtype=np.float32, n_jobs=n_jobs, block_size=50, **kwargs)
+        assert selected.dtype == np.float32
+        assert selected.shape == (len(outputs),) + _mask.get_shape()
+        assert np.allclose(selected[:2], results[[7, 6]], rtol=1e-5, atol=1e-6)
+
+    in_mask = _mask.data != 0
+    es, var, ll, ul, q = results[[0, 1, 3, 4, 5]][:, in_mask]
+    p, z, tau2, i2, h2, pi_ll, pi_ul = selected[:, in_mask]
+    df = len(center_mean_dict) - 1
+    assert np.allclose(i2, np.maximum((q - df) / q, 0) * 100, rtol=1e-5)
+    assert np.allclose(h2, q / df, rtol=1e-5)
+    from scipy.stats import t
+    assert np.allclose(pi_ul - es, t.ppf(.975, df - 1) * np.sqrt(tau2 + var), rtol=1e-5)
+    assert np.all(pi_ll <= ll + 1e-6) and np.all(pi_ul >= ul - 1e-6)
+
+    # hand computed, k = 4: weights 25, 20, 33.33, 16.67, es = .3, q = 2.5 < df,
+    # so tau2 = 0, i2 = 0, t(.975, 2) = 4.302653
+    effect_sizes = np.array([[.1], [.3], [.5], [.2]])
+    variances = np.array([[.04], [.05], [.03], [.06]])
+    es, var, q, tau2, i2, pi_ll, pi_ul = engine.caculate(effect_sizes, variances,
+                            outputs=('es', 'var', 'q', 'tau2', 'i2', 'pi_ll', 'pi_ul'))[:, 0]
+    assert np.isclose(es, 28.5 / 95) and np.isclose(var, 1 / 95)
+    assert np.isclose(q, 2.5) and tau2 == 0 and i2 == 0
+    assert np.isclose(pi_ul, 28.5 / 95 + 4.302653 * np.sqrt(1 / 95))
+    assert np.isclose(pi_ll, 28.5 / 95 - 4.302653 * np.sqrt(1 / 95))
+    # identical studies, q = 0
+    i2, pi_ll = engine.caculate(np.full((3, 2), .2), np.full((3, 2), .1),
+                                outputs=('i2', 'pi_ll'))
+    assert np.array_equal(i2, [0, 0]) and np.all(np.isfinite(pi_ll))
+    # prediction interval needs 3 studies
+    pi_ll, pi_ul = engine.caculate(effect_sizes[:2], variances[:2], outputs=('pi_ll', 'pi_ul'))
+    assert np.all(np.isnan(pi_ll)) and np.all(np.isnan(pi_ul))
+
+    results_dict = main.multi_contrast_meta_analysis([(1, 3)],
+                        center_mean_dict=copy.deepcopy(center_mean_dict),
+                        center_std_dict=copy.deepcopy(center_std_dict), outputs='z', **kwargs)
+    assert np.allclose(results_dict[(1, 3)][0], results[6])
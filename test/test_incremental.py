@@ -0,0 +1,117 @@
+import copy
+
+import numpy as np
+from meta_analysis import incremental, main
+
+from test_engine import gen_msn
+
+def test_incremental_store(tmp_path):
+    center_mean_dict, center_std_dict, center_count_dict, _mask = gen_msn(n_center=6)
+    store_dir = str(tmp_path / 'store')
+
+    def run(center_names, **kwargs):
+        return main.incremental_meta_analysis(store_dir, 1, 3,
+                    center_mean_dict={c: copy.deepcopy(center_mean_dict[c]) for c in center_names},
+                    center_std_dict={c: copy.deepcopy(center_std_dict[c]) for c in center_names},
+                    center_count_dict=center_count_dict, _mask=_mask, **kwargs)
+
+    def expected(center_names, **kwargs):
+        return main.voxelwise_meta_analysis(1, 3,
+                    center_mean_dict={c: copy.deepcopy(center_mean_dict[c]) for c in center_names},
+                    center_std_dict={c: copy.deepcopy(center_std_dict[c]) for c in center_names},
+                    center_count_dict=center_count_dict, _mask=_mask, **kwargs)
+
+    assert np.allclose(run([0, 1, 2, 3]), expected([0, 1, 2, 3]))
+    # stored centers are skipped, only center 4 is caculated
+    assert np.allclose(run([0, 1, 4]), expected([0, 1, 2, 3, 4]))
+    store = incremental.MetaAnalysisStore(store_dir)
+    assert store.center_names == ['0', '1', '2', '3', '4']
+
+    results = run([5], remove_centers=[2])
+    assert np.allclose(results, expected([0, 1, 3, 4, 5]))
+    for kwargs in [{'model_type': 'fixed'}, {'tau2_method': 'reml', 'block_size': 17}]:
+        assert np.allclose(run([], **kwargs), expected([0, 1, 3, 4, 5], **kwargs))
+
+    store = incremental.MetaAnalysisStore(store_dir)
+    sums = store.sums.copy()
+    store.rebuild()
+    assert np.allclose(sums, store.sums)
+    assert len(list((tmp_path / 'store' / 'centers').iterdir())) == 5
+
+def test_incremental_nonfinite(tmp_path):
+    from meta_analysis import engine
+    rng = np.random.default_rng(0)
+    effect_sizes = rng.normal(size=(4, 6))
+    variances = rng.uniform(.1, 1, size=(4, 6))
+    # zero variance gives infinite weight in center 1
+    variances[1, 2] = 0
+    store = incremental.MetaAnalysisStore(str(tmp_path / 'store'))
+    store.set_volume((6,), np.arange(6), 'cohen_d', (1, 3))
+    for center in range(4):
+        store.add_center(center, effect_sizes[center], variances[center])
+    assert np.array_equal(store.nonfinite_counts, [0, 0, 1, 0, 0, 0])
+    for model_type in ['fixed', 'random']:
+        assert np.allclose(store.caculate(model_type), engine.caculate(effect_sizes, variances,
+                           model_type), equal_nan=True)
+    store.remove_center(1)
+    assert np.all(np.isfinite(store.sums)) and not np.any(store.nonfinite_counts)
+    kept = [0, 2, 3]
+    for model_type in ['fixed', 'random']:
+        results = store.caculate(model_type)
+        assert np.all(np.isfinite(results))
+        assert np.allclose(results, engine.caculate(effect_sizes[kept], variances[kept],
+                                                    model_type))
+
+    # centers, sums and contrast are in one file
+    store = incremental.MetaAnalysisStore(str(tmp_path / 'store'))
+    assert store.center_names == ['0', '2', '3'] and store.labels == ['1', '3']
+    assert sorted(p.name for p in (tmp_path / 'store').iterdir()) == [
+           'centers', 'indexes.npy', 'store.npz']
+    for kwargs in [{'labels': (3, 1)}, {'method': 'hedge_g'},
+                   {'indexes': np.arange(5)}, {'shape': (7,)}]:
+        try:
+            store.check(**kwargs)
+            assert False
+        except ValueError:
+            pass
+    store.check((6,), np.arange(6), 'cohen_d', ('1', 3))
+
+def test_incremental_contrast(tmp_path):
+    center_mean_dict, center_std_dict, center_count_dict, _mask = gen_msn(n_center=3)
+    store_dir = str(tmp_path / 'store')
+    main.incremental_meta_analysis(store_dir, 1, 3,
+                                   center_mean_dict={0: copy.deepcopy(center_mean_dict[0])},
+                                   center_std_dict={0: copy.deepcopy(center_std_dict[0])},
+                                   center_count_dict=center_count_dict, _mask=_mask)
+    other_mask = copy.deepcopy(_mask)
+    other_mask.data = (_mask.data == 0).astype(np.int8)
+    for labels, mask in [((3, 1), _mask), ((1, 3), other_mask)]:
+        try:
+            main.incremental_meta_analysis(store_dir, *labels,
+                                   center_mean_dict={1: copy.deepcopy(center_mean_dict[1])},
+                                   center_std_dict={1: copy.deepcopy(center_std_dict[1])},
+                                   center_count_dict=center_count_dict, _mask=mask)
+            assert False
+        except ValueError:
+            pass
+    assert incremental.MetaAnalysisStore(store_dir).center_names == ['0']
+
+def test_incremental_one_center(tmp_path):
+    # first site of a consortium, and a store shrunk back to one site
+    from meta_analysis import engine
+    rng = np.random.default_rng(1)
+    effect_sizes = rng.normal(size=(5, 20000))
+    variances = rng.uniform(.01, 1, (5, 20000)) * 10. ** rng.integers(-3, 3, (5, 20000))
+    store = incremental.MetaAnalysisStore(str(tmp_path / 'store'))
+    store.set_volume((20000,), np.arange(20000), 'cohen_d', (1, 3))
+    store.add_center(0, effect_sizes[0], variances[0])
+    for model_type in ['random', 'fixed']:
+        assert np.allclose(store.caculate(model_type),
+                           engine.caculate(effect_sizes[:1], variances[:1], model_type))
+    for center in range(1, 5):
+        store.add_center(center, effect_sizes[center], variances[center])
+    for center in range(1, 5):
+        store.remove_center(center)
+    for model_type in ['random', 'fixed']:
+        assert np.allclose(store.caculate(model_type),
+                           engine.caculate(effect_sizes[:1], variances[:1], model_type))
@@ -0,0 +1,69 @@
+import copy
+import json
+
+import numpy as np
+from meta_analysis import instrument, main, mask, utils
+
+from test_utils import gen_niis
+
+def test_instrument(tmp_path):
+    center_dict = {}
+    for center in range(2):
+        center_dict[center] = {}
+        for label in [1, 3]:
+            file_dir = tmp_path / '{}_{}'.format(center, label)
+            file_dir.mkdir()
+            center_dict[center][label] = gen_niis(file_dir, n=4, seed=center*label)
+    _mask = mask.Mask(np.random.default_rng(0).integers(0, 4, (9, 8, 7)))
+    events = []
+    logs = []
+    with instrument.Instrument(callbacks=[events.append], log_interval=0,
+                               log=logs.append) as inst:
+        results = main.voxelwise_meta_analysis(1, 3, center_dict=copy.deepcopy(center_dict),
+                                               _mask=_mask, block_size=100, load_n_jobs=2)
+        main.region_volume_meta_analysis(copy.deepcopy(center_dict), 1, 3, _mask)
+    assert instrument.get_active() is None
+    expected = main.voxelwise_meta_analysis(1, 3, center_dict=copy.deepcopy(center_dict),
+                                            _mask=_mask)
+    assert np.array_equal(results, expected)
+
+    summary = inst.get_summary()
+    stages = summary['stages']
+    assert {'load', 'decode', 'reduce', 'prepare', 'caculate', 'write'} <= set(stages)
+    assert stages['load']['files'] == 32 and stages['decode']['files'] == 32
+    assert stages['caculate']['voxels'] == np.count_nonzero(_mask.data) + 3
+    assert stages['caculate']['voxels_per_second'] > 0
+    assert summary['progress'] == {'load': 1., 'caculate': 1.}
+    assert summary['total_time'] >= stages['prepare']['time']
+    assert summary['peak_rss'] > 0
+    assert any(event['event'] == 'progress' for event in events)
+    assert len(logs) == sum(event['event'] == 'progress' for event in events)
+
+    path = str(tmp_path / 'summary.json')
+    inst.dump(path)
+    with open(path) as f:
+        assert json.load(f)['stages']['load']['files'] == 32
+
+def test_instrument_reentrant_callback():
+    # callbacks are called without lock, get_summary() or progress() inside never deadlock
+    summaries = []
+    def callback(event):
+        summaries.append(inst.get_summary())
+        if event['event'] == 'stage' and event['stage'] == 'outer':
+            inst.progress('inner', 1, 1)
+    inst = instrument.Instrument(callbacks=[callback], log_interval=0, log=lambda s: None)
+    with inst:
+        with instrument.stage('outer', voxels=3):
+            pass
+    assert len(summaries) == 2
+    assert summaries[0]['stages']['outer']['voxels'] == 3
+    assert inst.get_summary()['progress'] == {'inner': 1.}
+
+def test_instrument_process_decode(tmp_path):
+    pathes = gen_niis(tmp_path, n=4, seed=0)
+    with instrument.Instrument() as inst:
+        msn_dict = utils.load_mean_std_n_dict({1: pathes}, n_jobs=2, backend='process')
+    assert inst.get_summary()['stages']['decode']['files'] == 4
+    mean, std, n = msn_dict[1]
+    expected = utils.load_mean_std_n(pathes)
+    assert n == 4 and np.allclose(mean, expected[0])
@@ -0,0 +1,54 @@
+import numpy as np
+from meta_analysis import mask
+
+def test_label_index():
+    rng = np.random.default_rng(0)
+    data = rng.integers(0, 8, (9, 8, 7))
+    data[data == 5] = 0
+    _mask = mask.Mask(data)
+    array = np.asfortranarray(rng.normal(size=data.shape))
+    labels = _mask.get_labels()
+    assert np.array_equal(labels, [1, 2, 3, 4, 6, 7])
+
+    volumes = _mask.get_all_masked_volume(array)
+    means = _mask.get_all_masked_mean(array)
+    for label in labels:
+        region = data == label
+        assert np.isclose(volumes[label], np.sum(array[region]))
+        assert np.isclose(_mask.get_masked_volume(array, label), np.sum(array[region]))
+        assert np.isclose(means[label], np.mean(array[region]))
+        assert _mask.get_masked_count(label) == np.sum(region)
+    # labels outside the index
+    assert np.isclose(_mask.get_masked_volume(array, 0), np.sum(array[data == 0]))
+    assert _mask.get_masked_count(5) == 0
+
+    # index is rebuilt when data changes
+    _mask.data = data * 2
+    assert np.array_equal(_mask.get_labels(), labels * 2)
+
+def test_flatten_mask(tmp_path):
+    import copy
+    from meta_analysis import main
+    from test_utils import gen_niis
+    center_dict = {}
+    for center in range(2):
+        center_dict[center] = {}
+        for label in [1, 3]:
+            file_dir = tmp_path / '{}_{}'.format(center, label)
+            file_dir.mkdir()
+            center_dict[center][label] = gen_niis(file_dir, n=4, seed=center*label+1)
+    data = np.random.default_rng(0).integers(0, 3, (9, 8, 7))
+    expected = main.voxelwise_meta_analysis(1, 3, center_dict=copy.deepcopy(center_dict),
+                                            _mask=mask.Mask(data))
+    # flatten mask of same size as volume, results are flatten too
+    flatten_mask = mask.Mask(data.flatten())
+    results = main.voxelwise_meta_analysis(1, 3, center_dict=copy.deepcopy(center_dict),
+                                           _mask=flatten_mask)
+    assert results.shape == (8, 504)
+    assert np.array_equal(results, np.reshape(expected, (8, 504)))
+    regions = main.region_volume_meta_analysis(copy.deepcopy(center_dict), 1, 3, flatten_mask)
+    expected_regions = main.region_volume_meta_analysis(copy.deepcopy(center_dict), 1, 3,
+                                                        mask.Mask(data))
+    assert regions.keys() == expected_regions.keys()
+    for label in regions:
+        assert np.array_equal(regions[label], expected_regions[label])
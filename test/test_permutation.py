@@ -0,0 +1,47 @@
+import copy
+
+import numpy as np
+from meta_analysis import engine, main, permutation
+
+from test_engine import gen_msn
+
+def test_sign_flip_z():
+    rng = np.random.default_rng(0)
+    effect_sizes = rng.normal(.3, .5, (6, 50))
+    variances = rng.uniform(.05, .2, (6, 50))
+    signs = permutation.gen_sign_flips(10, 6, seed=1)
+    for model_type in ['random', 'fixed']:
+        z = permutation.sign_flip_z(signs, effect_sizes, variances, model_type)
+        for sign, flip_z in zip(signs, z):
+            results = engine.caculate(effect_sizes * sign[:, None], variances, model_type)
+            assert np.allclose(flip_z, results[engine.RESULT_NAMES.index('z')])
+
+def test_label_permutation_z():
+    rng = np.random.default_rng(0)
+    datas = [rng.normal(size=(n, 30)) for n in (12, 15)]
+    labels_list = [np.arange(12) < 5, np.arange(15) < 9]
+    perms = permutation.gen_label_permutations(labels_list, 4, seed=1)
+    z = permutation.label_permutation_z(perms, datas)
+    for i in range(4):
+        m1, s1, n1, m2, s2, n2 = [], [], [], [], [], []
+        for perm, data in zip(perms, datas):
+            group1, group2 = data[perm[i]], data[~perm[i]]
+            m1.append(group1.mean(0)), s1.append(group1.std(0)), n1.append([len(group1)])
+            m2.append(group2.mean(0)), s2.append(group2.std(0)), n2.append([len(group2)])
+        effect_sizes, variances = engine.cohen_d(m1, s1, n1, m2, s2, n2)
+        results = engine.caculate(effect_sizes, variances)
+        assert np.allclose(z[i], results[engine.RESULT_NAMES.index('z')])
+
+def test_voxelwise_permutation_test():
+    center_mean_dict, center_std_dict, center_count_dict, _mask = gen_msn()
+    kwargs = {'center_mean_dict': center_mean_dict, 'center_std_dict': center_std_dict,
+              'center_count_dict': center_count_dict, '_mask': _mask}
+    results = main.voxelwise_meta_analysis(1, 3, **copy.deepcopy(kwargs))
+    permutation_results, null = main.voxelwise_permutation_test(
+            1, 3, n_perm=50, seed=0, **copy.deepcopy(kwargs))
+    parallel_results, parallel_null = main.voxelwise_permutation_test(
+            1, 3, n_perm=50, seed=0, n_jobs=2, perm_batch=20, **copy.deepcopy(kwargs))
+    assert np.allclose(permutation_results[0], results[engine.RESULT_NAMES.index('z')])
+    assert np.array_equal(null, parallel_null)
+    p_fwe = permutation_results[1][_mask.data != 0]
+    assert np.all((p_fwe >= 1 / 51) & (p_fwe <= 1))
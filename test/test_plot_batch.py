@@ -0,0 +1,39 @@
+import numpy as np
+from meta_analysis import data, model, plot
+
+def gen_models(n_models=5, seed=0):
+    rng = np.random.default_rng(seed)
+    models = {}
+    for i in range(n_models):
+        k = 3 + i % 2
+        names = ['center{}'.format(j) for j in range(k)]
+        m1, m2 = rng.normal(1, .5, k), rng.normal(.5, .5, k)
+        s1, s2 = rng.uniform(.5, 1.5, k), rng.uniform(.5, 1.5, k)
+        n1, n2 = rng.integers(10, 30, k), rng.integers(10, 30, k)
+        table = data.StudyTable.from_msn(names, m1, s1, n1, m2, s2, n2, 'cohen_d')
+        models['region{}'.format(i)] = model.RandomModel(table)
+    return models
+
+def test_export_forest_plots(tmp_path):
+    models = gen_models()
+    for n_jobs in [1, 2]:
+        output_dir = tmp_path / str(n_jobs)
+        pathes = plot.export_forest_plots(models, str(output_dir), formats=('png', 'svg', 'pdf'),
+                                          n_jobs=n_jobs)
+        assert list(pathes) == list(models)
+        for name, files in pathes.items():
+            assert [f.rsplit('.', 1)[1] for f in files] == ['png', 'svg', 'pdf']
+            for f in files:
+                assert (output_dir / f.rsplit('/', 1)[1]).stat().st_size > 0
+    # one template per count of studies
+    assert set(plot._templates) >= {(3, True), (4, True)}
+
+    template = plot.get_template(3)
+    template.draw(models['region0'])
+    assert len(template._whiskers.get_segments()) == 9
+    assert len(template._boxes.get_paths()) == 3
+    try:
+        template.draw(models['region1'])
+        assert False
+    except ValueError:
+        pass
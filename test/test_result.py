@@ -0,0 +1,44 @@
+import copy
+
+import nibabel as nib
+import numpy as np
+from meta_analysis import engine, main, result, utils
+
+from test_engine import gen_msn
+
+def test_masked_result(tmp_path):
+    center_mean_dict, center_std_dict, center_count_dict, _mask = gen_msn()
+    kwargs = dict(center_count_dict=center_count_dict, _mask=_mask)
+    results = main.voxelwise_meta_analysis(1, 3, center_mean_dict=copy.deepcopy(center_mean_dict),
+                    center_std_dict=copy.deepcopy(center_std_dict), **kwargs)
+    for n_jobs in [1, 2]:
+        masked_result = main.voxelwise_meta_analysis(1, 3,
+                            center_mean_dict=copy.deepcopy(center_mean_dict),
+                            center_std_dict=copy.deepcopy(center_std_dict), n_jobs=n_jobs,
+                            block_size=40, return_masked=True, **kwargs)
+        assert masked_result.data.shape == (8, np.count_nonzero(_mask.data))
+        assert np.array_equal(masked_result.to_dense(), results)
+        assert np.array_equal(np.asarray(masked_result), results)
+
+    z = masked_result.get('z')
+    assert np.array_equal(z, results[6][_mask.data != 0])
+    assert np.array_equal(masked_result.get_volume('p'), results[7])
+    out = np.empty(_mask.get_shape(), dtype=masked_result.data.dtype)
+    assert masked_result.get_volume('z', fill=np.nan, out=out) is out
+    assert np.array_equal(out[_mask.data != 0], z) and np.all(np.isnan(out[_mask.data == 0]))
+    selected = masked_result.select(('z', 'p'))
+    assert np.shares_memory(selected.data, masked_result.data)
+    assert np.array_equal(selected.to_dense(), results[[6, 7]])
+    for coordinate in [(0, 0, 0), (3, 2, 1), (5, 6, 4)]:
+        if _mask.data[coordinate]:
+            assert np.array_equal(masked_result.get_voxel(coordinate),
+                                  results[(slice(None),) + coordinate])
+        else:
+            assert np.all(np.isnan(masked_result.get_voxel(coordinate)))
+
+    dense_result = result.MaskedResult.from_dense(results, _mask, engine.RESULT_NAMES)
+    assert np.array_equal(dense_result.data, masked_result.data)
+
+    template_nii = nib.Nifti1Image(np.zeros(_mask.get_shape()), np.eye(4))
+    pathes = masked_result.to_niis(template_nii, str(tmp_path / 'results'))
+    assert np.allclose(utils.load_array(pathes[6]), results[6], rtol=1e-6)
@@ -0,0 +1,53 @@
+import copy
+
+import nibabel as nib
+import numpy as np
+from meta_analysis import engine, main, sink, utils
+
+from test_engine import gen_msn
+
+def test_nii_sink(tmp_path):
+    center_mean_dict, center_std_dict, center_count_dict, _mask = gen_msn()
+    affine = np.diag([2., 2., 2., 1.])
+    template_nii = nib.Nifti1Image(np.zeros(_mask.get_shape(), dtype=np.int16), affine)
+    results = main.voxelwise_meta_analysis(1, 3,
+                    center_mean_dict=copy.deepcopy(center_mean_dict),
+                    center_std_dict=copy.deepcopy(center_std_dict),
+                    center_count_dict=center_count_dict, _mask=_mask)
+    for split, n_jobs in [(False, 1), (True, 1), (False, 3)]:
+        path = str(tmp_path / '{}_{}'.format(split, n_jobs))
+        if not split:
+            path += '.nii'
+        with sink.NiiSink(path, engine.RESULT_NAMES, template_nii, split=split) as nii_sink:
+            returned = main.voxelwise_meta_analysis(1, 3,
+                            center_mean_dict=copy.deepcopy(center_mean_dict),
+                            center_std_dict=copy.deepcopy(center_std_dict),
+                            center_count_dict=center_count_dict, _mask=_mask,
+                            block_size=37, n_jobs=n_jobs, sink=nii_sink)
+            assert returned is nii_sink
+        for i, name in enumerate(engine.RESULT_NAMES):
+            if split:
+                nii = nib.load(nii_sink.pathes[i])
+                array = utils.load_array(nii_sink.pathes[i])
+            else:
+                nii = nib.load(path)
+                array = np.asarray(nii.dataobj)[..., i]
+            assert nii.get_data_dtype() == np.float32
+            assert np.allclose(nii.affine, affine)
+            assert np.allclose(array, results[i], rtol=1e-6, equal_nan=True)
+
+def test_nii_sink_extension(tmp_path):
+    template_nii = nib.Nifti1Image(np.zeros((5, 4, 3), dtype=np.int16), np.eye(4))
+    # comment extension makes header and extensions longer than 352 bytes
+    template_nii.header.extensions.append(
+        nib.nifti1.Nifti1Extension('comment', b'x' * 101))
+    path = str(tmp_path / 'results.nii')
+    values = np.arange(60, dtype=np.float64).reshape(1, 60)
+    with sink.NiiSink(path, ['es'], template_nii) as nii_sink:
+        nii_sink.write(values, np.arange(60))
+    nii = nib.load(path)
+    offset = nii.dataobj.offset
+    assert offset % 16 == 0 and offset >= 352 + 101
+    assert nii.header.extensions[0].get_content() == b'x' * 101
+    assert np.array_equal(np.asarray(nii.dataobj)[..., 0],
+                          np.reshape(values, (5, 4, 3)).astype(np.float32))
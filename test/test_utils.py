@@ -0,0 +1,61 @@
+import os
+
+import nibabel as nib
+import numpy as np
+from meta_analysis import utils
+
+def gen_niis(file_dir, n=7, shape=(9, 8, 7), extension='.nii', seed=0):
+    rng = np.random.default_rng(seed)
+    pathes = []
+    for i in range(n):
+        array = rng.normal(1, 2, shape).astype(np.float32)
+        array[0, 0, i % shape[2]] = np.nan
+        path = os.path.join(str(file_dir), 'sub{}{}'.format(i, extension))
+        nib.save(nib.Nifti1Image(array, np.eye(4)), path)
+        pathes.append(path)
+    return pathes
+
+def test_load_mean_std_n(tmp_path):
+    pathes = gen_niis(tmp_path)
+    mean, std, n = utils.cal_mean_std_n(utils.load_arrays(pathes))
+    stream_mean, stream_std, stream_n = utils.load_mean_std_n(pathes)
+    assert n == stream_n
+    assert stream_mean.dtype == mean.dtype and stream_std.dtype == std.dtype
+    assert np.allclose(mean, stream_mean, atol=1e-6)
+    assert np.allclose(std, stream_std, atol=1e-6)
+    # empty group gives nan as before, not an error
+    mean, std, n = utils.load_mean_std_n([])
+    assert np.isnan(mean) and np.isnan(std) and n == 0
+    assert np.isnan(utils.load_mean_std_n_dict({1: []}, n_jobs=2)[1][0])
+
+def test_load_masked_array(tmp_path):
+    rng = np.random.default_rng(1)
+    mask_data = rng.random((9, 8, 7)) > .5
+    mask_index = utils.get_mask_index(mask_data)
+    for extension in ['.nii', '.nii.gz']:
+        for path in gen_niis(tmp_path, n=2, extension=extension):
+            array = utils.load_array(path)
+            masked_array = utils.load_masked_array(path, mask_index)
+            assert masked_array.ndim == 1
+            assert np.array_equal(masked_array, array[mask_data])
+            assert np.array_equal(masked_array,
+                                  array.flatten()[np.flatnonzero(mask_data)])
+            assert np.array_equal(utils.load_masked_array(path, mask_data.flatten()),
+                                  masked_array)
+
+def test_load_mean_std_n_dict(tmp_path):
+    pathes_dict = {}
+    for i, extension in enumerate(['.nii', '.nii.gz']):
+        file_dir = tmp_path / str(i)
+        file_dir.mkdir()
+        pathes_dict[i] = gen_niis(file_dir, n=5, extension=extension, seed=i)
+    mask_index = utils.get_mask_index(np.random.default_rng(2).random((9, 8, 7)) > .5)
+    for index in [None, mask_index]:
+        for backend in ['thread', 'process']:
+            msn_dict = utils.load_mean_std_n_dict(pathes_dict, mask_index=index,
+                                                  n_jobs=2, backend=backend)
+            for key, pathes in pathes_dict.items():
+                mean, std, n = utils.load_mean_std_n(pathes, mask_index=index)
+                assert np.array_equal(msn_dict[key][0], mean)
+                assert np.array_equal(msn_dict[key][1], std)
+                assert msn_dict[key][2] == n